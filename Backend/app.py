@@ -1,22 +1,48 @@
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, request, jsonify, send_file, Response
 from flask_cors import CORS
+import io
 import os
-from model.extract_text import extract_text
-import pytesseract
+import json
+import cProfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from model.extract_text import extract_text_from_bytes, extract_text_with_layout, iter_text_pages
 from model.ner_extractor import extract_all
-from model.excel_manager import append_lab_results_to_excel, get_excel_stats, EXCEL_FILE_PATH
+from model.report_splitter import extract_reports
+from model.result_cache import ResultCache, hash_bytes
+from model.job_queue import JobQueue, QueueFullError
+from model.metrics import metrics, timed
+from model.excel_manager import (
+    append_lab_results_to_excel, append_lab_results_batch, get_excel_stats, rebuild_excel_stats, export_excel,
+    flag_lab_tests, has_results, initialize_excel
+)
+from model.columnar_export import COLUMNAR_FORMATS, stream_results
+from model.results_store import DEFAULT_PAGE_SIZE, query_results, parse_date_bound, reflag_results
 
-# If Tesseract is not in PATH (Windows), uncomment and set the path
-# pytesseract.pytesseract.tesseract_cmd = r"C:\Program Files\Tesseract-OCR\tesseract.exe"
+# If Tesseract is not in PATH (Windows), set TESSERACT_CMD, e.g.
+# TESSERACT_CMD=C:\Program Files\Tesseract-OCR\tesseract.exe
 
 app = Flask(__name__)
 CORS(app)  # Allow all origins
 
-# Upload folder
-UPLOAD_FOLDER = "uploads"
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-app.config["UPLOAD_FOLDER"] = UPLOAD_FOLDER
+# Uploads are processed in memory; only PDF OCR spills to a temp file, which is deleted afterwards
 app.config["MAX_CONTENT_LENGTH"] = 16 * 1024 * 1024  # 16MB max file size
+# Re-append rows when an identical file is analyzed again (override with ?reappend=true)
+app.config["REAPPEND_DUPLICATES"] = False
+# Files extracted concurrently by /analyze-batch
+app.config["BATCH_WORKERS"] = int(os.environ.get("BATCH_WORKERS", 4))
+# Directory for cProfile dumps of /analyze?profile=true (profiling disabled if unset)
+app.config["PROFILE_DIR"] = os.environ.get("PROFILE_DIR")
+
+# Extraction results keyed by SHA-256 of the uploaded bytes
+result_cache = ResultCache()
+
+# Background workers for POST /analyze?async=true
+job_queue = JobQueue()
+
+
+def is_truthy(value):
+    return str(value).lower() in ("1", "true", "yes")
 
 # Health check route
 @app.route("/health", methods=["GET"])
@@ -38,20 +64,25 @@ def upload_file():
     if file.filename == "":
         return jsonify({"error": "Empty filename"}), 400
 
-    # Save file
-    file_path = os.path.join(app.config["UPLOAD_FOLDER"], file.filename)
-    file.save(file_path)
+    data = file.read()
+    file_hash = hash_bytes(data)
+    cached = result_cache.get(file_hash)
 
-    # Extract text using updated extract_text function
-    try:
-        extracted_text = extract_text(file_path)
-    except Exception as e:
-        return jsonify({"error": f"Text extraction failed: {str(e)}"}), 500
+    if cached and "text" in cached:
+        extracted_text = cached["text"]
+    else:
+        # Extract text straight from the uploaded bytes
+        try:
+            extracted_text = extract_text_from_bytes(data, file.filename)
+        except Exception as e:
+            return jsonify({"error": f"Text extraction failed: {str(e)}"}), 500
+        result_cache.update(file_hash, text=extracted_text)
 
     # Return JSON with extracted text
     response = {
         "filename": file.filename,
-        "extracted_text": extracted_text if extracted_text else "No text extracted"
+        "extracted_text": extracted_text if extracted_text else "No text extracted",
+        "cache": {"hit": cached is not None and "text" in cached, "sha256": file_hash}
     }
 
     return jsonify(response), 200
@@ -66,50 +97,330 @@ def analyze_file():
     if file.filename == "":
         return jsonify({"error": "Empty filename"}), 400
 
-    file_path = os.path.join(app.config["UPLOAD_FOLDER"], file.filename)
-    file.save(file_path)
+    data = file.read()
+    reappend = is_truthy(request.args.get("reappend", app.config["REAPPEND_DUPLICATES"]))
 
-    try:
-        # Extract raw text
-        text = extract_text(file_path)
-        
-        if not text or len(text.strip()) < 50:
-            return jsonify({"error": "Insufficient text extracted from document"}), 400
+    # Async mode: queue the analysis and let the client poll /jobs/<id>
+    if is_truthy(request.args.get("async", request.form.get("async", False))):
+        try:
+            job_id = job_queue.submit(run_analysis, file.filename, data, reappend)
+        except QueueFullError as e:
+            return jsonify({"error": str(e)}), 429
+        return jsonify({
+            "job_id": job_id,
+            "status": "queued",
+            "status_url": f"/jobs/{job_id}"
+        }), 202
 
-        # NER extraction with standardized format
-        result = extract_all(text)
-        
-        # Append lab results to Excel file
-        rows_added = append_lab_results_to_excel(result)
+    if app.config["PROFILE_DIR"] and is_truthy(request.args.get("profile", False)):
+        result, status_code = profile_analysis(file.filename, data, reappend)
+    else:
+        result, status_code = run_analysis(file.filename, data, reappend)
+    return jsonify(result), status_code
+
+
+def profile_analysis(filename, data, reappend=False):
+    """Run one analysis under cProfile and dump the stats to PROFILE_DIR"""
+    os.makedirs(app.config["PROFILE_DIR"], exist_ok=True)
+    profile_path = os.path.join(
+        app.config["PROFILE_DIR"],
+        f"analyze-{time.strftime('%Y%m%d-%H%M%S')}-{os.path.basename(filename)}.prof"
+    )
+    profiler = cProfile.Profile()
+    result, status_code = profiler.runcall(run_analysis, filename, data, reappend)
+    profiler.dump_stats(profile_path)
+    result["profile_path"] = profile_path
+    return result, status_code
+
+
+def run_analysis(filename, data, reappend=False):
+    """
+    Full pipeline for one uploaded file: text extraction, NER and Excel append
+
+    Returns:
+        Tuple of (response dict, HTTP status code)
+    """
+    file_type = os.path.splitext(filename)[1].lower().lstrip(".") or "unknown"
+    with timed("analyze_total", file_type=file_type):
+        return _run_analysis(filename, data, reappend, file_type)
+
+
+def _run_analysis(filename, data, reappend, file_type):
+    metrics.inc("requests_total", file_type=file_type)
+
+    try:
+        result, cached, file_hash = extract_upload(filename, data, file_type)
+        if result is None:
+            return {"error": "Insufficient text extracted from document"}, 400
         
-        # Add Excel info to response
-        result['excel_export'] = {
-            'success': rows_added > 0,
-            'rows_added': rows_added,
-            'message': f"Added {rows_added} lab test records to Excel file"
-        }
+        # Append lab results to Excel file, unless this upload was already stored
+        duplicate = "rows_added" in cached
+        if duplicate and not reappend:
+            rows_added = 0
+        else:
+            rows_added = append_lab_results_to_excel(result)
+            result_cache.update(file_hash, rows_added=rows_added)
+        # Report the same range-based statuses the store keeps
+        flag_lab_tests(result)
+        add_export_info(result, rows_added, duplicate, reappend, cached, file_hash)
         
         # Get updated stats
         excel_stats = get_excel_stats()
         result['excel_stats'] = excel_stats
 
-        return jsonify(result), 200
+        return result, 200
         
     except Exception as e:
-        return jsonify({"error": f"Analysis failed: {str(e)}"}), 500
+        return {"error": f"Analysis failed: {str(e)}"}, 500
+
+
+def extract_upload(filename, data, file_type):
+    """
+    Text extraction and NER for one upload, reusing cached work for known files
+
+    Returns:
+        Tuple of (extract_all result or None if too little text, cache entry, SHA-256)
+    """
+    file_hash = hash_bytes(data)
+    cached = result_cache.get(file_hash) or {}
+
+    # Extract raw text (skipped when this exact file was seen before)
+    layout = None
+    if "text" in cached:
+        text = cached["text"]
+    else:
+        with timed("extract_text", file_type=file_type):
+            text, layout = extract_text_with_layout(data, filename)
+        result_cache.update(file_hash, text=text)
+    
+    if not text or len(text.strip()) < 50:
+        return None, cached, file_hash
+
+    # NER extraction with standardized format
+    if "result" in cached:
+        result = cached["result"]
+    else:
+        with timed("extract_all", file_type=file_type):
+            result = extract_all(text, layout=layout)
+        # A degraded (timed out) result is not kept, so a retry can complete it
+        if not result["report_metadata"].get("degraded"):
+            result_cache.update(file_hash, result=result)
+    return result, cached, file_hash
+
+
+def add_export_info(result, rows_added, duplicate, reappend, cached, file_hash):
+    """Add the Excel export and cache details to an analysis response"""
+    if duplicate and not reappend:
+        message = "Duplicate upload: lab test records already in Excel file, skipped"
+    else:
+        message = f"Added {rows_added} lab test records to Excel file"
+
+    result['excel_export'] = {
+        'success': rows_added > 0,
+        'rows_added': rows_added,
+        'duplicate': duplicate,
+        'duplicate_skipped': duplicate and not reappend,
+        'message': message
+    }
+    result['cache'] = {
+        'hit': "result" in cached,
+        'sha256': file_hash
+    }
+
+# Batch analyze route - many files, one store append
+@app.route("/analyze-batch", methods=["POST"])
+def analyze_batch():
+    """
+    Analyze several files (multipart field "files") in one request
+
+    Files are extracted concurrently, all their rows are committed in a single
+    append and statistics are computed once. Each file gets its own entry in
+    "results"; one failing file does not fail the others.
+    """
+    files = [f for f in request.files.getlist("files") + request.files.getlist("file") if f.filename]
+    if not files:
+        return jsonify({"error": "No files uploaded"}), 400
+
+    uploads = [(f.filename, f.read()) for f in files]
+    reappend = is_truthy(request.args.get("reappend", app.config["REAPPEND_DUPLICATES"]))
+
+    def extract_one(upload):
+        filename, data = upload
+        file_type = os.path.splitext(filename)[1].lower().lstrip(".") or "unknown"
+        metrics.inc("requests_total", file_type=file_type)
+        try:
+            return extract_upload(filename, data, file_type), None
+        except Exception as e:
+            return None, f"Analysis failed: {str(e)}"
+
+    workers = max(1, min(app.config["BATCH_WORKERS"], len(uploads)))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        extracted = list(pool.map(extract_one, uploads))
+
+    # Decide which reports to append (duplicates within the batch count too)
+    entries = []
+    seen_hashes = set()
+    to_append = []
+    for (filename, _), (extraction, error) in zip(uploads, extracted):
+        entry = {"filename": filename}
+        entries.append(entry)
+        if error:
+            entry.update(status="error", http_status=500, error=error)
+            continue
+        result, cached, file_hash = extraction
+        if result is None:
+            entry.update(status="error", http_status=400, error="Insufficient text extracted from document")
+            continue
+        duplicate = "rows_added" in cached or file_hash in seen_hashes
+        seen_hashes.add(file_hash)
+        entry.update(status="ok", http_status=200, result=result)
+        entry["_export"] = (duplicate, cached, file_hash)
+        if not duplicate or reappend:
+            to_append.append(entry)
+
+    try:
+        rows_per_report = append_lab_results_batch([entry["result"] for entry in to_append])
+    except Exception as e:
+        rows_per_report = None
+        append_error = f"Excel append failed: {str(e)}"
+
+    appended = {id(entry): rows for entry, rows in zip(to_append, rows_per_report or [])}
+    for entry in entries:
+        if "_export" not in entry:
+            continue
+        duplicate, cached, file_hash = entry.pop("_export")
+        if rows_per_report is None and not (duplicate and not reappend):
+            entry.update(status="error", http_status=500, error=append_error)
+            del entry["result"]
+            continue
+        rows_added = appended.get(id(entry), 0)
+        if id(entry) in appended:
+            result_cache.update(file_hash, rows_added=rows_added)
+        flag_lab_tests(entry["result"])
+        add_export_info(entry["result"], rows_added, duplicate, reappend, cached, file_hash)
+
+    succeeded = sum(1 for entry in entries if entry["status"] == "ok")
+    return jsonify({
+        "total_files": len(entries),
+        "succeeded": succeeded,
+        "failed": len(entries) - succeeded,
+        "rows_added": sum(rows_per_report or []),
+        "results": entries,
+        "excel_stats": get_excel_stats()
+    }), 200 if succeeded else 400
+
+# Batched file route - one upload holding many patients' reports
+@app.route("/analyze-reports", methods=["POST"])
+def analyze_reports():
+    """
+    Split a batched file (e.g. a lab's PDF of many patients) and analyze each report
+
+    Pages are read one at a time; every patient's report is extracted and
+    its rows appended as soon as its last page has been read. The response
+    is streamed as NDJSON: one line per report (index, page range, rows
+    added and the extraction result), then a summary line with "done": true.
+    """
+    if "file" not in request.files:
+        return jsonify({"error": "No file uploaded"}), 400
+
+    file = request.files["file"]
+    if file.filename == "":
+        return jsonify({"error": "Empty filename"}), 400
+
+    filename, data = file.filename, file.read()
+    reappend = is_truthy(request.args.get("reappend", app.config["REAPPEND_DUPLICATES"]))
+    file_type = os.path.splitext(filename)[1].lower().lstrip(".") or "unknown"
+    file_hash = hash_bytes(data)
+    cached = result_cache.get(file_hash) or {}
+    duplicate = "rows_added" in cached
+    append = not duplicate or reappend
+
+    def generate():
+        metrics.inc("requests_total", file_type=file_type)
+        reports = rows_added = 0
+        error = None
+        try:
+            for report, result in extract_reports(iter_text_pages(io.BytesIO(data), filename)):
+                report_rows = append_lab_results_to_excel(result) if append else 0
+                flag_lab_tests(result)
+                reports += 1
+                rows_added += report_rows
+                yield json.dumps({
+                    "report_index": result["report_metadata"]["report_index"],
+                    "pages": result["report_metadata"]["pages"],
+                    "rows_added": report_rows,
+                    "result": result
+                }) + "\n"
+        except Exception as e:
+            error = f"Analysis failed: {str(e)}"
+        if error is None and not reports:
+            error = "Insufficient text extracted from document"
+        if error is None and append:
+            result_cache.update(file_hash, rows_added=rows_added)
+
+        summary = {
+            "done": True,
+            "filename": filename,
+            "reports": reports,
+            "rows_added": rows_added,
+            "duplicate": duplicate,
+            "duplicate_skipped": duplicate and not reappend,
+            "cache": {"sha256": file_hash},
+            "excel_stats": get_excel_stats()
+        }
+        if error:
+            summary["error"] = error
+        yield json.dumps(summary) + "\n"
+
+    return Response(generate(), mimetype="application/x-ndjson")
+
+# Poll an async analysis job
+@app.route("/jobs/<job_id>", methods=["GET"])
+def job_status(job_id):
+    """
+    Status of a job queued with POST /analyze?async=true
+    """
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+
+    response = {
+        "job_id": job["id"],
+        "status": job["status"],
+        "submitted_at": job["submitted_at"],
+        "started_at": job["started_at"],
+        "finished_at": job["finished_at"]
+    }
+    if job["status"] == "done":
+        result, status_code = job["result"]
+        response["http_status"] = status_code
+        response["result"] = result
+    elif job["status"] == "failed":
+        response["error"] = job["error"]
+    return jsonify(response), 200
+
+# Prometheus metrics
+@app.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    """
+    Pipeline stage timings (p50/p95/p99) and counters in Prometheus text format
+    """
+    return Response(metrics.render_prometheus(), mimetype="text/plain; version=0.0.4")
 
 # Download Excel file
 @app.route("/download-excel", methods=["GET"])
 def download_excel():
     """
     Download the consolidated Excel file containing all lab results
+    (built from the results store on request)
     """
-    if not os.path.exists(EXCEL_FILE_PATH):
+    if not has_results():
         return jsonify({"error": "Excel file not found. Process at least one report first."}), 404
     
     try:
+        excel_path = export_excel()
         return send_file(
-            EXCEL_FILE_PATH,
+            os.path.abspath(excel_path),
             mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
             as_attachment=True,
             download_name='lab_results.xlsx'
@@ -117,6 +428,91 @@ def download_excel():
     except Exception as e:
         return jsonify({"error": f"Download failed: {str(e)}"}), 500
 
+# Download the results as Parquet or Arrow
+@app.route("/download-results", methods=["GET"])
+def download_results():
+    """
+    Stream the results store as typed Parquet (default) or Arrow IPC
+
+    Query parameters:
+        format: parquet or arrow
+        min_id, max_id: Inclusive Row_Id range
+        from, to: ISO dates bounding date_column (default Collection_Date)
+    """
+    if not has_results():
+        return jsonify({"error": "No results found. Process at least one report first."}), 404
+
+    fmt = request.args.get("format", "parquet").lower()
+    try:
+        min_id = request.args.get("min_id", type=int)
+        max_id = request.args.get("max_id", type=int)
+        chunks = stream_results(
+            fmt,
+            min_id=min_id,
+            max_id=max_id,
+            date_column=request.args.get("date_column", "Collection_Date"),
+            date_from=parse_date_bound(request.args.get("from")),
+            date_to=parse_date_bound(request.args.get("to"), end=True)
+        )
+    except ImportError as e:
+        return jsonify({"error": str(e)}), 501
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    extension, mimetype = COLUMNAR_FORMATS[fmt]
+    return Response(
+        chunks,
+        mimetype=mimetype,
+        headers={"Content-Disposition": f"attachment; filename=lab_results{extension}"}
+    )
+
+# Query stored results
+@app.route("/results", methods=["GET"])
+def results_query():
+    """
+    Stored lab results filtered server-side, one page at a time
+
+    Query parameters:
+        uhid, patient, test: Exact matches (patient and test ignore case)
+        from, to: ISO dates bounding Collection_Date
+        limit: Page size (default 100, max 1000)
+        cursor: next_cursor from the previous page
+    """
+    if not has_results():
+        return jsonify({"results": [], "count": 0, "next_cursor": None}), 200
+
+    try:
+        initialize_excel()
+        page = query_results(
+            uhid=request.args.get("uhid"),
+            patient_name=request.args.get("patient"),
+            test_name=request.args.get("test"),
+            date_from=parse_date_bound(request.args.get("from")),
+            date_to=parse_date_bound(request.args.get("to"), end=True),
+            limit=request.args.get("limit", DEFAULT_PAGE_SIZE, type=int),
+            cursor=request.args.get("cursor")
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    page["count"] = len(page["results"])
+    return jsonify(page), 200
+
+# Re-flag stored results
+@app.route("/results/reflag", methods=["POST"])
+def reflag_stored_results():
+    """
+    Re-run value normalization and range-based status flagging over every stored row
+    """
+    if not has_results():
+        return jsonify({"error": "No results found. Process at least one report first."}), 404
+
+    try:
+        initialize_excel()
+        return jsonify(reflag_results()), 200
+    except Exception as e:
+        return jsonify({"error": f"Re-flag failed: {str(e)}"}), 500
+
 # Get Excel statistics
 @app.route("/excel-stats", methods=["GET"])
 def excel_statistics():
@@ -126,5 +522,19 @@ def excel_statistics():
     stats = get_excel_stats()
     return jsonify(stats), 200
 
+# Rebuild statistics from the stored rows
+@app.route("/excel-stats/rebuild", methods=["POST"])
+def rebuild_excel_statistics():
+    """
+    Recompute the running statistics counters from the results store
+    """
+    if not has_results():
+        return jsonify({"error": "Excel file not found. Process at least one report first."}), 404
+
+    try:
+        return jsonify(rebuild_excel_stats()), 200
+    except Exception as e:
+        return jsonify({"error": f"Rebuild failed: {str(e)}"}), 500
+
 if __name__ == "__main__":
     app.run(debug=True, host="0.0.0.0", port=5000)
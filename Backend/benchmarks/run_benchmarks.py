@@ -0,0 +1,511 @@
+"""
+Benchmarks for the extraction and export hot paths
+
+Run from the Backend folder:
+    python -m benchmarks.run_benchmarks [--quick] [--output results.json] [--compare previous.json]
+
+Sections:
+    extraction  extract_all and each sub-extractor on synthetic LFT/CBC text of several sizes
+    store       append_lab_results_to_excel, query_results, reflag_results and export_excel
+                with 1k/10k/100k existing rows,
+                plus the Parquet export and reading both files back (Parquet needs pyarrow)
+    docx        streaming DOCX extraction against python-docx (if installed): time,
+                peak traced memory and lab tests found in tables
+    redos       worst-case latency of every ner_extractor pattern and extractor on
+                adversarial text at two sizes; a 4x larger input taking much more
+                than 4x longer means a pattern backtracks superlinearly
+    startup     cold import time, peak RSS and heavy modules loaded by `import app`
+    ocr         image preprocessing, plus raw / preprocessed / layout-aware tesseract
+                timing and extraction accuracy on the sample images in uploads/
+                (OCR needs tesseract)
+
+Results are written as JSON so two runs can be compared with --compare.
+"""
+import argparse
+import glob
+import io
+import json
+import os
+import platform
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+from benchmarks import synthetic
+from model import ner_extractor
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SAMPLE_IMAGES = sorted(
+    glob.glob(os.path.join(BACKEND_DIR, "uploads", "*.png"))
+    + glob.glob(os.path.join(BACKEND_DIR, "uploads", "*.jpg"))
+)
+
+# Third-party modules that should only load when a request needs them
+HEAVY_MODULES = ["pandas", "numpy", "openpyxl", "PIL", "pytesseract", "pdf2image", "PyPDF2", "docx"]
+
+# Run in a fresh interpreter so nothing is already imported
+STARTUP_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import app
+elapsed = time.perf_counter() - start
+try:
+    import resource
+    rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        rss_kb //= 1024
+except ImportError:
+    rss_kb = None
+print(json.dumps({"seconds": elapsed, "max_rss_kb": rss_kb,
+                  "loaded": [m for m in %r if m in sys.modules]}))
+""" % (HEAVY_MODULES,)
+
+TEXT_SIZES = [2_000, 20_000, 200_000]
+EXISTING_ROWS = [1_000, 10_000, 100_000]
+DOCX_REPORTS = [10, 100, 1_000]
+# Patients per synthetic batched PDF
+BATCH_REPORTS = [20, 200]
+# Adversarial text sizes; the second is 4x the first, so linear work grows ~4x
+REDOS_SIZES = [4_000, 16_000]
+# Growth over a 4x larger input beyond which a target counts as superlinear
+REDOS_MAX_GROWTH = 8
+SUB_EXTRACTORS = [
+    "detect_report_type",
+    "segment_regions",
+    "extract_patient_info",
+    "extract_order_info",
+    "extract_lab_tests_universal",
+    "extract_specific_tests_comprehensive",
+    "extract_diagnoses",
+    "extract_medications",
+    "extract_clinical_interpretation",
+]
+
+
+def measure(func, *args, repeat=5, **kwargs):
+    """Run func repeat times and summarize wall-clock seconds"""
+    timings = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        timings.append(time.perf_counter() - start)
+    return {
+        'min': min(timings),
+        'median': statistics.median(timings),
+        'mean': statistics.mean(timings),
+        'repeat': repeat,
+    }, result
+
+
+@contextmanager
+def scratch_directory():
+    """Run store benchmarks in a temporary working directory"""
+    previous = os.getcwd()
+    path = tempfile.mkdtemp(prefix="medextract-bench-")
+    os.chdir(path)
+    try:
+        yield path
+    finally:
+        os.chdir(previous)
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def bench_startup(repeat):
+    """Cold-start cost of importing the Flask app, one fresh interpreter per run"""
+    runs = []
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, "-c", STARTUP_SCRIPT], cwd=BACKEND_DIR,
+            capture_output=True, text=True, check=True
+        ).stdout
+        runs.append(json.loads(output.strip().splitlines()[-1]))
+
+    timings = [run['seconds'] for run in runs]
+    result = {
+        'import_app': {
+            'min': min(timings),
+            'median': statistics.median(timings),
+            'mean': statistics.mean(timings),
+            'repeat': repeat,
+        },
+        'max_rss_kb': runs[-1]['max_rss_kb'],
+        'heavy_modules_loaded': runs[-1]['loaded'],
+    }
+    print(f"  import app: median {result['import_app']['median'] * 1000:.0f} ms, "
+          f"peak RSS {result['max_rss_kb']} KB, heavy modules: {', '.join(result['heavy_modules_loaded']) or 'none'}")
+    return result
+
+
+def bench_extraction(sizes, repeat):
+    results = []
+    for size in sizes:
+        text = synthetic.report_of_size(size)
+        timing, output = measure(ner_extractor.extract_all, text, repeat=repeat)
+        entry = {
+            'chars': len(text),
+            'extract_all': timing,
+            'lab_tests_found': len(output['lab_tests']),
+            'sub_extractors': {}
+        }
+        for name in SUB_EXTRACTORS:
+            entry['sub_extractors'][name], _ = measure(getattr(ner_extractor, name), text, repeat=repeat)
+        results.append(entry)
+        print(f"  extraction {len(text):>8} chars: extract_all median {timing['median'] * 1000:.2f} ms")
+    return results
+
+
+def bench_store(existing_rows, repeat, tests_per_report=10):
+    # Imported here so the benchmark works against whatever store module is current
+    from model.excel_manager import append_lab_results_to_excel, export_excel, initialize_excel, build_excel_rows
+    from model.results_store import append_rows, query_results, reflag_results
+
+    results = []
+    for existing in existing_rows:
+        with scratch_directory():
+            initialize_excel()
+            seed_rows = []
+            for index in range(existing // tests_per_report):
+                seed_rows.extend(build_excel_rows(synthetic.extracted_report(index, tests=tests_per_report)))
+            append_rows(seed_rows)
+
+            reports = iter(synthetic.extracted_report(existing + index) for index in range(repeat))
+            append_timing, _ = measure(lambda: append_lab_results_to_excel(next(reports)), repeat=repeat)
+            sample = seed_rows[len(seed_rows) // 2] if seed_rows else {}
+            query_timing, _ = measure(
+                query_results, uhid=sample.get('UHID'), test_name=sample.get('Test_Name'), repeat=repeat
+            )
+            reflag_timing, _ = measure(reflag_results, repeat=1)
+            export_timing, _ = measure(export_excel, repeat=1)
+            file_size = os.path.getsize("lab_results.xlsx")
+            result = {
+                'existing_rows': existing,
+                'append_report': append_timing,
+                'query_uhid_test': query_timing,
+                'reflag': reflag_timing,
+                'export_excel': export_timing,
+                'xlsx_bytes': file_size
+            }
+            print(f"  store {existing:>7} rows: append median {append_timing['median'] * 1000:.2f} ms, "
+                  f"query median {query_timing['median'] * 1000:.2f} ms, "
+                  f"reflag {reflag_timing['median']:.2f} s, "
+                  f"export {export_timing['median']:.2f} s")
+            result.update(bench_columnar(repeat))
+        results.append(result)
+    return results
+
+
+def bench_columnar(repeat):
+    """Parquet export and read-back against reading the xlsx (in the current store directory)"""
+    from model.columnar_export import export_columnar
+    from openpyxl import load_workbook
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        print("  ⚠ pyarrow not installed, skipping Parquet export")
+        return {}
+
+    def read_xlsx():
+        wb = load_workbook("lab_results.xlsx", read_only=True)
+        rows = sum(1 for _ in wb.active.iter_rows(min_row=2, values_only=True))
+        wb.close()
+        return rows
+
+    export_timing, _ = measure(export_columnar, "lab_results.parquet", repeat=1)
+    read_parquet_timing, _ = measure(pq.read_table, "lab_results.parquet", repeat=repeat)
+    read_xlsx_timing, _ = measure(read_xlsx, repeat=1)
+    file_size = os.path.getsize("lab_results.parquet")
+    print(f"    parquet: export {export_timing['median']:.2f} s, {file_size / 1024:.0f} KiB, "
+          f"read {read_parquet_timing['median'] * 1000:.1f} ms (xlsx read {read_xlsx_timing['median']:.2f} s)")
+    return {
+        'export_parquet': export_timing,
+        'parquet_bytes': file_size,
+        'read_parquet': read_parquet_timing,
+        'read_xlsx': read_xlsx_timing
+    }
+
+
+def ocr_accuracy(text, layout=None):
+    """How much of a report the NER pipeline recovers from OCR text"""
+    result = ner_extractor.extract_all(text, layout=layout)
+    patient = result['patient_information']
+    return {
+        'chars': len(text),
+        'lab_tests_found': len(result['lab_tests']),
+        'lab_tests_with_range': sum(1 for test in result['lab_tests'] if test.get('reference_range')),
+        'patient_fields_found': sum(1 for value in patient.values() if value not in (None, '', 'N/A')),
+    }
+
+
+def bench_ocr(images, repeat):
+    from PIL import Image
+    from model.extract_text import extract_layout_from_image, ocr_image
+    from model.ocr_preprocess import preprocess_for_ocr
+    import pytesseract
+
+    try:
+        pytesseract.get_tesseract_version()
+        tesseract_error = None
+    except Exception as e:
+        tesseract_error = str(e)
+        print(f"  tesseract unavailable, timing preprocessing only: {e}")
+
+    results = []
+    for image_path in images:
+        name = os.path.basename(image_path)
+        img = Image.open(image_path)
+        img.load()
+        preprocess_timing, processed = measure(preprocess_for_ocr, img, repeat=repeat)
+        entry = {
+            'file': name,
+            'size': list(img.size),
+            'preprocessed_size': list(processed.size),
+            'preprocess': preprocess_timing
+        }
+        print(f"  preprocess {name}: {img.size[0]}x{img.size[1]} -> {processed.size[0]}x{processed.size[1]} "
+              f"in {preprocess_timing['median'] * 1000:.0f} ms")
+
+        if tesseract_error is None:
+            for mode, kwargs in (('raw', {'preprocess': False, 'config': ''}), ('preprocessed', {})):
+                timing, text = measure(ocr_image, img, repeat=repeat, **kwargs)
+                entry[mode] = {'ocr': timing, **ocr_accuracy(text)}
+                print(f"  ocr {name} {mode}: median {timing['median']:.2f} s, "
+                      f"{entry[mode]['lab_tests_found']} lab tests, "
+                      f"{entry[mode]['patient_fields_found']} patient fields")
+            timing, layout = measure(extract_layout_from_image, image_path, repeat=repeat)
+            entry['layout'] = {'ocr': timing, **ocr_accuracy(layout.text, layout)}
+            print(f"  ocr {name} layout: median {timing['median']:.2f} s, "
+                  f"{entry['layout']['lab_tests_found']} lab tests")
+        results.append(entry)
+
+    return {'tesseract': tesseract_error or 'available', 'images': results}
+
+
+def peak_memory(func, *args):
+    """
+    Peak memory traced while running func once, in bytes
+
+    tracemalloc only sees Python allocations, so memory held by C libraries
+    (e.g. lxml trees behind python-docx) is not counted.
+    """
+    tracemalloc.start()
+    try:
+        func(*args)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def bench_docx(report_counts, repeat):
+    from model.extract_text import extract_from_docx
+    from model.ner_extractor import extract_lab_tests_universal
+
+    try:
+        from docx import Document
+
+        def python_docx(source):
+            return "\n".join(p.text for p in Document(source).paragraphs)
+    except ImportError:
+        python_docx = None
+        print("  python-docx not installed, timing the streaming extractor only")
+
+    results = []
+    for reports in report_counts:
+        data, table_rows = synthetic.docx_report(reports)
+        entry = {'reports': reports, 'docx_bytes': len(data), 'table_rows': table_rows}
+        extractors = [('streaming', extract_from_docx)]
+        if python_docx:
+            extractors.append(('python_docx', python_docx))
+        for name, extractor in extractors:
+            timing, text = measure(lambda: extractor(io.BytesIO(data)), repeat=repeat)
+            entry[name] = {
+                'extract': timing,
+                'peak_bytes': peak_memory(lambda: extractor(io.BytesIO(data))),
+                'lab_tests_found': len(extract_lab_tests_universal(text)),
+            }
+            print(f"  docx {reports:>5} reports {name}: median {timing['median'] * 1000:.1f} ms, "
+                  f"peak {entry[name]['peak_bytes'] / 1e6:.1f} MB, "
+                  f"{entry[name]['lab_tests_found']} lab tests")
+        results.append(entry)
+    return results
+
+
+def bench_split(report_counts, repeat):
+    """
+    Batched multi-patient PDFs: whole-file extraction vs page streaming with report splitting
+
+    The whole-file path is what /analyze does (one extract_all over the
+    joined text); the streaming path is /analyze-reports.
+    """
+    from model.extract_text import extract_from_pdf, iter_pdf_pages
+    from model.ner_extractor import extract_all
+    from model.report_splitter import extract_reports
+
+    # Both keep only (UHID, lab test count) per report, so peak memory is the pipeline's own
+    def whole_file(data):
+        result = extract_all(extract_from_pdf(io.BytesIO(data)))
+        return [(result['patient_information']['uhid'], len(result['lab_tests']))]
+
+    def streaming(data):
+        return [(result['patient_information']['uhid'], len(result['lab_tests']))
+                for _, result in extract_reports(iter_pdf_pages(io.BytesIO(data)))]
+
+    def first_report(data):
+        return next(extract_reports(iter_pdf_pages(io.BytesIO(data))))
+
+    results = []
+    for reports in report_counts:
+        data, pages = synthetic.batched_pdf(reports)
+        entry = {'reports': reports, 'pages': pages, 'pdf_bytes': len(data)}
+        for name, func in (('whole_file', whole_file), ('streaming', streaming)):
+            timing, extracted = measure(func, data, repeat=repeat)
+            entry[name] = {
+                'extract': timing,
+                'peak_bytes': peak_memory(func, data),
+                'patients_found': len({uhid for uhid, _ in extracted}),
+                'lab_tests_found': sum(tests for _, tests in extracted),
+            }
+            print(f"  split {reports:>4} reports ({pages} pages) {name}: median {timing['median'] * 1000:.1f} ms, "
+                  f"peak {entry[name]['peak_bytes'] / 1e6:.1f} MB, {entry[name]['patients_found']} patients, "
+                  f"{entry[name]['lab_tests_found']} lab tests")
+        entry['streaming']['first_report'] = measure(first_report, data, repeat=repeat)[0]
+        print(f"  split {reports:>4} reports first report after "
+              f"{entry['streaming']['first_report']['median'] * 1000:.1f} ms")
+        results.append(entry)
+    return results
+
+
+def pattern_targets():
+    """Every compiled pattern in ner_extractor by attribute name, list and tuple entries indexed"""
+    targets = {}
+    for name, value in vars(ner_extractor).items():
+        if isinstance(value, re.Pattern):
+            targets[name] = value.search
+        elif isinstance(value, (list, tuple)):
+            for index, item in enumerate(value):
+                if isinstance(item, re.Pattern):
+                    targets[f"{name}[{index}]"] = item.search
+    return targets
+
+
+def bench_redos(sizes, repeat):
+    """
+    Worst case of each pattern (one search) and extractor over the adversarial texts
+
+    The fallback test patterns are only ever tried at scanner hits, so they
+    are covered through extract_specific_tests_comprehensive.
+    """
+    budget = getattr(ner_extractor, "EXTRACT_TIME_BUDGET", 0)
+    # Time the full extraction, not the budget
+    ner_extractor.EXTRACT_TIME_BUDGET = 0
+    targets = pattern_targets()
+    for name in SUB_EXTRACTORS + ["extract_all"]:
+        targets[name] = getattr(ner_extractor, name)
+    texts = {size: synthetic.adversarial_texts(size) for size in sizes}
+
+    results = {}
+    try:
+        for name, target in targets.items():
+            worst = None
+            for attack in texts[sizes[0]]:
+                timings = [measure(target, texts[size][attack], repeat=repeat)[0]['min'] for size in sizes]
+                growth = timings[-1] / timings[0] if timings[0] else 0.0
+                if worst is None or timings[-1] > worst['worst_seconds']:
+                    worst = {'worst_seconds': timings[-1], 'attack': attack, 'growth': growth,
+                             'seconds_by_size': dict(zip(map(str, sizes), timings))}
+            # Growth of microsecond timings is noise; only flag measurable ones
+            worst['superlinear'] = worst['growth'] > REDOS_MAX_GROWTH and worst['worst_seconds'] > 0.001
+            results[name] = worst
+    finally:
+        ner_extractor.EXTRACT_TIME_BUDGET = budget
+
+    ranked = sorted(results.items(), key=lambda item: item[1]['worst_seconds'], reverse=True)
+    for name, worst in ranked[:12]:
+        print(f"  redos {name:40s} worst {worst['worst_seconds'] * 1000:9.2f} ms on {worst['attack']:13s} "
+              f"x{worst['growth']:.1f} for 4x input{'  SUPERLINEAR' if worst['superlinear'] else ''}")
+    flagged = [name for name, worst in results.items() if worst['superlinear']]
+    print(f"  redos {len(results)} targets, superlinear: {', '.join(flagged) or 'none'}")
+    return {'sizes': sizes, 'targets': results, 'superlinear': flagged}
+
+
+def compare(current, previous, path=()):
+    """Print median ratios (current / previous) for every matching timing"""
+    if isinstance(current, dict) and isinstance(previous, dict):
+        if 'median' in current and 'median' in previous:
+            ratio = current['median'] / previous['median'] if previous['median'] else float('inf')
+            print(f"  {'.'.join(path)}: {previous['median'] * 1000:.2f} ms -> "
+                  f"{current['median'] * 1000:.2f} ms ({ratio:.2f}x)")
+            return
+        for key in current:
+            if key in previous:
+                compare(current[key], previous[key], path + (str(key),))
+    elif isinstance(current, list) and isinstance(previous, list):
+        for index, (cur, prev) in enumerate(zip(current, previous)):
+            compare(cur, prev, path + (str(index),))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark extraction and export hot paths")
+    parser.add_argument("--quick", action="store_true", help="Small sizes and fewer repeats")
+    parser.add_argument("--sections", default="startup,extraction,store,docx,split,redos,ocr",
+                        help="Comma separated sections to run")
+    parser.add_argument("--repeat", type=int, default=None)
+    parser.add_argument("--output", default=None, help="JSON results path")
+    parser.add_argument("--compare", default=None, help="Earlier results JSON to compare against")
+    args = parser.parse_args(argv)
+
+    sections = set(args.sections.split(","))
+    repeat = args.repeat or (3 if args.quick else 10)
+    text_sizes = TEXT_SIZES[:2] if args.quick else TEXT_SIZES
+    existing_rows = EXISTING_ROWS[:1] if args.quick else EXISTING_ROWS
+
+    results = {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'quick': args.quick,
+    }
+    if "startup" in sections:
+        print("Startup")
+        results['startup'] = bench_startup(repeat)
+    if "extraction" in sections:
+        print("Extraction")
+        results['extraction'] = bench_extraction(text_sizes, repeat)
+    if "store" in sections:
+        print("Store / export")
+        results['store'] = bench_store(existing_rows, repeat)
+    if "docx" in sections:
+        print("DOCX")
+        results['docx'] = bench_docx(DOCX_REPORTS[:2] if args.quick else DOCX_REPORTS, repeat)
+    if "split" in sections:
+        print("Batched PDFs")
+        results['split'] = bench_split(BATCH_REPORTS[:1] if args.quick else BATCH_REPORTS, min(repeat, 3))
+    if "redos" in sections:
+        print("Adversarial input")
+        results['redos'] = bench_redos([size // 4 for size in REDOS_SIZES] if args.quick else REDOS_SIZES,
+                                       min(repeat, 3))
+    if "ocr" in sections:
+        print("OCR")
+        results['ocr'] = bench_ocr(SAMPLE_IMAGES, max(1, repeat // 5))
+
+    output = args.output or f"bench_results_{time.strftime('%Y%m%d_%H%M%S')}.json"
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    print(f"✓ Wrote {output}")
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            previous = json.load(f)
+        print(f"Compared with {args.compare}")
+        compare(results, previous)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
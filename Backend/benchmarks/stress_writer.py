@@ -0,0 +1,102 @@
+"""
+Concurrent writer stress test for the results store and Excel export
+
+Run from the Backend folder:
+    python -m benchmarks.stress_writer [--processes 8] [--threads 4] [--reports 50]
+
+Every process runs several threads that append reports and occasionally
+export the workbook at the same time. Afterwards the store, its counters and
+the exported workbook must all contain exactly the rows that were appended.
+"""
+import argparse
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from benchmarks import synthetic
+from benchmarks.run_benchmarks import scratch_directory
+
+TESTS_PER_REPORT = 10
+
+
+def _writer_process(worker, threads, reports, export_every):
+    from model.excel_manager import append_lab_results_to_excel, export_excel
+
+    errors = []
+
+    def run(thread_index):
+        for index in range(reports):
+            seed = (worker * threads + thread_index) * reports + index
+            try:
+                added = append_lab_results_to_excel(
+                    synthetic.extracted_report(seed, tests=TESTS_PER_REPORT)
+                )
+                if added != TESTS_PER_REPORT:
+                    errors.append(f"report {seed}: appended {added} rows")
+                if export_every and index % export_every == 0:
+                    export_excel()
+            except Exception as e:
+                errors.append(f"report {seed}: {e}")
+
+    pool = [threading.Thread(target=run, args=(i,)) for i in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    return errors
+
+
+def stress(processes, threads, reports, export_every):
+    from model.excel_manager import export_excel, get_excel_stats, rebuild_excel_stats
+    from openpyxl import load_workbook
+
+    expected = processes * threads * reports * TESTS_PER_REPORT
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        futures = [
+            pool.submit(_writer_process, worker, threads, reports, export_every)
+            for worker in range(processes)
+        ]
+        errors = [error for future in futures for error in future.result()]
+    elapsed = time.perf_counter() - started
+
+    stats = get_excel_stats()
+    rebuilt = rebuild_excel_stats()
+    export_excel()
+    wb = load_workbook("lab_results.xlsx", read_only=True)
+    exported = sum(1 for _ in wb.active.iter_rows(min_row=2, values_only=True))
+    wb.close()
+
+    checks = {
+        'store rows': stats['total_records'],
+        'recounted rows': rebuilt['total_records'],
+        'exported rows': exported,
+    }
+    print(f"{expected} rows appended by {processes}x{threads} writers in {elapsed:.1f}s "
+          f"({expected / elapsed:.0f} rows/s)")
+    ok = not errors and all(value == expected for value in checks.values())
+    ok = ok and stats['unique_patients'] == rebuilt['unique_patients']
+    for name, value in checks.items():
+        print(f"  {'✓' if value == expected else '✗'} {name}: {value}")
+    for error in errors[:10]:
+        print(f"  ✗ {error}")
+    return ok
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Stress concurrent appends and exports")
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--reports", type=int, default=25, help="Reports appended per thread")
+    parser.add_argument("--export-every", type=int, default=10, help="Export after every N reports (0 = never)")
+    args = parser.parse_args(argv)
+
+    with scratch_directory():
+        ok = stress(args.processes, args.threads, args.reports, args.export_every)
+    print("✓ No lost rows" if ok else "✗ Stress test failed")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
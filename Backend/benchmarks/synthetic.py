@@ -0,0 +1,305 @@
+"""
+Synthetic report text shaped like the layouts ner_extractor targets
+
+Every generator is deterministic for a given seed so runs can be compared.
+"""
+import io
+import random
+import zipfile
+from xml.sax.saxutils import escape
+
+FIRST_NAMES = ["RAVI", "ANITA", "SURESH", "PRIYA", "MOHAN", "LATHA", "KIRAN", "DEEPA"]
+LAST_NAMES = ["KUMAR", "SHARMA", "REDDY", "NAIR", "RAO", "PINTO", "DSOUZA", "MENON"]
+MONTHS = ["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]
+
+# (line label, unit, low, high)
+LFT_TESTS = [
+    ("TOTAL BILIRUBIN", "mg/dl", 0.4, 1.0),
+    ("DIRECT BILIRUBIN", "mg/dl", 0.1, 0.5),
+    ("INDIRECT BILIRUBIN", "mg/dl", 0.2, 0.8),
+    ("SERUM SGOT", "IU/L", 5, 40),
+    ("SERUM SGPT", "IU/L", 5, 55),
+    ("SERUM TOTAL PROTEIN", "gm/dl", 6.0, 8.0),
+    ("SERUM ALBUMIN", "gm/dl", 3.5, 5.5),
+    ("SERUM GLOBULIN", "gm/dl", 2.0, 4.0),
+    ("A/G RATIO", "RATIO", 1.0, 1.85),
+    ("ALKALINE PHOSPHATASE", "IU/L", 40, 280),
+]
+
+CBC_TESTS = [
+    ("Platelet count", "Lakhs/Cumm", 2.1, 5.0),
+    ("Mean Cell Volume", "fL", 92, 118),
+    ("Mean Cell Haemoglobin (MCH)", "pg", 31, 37),
+    ("Mean Cell Haemoglobin Concentration", "g/L", 29, 47),
+    ("RDW", "%", 11.6, 14.0),
+]
+
+DIFFERENTIAL_TESTS = [
+    ("Neutrophils.", 20, 45),
+    ("Lymphocytes", 28, 35),
+    ("Eosinophils", 1.4, 4.3),
+    ("Monocytes", 4, 7),
+    ("Basophils", 0, 1),
+]
+
+
+def _value(rng, low, high):
+    """Mostly in range, sometimes flagged outside it"""
+    roll = rng.random()
+    if roll < 0.15:
+        return round(high * rng.uniform(1.1, 1.6), 1), "↑"
+    if roll < 0.25:
+        return round(low * rng.uniform(0.4, 0.9), 1), "↓"
+    return round(rng.uniform(low, high), 1), ""
+
+
+def _header(rng):
+    day = rng.randint(1, 28)
+    month = rng.choice(MONTHS)
+    return "\n".join([
+        "UDHRAN HOSPITAL",
+        "DEPARTMENT OF PATHOLOGY",
+        f"PATIENT NAME : {rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)} Age : {rng.randint(18, 90)} Years "
+        f"{rng.choice(['Male', 'Female'])}",
+        f"UHID : UH{rng.randint(100000, 999999)}",
+        f"Episode : OP",
+        f"Referred By : Dr. {rng.choice(FIRST_NAMES).title()} {rng.choice(LAST_NAMES).title()} Ward : General",
+        f"Collection Date : {day:02d}-{month}-2024 09:{rng.randint(10, 59)} am",
+        f"Report Date : {day:02d}-{month}-2024 04:{rng.randint(10, 59)} pm",
+        "",
+    ])
+
+
+def lft_report(seed=0):
+    """One liver function test report"""
+    rng = random.Random(seed)
+    lines = [_header(rng), "BIOCHEMISTRY", "LIVER FUNCTION TEST", "TEST VALUE UNIT REF.RANGE"]
+    for label, unit, low, high in LFT_TESTS:
+        value, flag = _value(rng, low, high)
+        lines.append(f"{label} {value} {flag} {unit} {low}-{high}".replace("  ", " "))
+    lines.append("Remarks: Values to be correlated clinically with liver profile history.")
+    lines.append("Method : Diazo / IFCC")
+    return "\n".join(lines) + "\n"
+
+
+def cbc_report(seed=0):
+    """One CBC report with a differential count table"""
+    rng = random.Random(seed)
+    lines = [_header(rng), "HAEMATOLOGY", "COMPLETE BLOOD COUNT"]
+    for label, unit, low, high in CBC_TESTS:
+        value, flag = _value(rng, low, high)
+        lines.append(f"{label} {value} {flag} {unit} {low} - {high}".replace("  ", " "))
+    lines.append("DIFFERENTIAL COUNT")
+    for label, low, high in DIFFERENTIAL_TESTS:
+        value, flag = _value(rng, max(low, 0.5), high)
+        lines.append(f"{label} {value} {flag} {low} - {high} %".replace("  ", " "))
+    lines.append("Interpretation: Mild anemia with infection suspected, advised follow up.")
+    return "\n".join(lines) + "\n"
+
+
+def report_of_size(target_chars, seed=0):
+    """Concatenate LFT and CBC reports until the text reaches target_chars"""
+    parts = []
+    size = 0
+    index = 0
+    while size < target_chars:
+        part = (lft_report if index % 2 == 0 else cbc_report)(seed + index)
+        parts.append(part)
+        size += len(part)
+        index += 1
+    return "".join(parts)
+
+
+def extracted_report(seed=0, tests=10):
+    """A dict shaped like extract_all output, for store/export benchmarks"""
+    rng = random.Random(seed)
+    return {
+        "patient_information": {
+            "patient_name": f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)} {seed}",
+            "age": rng.randint(18, 90),
+            "sex": rng.choice(["M", "F"]),
+            "uhid": f"UH{seed:08d}",
+            "episode": "OP",
+            "ref_doctor": "Dr. Rao",
+        },
+        "order_information": {
+            "facility": "UDHRAN HOSPITAL",
+            "collection_date": f"{rng.randint(1, 28):02d}-{rng.choice(MONTHS)}-2024",
+            "report_date": f"{rng.randint(1, 28):02d}-{rng.choice(MONTHS)}-2024",
+        },
+        "lab_tests": [
+            {
+                "test_name": label.title(),
+                "value": str(_value(rng, low, high)[0]),
+                "unit": unit,
+                "reference_range": f"{low}-{high}",
+                "status": "Normal",
+            }
+            for label, unit, low, high in (LFT_TESTS + CBC_TESTS)[:tests]
+        ],
+    }
+
+
+# Smallest package parts a DOCX reader (and python-docx) accepts
+_DOCX_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/word/document.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+    '</Types>'
+)
+_DOCX_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="word/document.xml"/>'
+    '</Relationships>'
+)
+
+
+def _docx_paragraph(text):
+    return f'<w:p><w:r><w:t xml:space="preserve">{escape(text)}</w:t></w:r></w:p>'
+
+
+def _docx_row(cells):
+    return "<w:tr>" + "".join(f"<w:tc>{_docx_paragraph(cell)}</w:tc>" for cell in cells) + "</w:tr>"
+
+
+def docx_report(reports, seed=0):
+    """
+    A DOCX file (bytes) holding several LFT reports, lab results in tables
+
+    Returns:
+        Tuple of (DOCX bytes, number of lab test rows in its tables)
+    """
+    body = []
+    rows = 0
+    for index in range(reports):
+        rng = random.Random(seed + index)
+        body.extend(_docx_paragraph(line) for line in _header(rng).split("\n"))
+        body.append(_docx_paragraph("LIVER FUNCTION TEST"))
+        table = [_docx_row(["TEST", "VALUE", "UNIT", "REF.RANGE"])]
+        for label, unit, low, high in LFT_TESTS:
+            value, flag = _value(rng, low, high)
+            table.append(_docx_row([label, f"{value} {flag}".strip(), unit, f"{low}-{high}"]))
+            rows += 1
+        body.append("<w:tbl>" + "".join(table) + "</w:tbl>")
+        body.append(_docx_paragraph("Remarks: Values to be correlated clinically."))
+
+    document = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+        '<w:body>' + "".join(body) + '</w:body></w:document>'
+    )
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("[Content_Types].xml", _DOCX_CONTENT_TYPES)
+        archive.writestr("_rels/.rels", _DOCX_RELS)
+        archive.writestr("word/document.xml", document)
+    return buffer.getvalue(), rows
+
+
+# Lines per page of the synthetic PDFs (A4 at 11pt leading)
+PDF_PAGE_LINES = 66
+
+
+def _pdf_string(line):
+    """PDF string literal of a line in the standard Helvetica encoding"""
+    line = line.replace("↑", "H").replace("↓", "L")
+    line = line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+    return "(" + line.encode("latin-1", "replace").decode("latin-1") + ")"
+
+
+def batched_pdf(reports, seed=0):
+    """
+    A PDF (bytes) holding many patients' reports back to back, as labs batch them
+
+    Alternating LFT and CBC reports are laid out continuously over A4 text
+    pages, so reports start mid-page and run over page breaks.
+
+    Returns:
+        Tuple of (PDF bytes, number of pages)
+    """
+    text = "".join((lft_report if index % 2 == 0 else cbc_report)(seed + index) for index in range(reports))
+    lines = text.rstrip("\n").split("\n")
+    pages = [lines[start:start + PDF_PAGE_LINES] for start in range(0, len(lines), PDF_PAGE_LINES)]
+
+    # Objects: 1 catalog, 2 page tree, 3 font, then a page and its content stream per page
+    objects = [None, None, "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    page_ids = []
+    for page_lines in pages:
+        stream = "BT /F1 9 Tf 11 TL 40 800 Td " + " ".join(
+            f"{_pdf_string(line)} Tj T*" for line in page_lines
+        ) + " ET"
+        objects.append(f"<< /Length {len(stream.encode('latin-1'))} >>\nstream\n{stream}\nendstream")
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+                       f"/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects)} 0 R >>")
+        page_ids.append(len(objects))
+    objects[0] = "<< /Type /Catalog /Pages 2 0 R >>"
+    objects[1] = (f"<< /Type /Pages /Kids [{' '.join(f'{page_id} 0 R' for page_id in page_ids)}] "
+                  f"/Count {len(page_ids)} >>")
+
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(out.tell())
+        out.write(f"{number} 0 obj\n{body}\nendobj\n".encode("latin-1"))
+    xref = out.tell()
+    out.write(f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode("latin-1"))
+    out.write("".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode("latin-1"))
+    out.write(f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode("latin-1"))
+    return out.getvalue(), len(pages)
+
+
+# Labels the extraction patterns key on, for the adversarial texts below
+ADVERSARIAL_LABELS = [
+    "PATIENT NAME", "Patient Name:", "Patient", "Age/Sex: 45 Year", "Age: 45", "45 Y", "Referred By:",
+    "Ref Doctor:", "By:", "UHID:", "Episode:", "Bill Date", "Report Date", "Collection Date", "Service No",
+    "Remarks", "Interpretation", "Comments", "TOTAL BILIRUBIN", "SERUM SGOT", "A/G RATIO", "Platelet count",
+    "Neutrophils", "(IFCC", "Hb 1 a", "Hb",
+]
+
+
+def adversarial_texts(target_chars, seed=0):
+    """
+    Garbage texts that make backtracking patterns go superlinear
+
+    Each is about target_chars long and mimics something OCR produces:
+    labels followed by huge whitespace runs, labels repeated with no value
+    after them, long lines of unit/range punctuation, and random noise.
+
+    Returns:
+        Dict of attack name -> text
+    """
+    rng = random.Random(seed)
+    share = max(1, target_chars // len(ADVERSARIAL_LABELS))
+
+    def per_label(make):
+        return "\n".join(make(label) for label in ADVERSARIAL_LABELS)
+
+    noise_chars = "abcdefghijklmnopqrstuvwxyz ABCDEFGHIJKLMNOPQRSTUVWXYZ.,:;-/()%^*|'   "
+    return {
+        # "Patient Name" + 10k spaces + junk: lazy names against \s+
+        'label_spaces': per_label(lambda label: label + " " * share + "x"),
+        # The same label again and again with no value: every occurrence is a new attempt
+        'label_repeat': per_label(lambda label: (label + " ") * max(1, share // (len(label) + 1)) + "x"),
+        # Labels with no digit anywhere after them (nearest-number fallbacks)
+        'no_digits': " ".join(rng.choice(ADVERSARIAL_LABELS).replace("45", "").replace("1", "")
+                              for _ in range(target_chars // 12)),
+        # "12y12y12y..." - age candidates with no sex on the line
+        'age_digits': "12y" * (target_chars // 3),
+        # One lab-like line whose unit and range runs overlap
+        'lab_line_runs': "Hb 1 a" + ":" * (target_chars // 3) + " " * (target_chars // 3) + "/" * (target_chars // 3) + "!",
+        # Letters and punctuation only, one very long line
+        'noise_line': "".join(rng.choice(noise_chars) for _ in range(target_chars)),
+        # Noise with labels mixed in and occasional newlines
+        'noise_labels': "".join(
+            rng.choice(ADVERSARIAL_LABELS) if rng.random() < 0.05 else
+            "\n" if rng.random() < 0.002 else rng.choice(noise_chars + "0123456789")
+            for _ in range(target_chars)
+        ),
+    }
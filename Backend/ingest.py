@@ -0,0 +1,227 @@
+"""
+Batch ingest of report files into the results store
+
+Usage:
+    python ingest.py reports/ [more_reports/ file.pdf ...] [--file-list files.txt]
+                     [--workers 4] [--batch-size 500] [--checkpoint ingest_checkpoint.txt]
+                     [--export]
+    python ingest.py --reflag
+
+Files are streamed through text extraction and extract_all in a process pool
+and their rows are appended to the results store in batches. Batched files
+holding many patients are split into one report per patient on the way
+(see model.report_splitter). The SHA-256 of every
+file that has been committed is written to the checkpoint, so an interrupted
+run can be restarted and will skip the files it already processed. Files that
+failed are not checkpointed and are retried by the next run.
+
+Appended rows are normalized and flagged against their reference ranges in
+the same batches; --reflag re-runs that over every row already stored.
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+from model import extract_text as extract_text_module
+from model.extract_text import iter_text_pages, SUPPORTED_EXTENSIONS
+from model.report_splitter import extract_reports
+from model.result_cache import hash_bytes
+from model.excel_manager import initialize_excel, build_excel_rows, export_excel
+from model.results_store import append_rows, reflag_results
+
+CHECKPOINT_PATH = "ingest_checkpoint.txt"
+MIN_TEXT_LENGTH = 50
+
+
+def iter_input_files(paths, file_list=None):
+    """Yield supported report files from directories, files and a file list"""
+    if file_list:
+        with open(file_list, 'r', encoding='utf-8') as f:
+            paths = list(paths) + [line.strip() for line in f if line.strip()]
+
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for name in sorted(files):
+                    if name.lower().endswith(SUPPORTED_EXTENSIONS):
+                        yield os.path.join(root, name)
+        elif os.path.isfile(path):
+            yield path
+        else:
+            print(f"⚠ Skipping missing path: {path}")
+
+
+def file_sha256(file_path):
+    with open(file_path, 'rb') as f:
+        return hash_bytes(f.read())
+
+
+def load_checkpoint(checkpoint_path):
+    """Hashes of files already committed by earlier runs"""
+    if not checkpoint_path or not os.path.exists(checkpoint_path):
+        return set()
+    with open(checkpoint_path, 'r', encoding='utf-8') as f:
+        return {line.strip() for line in f if line.strip()}
+
+
+def _init_worker():
+    # Parallelism comes from the ingest pool; keep PDF OCR single-process per worker
+    extract_text_module.OCR_WORKERS = 1
+
+
+def process_file(file_path):
+    """
+    Extract every report in one file (runs in a worker process)
+
+    Returns:
+        Tuple of (rows, error message or None)
+    """
+    try:
+        rows = []
+        reports = 0
+        for _, result in extract_reports(iter_text_pages(file_path), min_chars=MIN_TEXT_LENGTH):
+            rows.extend(build_excel_rows(result))
+            reports += 1
+        if not reports:
+            return [], "Insufficient text extracted from document"
+        return rows, None
+    except Exception as e:
+        return [], str(e)
+
+
+class IngestStats:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.files = 0
+        self.rows = 0
+        self.failed = 0
+        self.skipped = 0
+
+    def summary(self):
+        elapsed = max(time.perf_counter() - self.started, 1e-9)
+        return (
+            f"{self.files} files ({self.failed} failed, {self.skipped} skipped), "
+            f"{self.rows} rows in {elapsed:.1f}s - "
+            f"{self.files / elapsed:.2f} files/s, {self.rows / elapsed:.1f} rows/s"
+        )
+
+
+def ingest(paths, file_list=None, workers=None, batch_size=500,
+           checkpoint_path=CHECKPOINT_PATH, progress_every=100):
+    """
+    Stream files through extraction and append their rows in batches
+
+    Returns:
+        IngestStats for the run
+    """
+    initialize_excel()
+    done_hashes = load_checkpoint(checkpoint_path)
+    stats = IngestStats()
+    workers = workers or os.cpu_count() or 1
+
+    pending_rows = []
+    pending_hashes = []
+    checkpoint = open(checkpoint_path, 'a', encoding='utf-8') if checkpoint_path else None
+
+    def commit():
+        if pending_rows:
+            append_rows(pending_rows)
+        if checkpoint and pending_hashes:
+            checkpoint.write("".join(f"{file_hash}\n" for file_hash in pending_hashes))
+            checkpoint.flush()
+        pending_rows.clear()
+        pending_hashes.clear()
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+            in_flight = {}
+            in_flight_hashes = set()
+
+            def collect(futures):
+                for future in futures:
+                    file_path, file_hash = in_flight.pop(future)
+                    in_flight_hashes.discard(file_hash)
+                    rows, error = future.result()
+                    stats.files += 1
+                    if error:
+                        # Not checkpointed, so the next run retries it
+                        stats.failed += 1
+                        print(f"✗ {file_path}: {error}")
+                    else:
+                        pending_hashes.append(file_hash)
+                        done_hashes.add(file_hash)
+                    stats.rows += len(rows)
+                    pending_rows.extend(rows)
+                    if len(pending_rows) >= batch_size:
+                        commit()
+                    if progress_every and stats.files % progress_every == 0:
+                        print(f"… {stats.summary()}")
+
+            for file_path in iter_input_files(paths, file_list):
+                file_hash = file_sha256(file_path)
+                if file_hash in done_hashes or file_hash in in_flight_hashes:
+                    stats.skipped += 1
+                    continue
+
+                # Keep a bounded number of files in flight so memory stays flat
+                while len(in_flight) >= workers * 2:
+                    finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    collect(finished)
+
+                in_flight[pool.submit(process_file, file_path)] = (file_path, file_hash)
+                in_flight_hashes.add(file_hash)
+
+            while in_flight:
+                finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                collect(finished)
+    finally:
+        commit()
+        if checkpoint:
+            checkpoint.close()
+
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Batch ingest lab reports into the results store")
+    parser.add_argument("paths", nargs="*", help="Report files or directories to ingest")
+    parser.add_argument("--file-list", help="Text file with one report path per line")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument("--batch-size", type=int, default=500, help="Rows per store append")
+    parser.add_argument("--checkpoint", default=CHECKPOINT_PATH,
+                        help="File of processed SHA-256 hashes used to resume ('' disables)")
+    parser.add_argument("--export", action="store_true", help="Rebuild lab_results.xlsx when done")
+    parser.add_argument("--plain-export", action="store_true",
+                        help="With --export, skip header styling and column widths")
+    parser.add_argument("--reflag", action="store_true",
+                        help="Re-normalize values and re-flag statuses of all stored rows")
+    args = parser.parse_args(argv)
+
+    if not args.paths and not args.file_list and not args.reflag:
+        parser.error("give at least one path, --file-list or --reflag")
+
+    if args.paths or args.file_list:
+        stats = ingest(
+            args.paths,
+            file_list=args.file_list,
+            workers=args.workers,
+            batch_size=args.batch_size,
+            checkpoint_path=args.checkpoint or None,
+        )
+        print(f"✓ Ingest complete: {stats.summary()}")
+
+    if args.reflag:
+        initialize_excel()
+        reflagged = reflag_results()
+        print(f"✓ Re-flagged {reflagged['rows_checked']} rows, {reflagged['status_changes']} statuses changed")
+
+    if args.export:
+        export_excel(formatted=not args.plain_export)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
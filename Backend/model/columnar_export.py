@@ -0,0 +1,241 @@
+import os
+import re
+from functools import lru_cache
+from model.excel_manager import initialize_excel
+from model.metrics import metrics, timed
+from model.results_store import (
+    RESULT_COLUMNS, DATE_COLUMNS, iter_row_batches, get_last_row_id, parse_report_date
+)
+
+# pyarrow is optional: it is imported on first export, and the Parquet/Arrow
+# download answers 501 when it is not installed
+
+# format -> (file extension, mimetype)
+COLUMNAR_FORMATS = {
+    'parquet': ('.parquet', 'application/vnd.apache.parquet'),
+    'arrow': ('.arrows', 'application/vnd.apache.arrow.stream'),
+}
+
+# Rows per record batch / Parquet row group; also the unit of streaming
+EXPORT_BATCH_ROWS = int(os.environ.get("EXPORT_BATCH_ROWS", 50000))
+
+# Repetitive text columns written as dictionary (categorical) columns
+CATEGORICAL_COLUMNS = ('Sex', 'Test_Name', 'Unit', 'Status', 'Facility')
+
+NUMBER_PATTERN = re.compile(r'^[+-]?(?:\d+(?:\.\d*)?|\.\d+)$')
+
+
+def load_pyarrow():
+    """Import pyarrow, with an install hint if it is missing"""
+    try:
+        import pyarrow
+    except ImportError:
+        raise ImportError("Parquet/Arrow export needs pyarrow (pip install pyarrow)")
+    return pyarrow
+
+
+def arrow_schema():
+    """
+    Typed schema of the columnar export
+
+    Row_Id comes first so consumers can pull only rows added since their
+    last download. Test_Value is numeric (null for text results such as
+    "Positive" or "<5", which stay in Test_Value_Text), dates are timestamps
+    and 'N/A' becomes null.
+    """
+    pa = load_pyarrow()
+    fields = [pa.field('Row_Id', pa.int64(), nullable=False)]
+    for column in RESULT_COLUMNS:
+        if column == 'Age':
+            fields.append(pa.field(column, pa.int32()))
+        elif column == 'Test_Value':
+            fields.append(pa.field(column, pa.float64()))
+            fields.append(pa.field('Test_Value_Text', pa.string()))
+        elif column in DATE_COLUMNS:
+            fields.append(pa.field(column, pa.timestamp('s')))
+        elif column in CATEGORICAL_COLUMNS:
+            fields.append(pa.field(column, pa.dictionary(pa.int32(), pa.string())))
+        else:
+            fields.append(pa.field(column, pa.string()))
+    return pa.schema(fields)
+
+
+def _text(value):
+    if value is None:
+        return None
+    value = str(value).strip()
+    return None if value in ('', 'N/A') else value
+
+
+@lru_cache(maxsize=4096)
+def parse_number(value):
+    """Float value of a plain number ("12", "4.5", "1,200"), else None"""
+    if isinstance(value, (int, float)):
+        return float(value)
+    if not isinstance(value, str):
+        return None
+    value = value.strip().replace(',', '')
+    return float(value) if NUMBER_PATTERN.match(value) else None
+
+
+def _age(value):
+    number = parse_number(value)
+    return int(number) if number is not None and number.is_integer() else None
+
+
+def _record_batch(pa, schema, rows, date_filter):
+    """
+    Convert stored rows into a RecordBatch, dropping rows outside date_filter
+
+    Args:
+        date_filter: (column, from, to) or None
+    """
+    if date_filter:
+        column, date_from, date_to = date_filter
+        index = RESULT_COLUMNS.index(column) + 1
+        kept = []
+        for row in rows:
+            date = parse_report_date(row[index])
+            if date is None or (date_from and date < date_from) or (date_to and date > date_to):
+                continue
+            kept.append(row)
+        rows = kept
+    if not rows:
+        return None
+
+    columns = list(zip(*rows))
+    arrays = [pa.array(columns[0], pa.int64())]
+    for index, column in enumerate(RESULT_COLUMNS, start=1):
+        values = columns[index]
+        if column == 'Age':
+            arrays.append(pa.array([_age(value) for value in values], pa.int32()))
+        elif column == 'Test_Value':
+            arrays.append(pa.array([parse_number(value) for value in values], pa.float64()))
+            arrays.append(pa.array([_text(value) for value in values], pa.string()))
+        elif column in DATE_COLUMNS:
+            arrays.append(pa.array([parse_report_date(value) for value in values], pa.timestamp('s')))
+        elif column in CATEGORICAL_COLUMNS:
+            arrays.append(pa.array([_text(value) for value in values], pa.string()).dictionary_encode())
+        else:
+            arrays.append(pa.array([_text(value) for value in values], pa.string()))
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+class _ChunkSink:
+    """Write-only file object that collects written bytes for streaming"""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        data = bytes(data)
+        self.chunks.append(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def stream_results(fmt='parquet', min_id=None, max_id=None,
+                   date_column='Collection_Date', date_from=None, date_to=None):
+    """
+    Stream the results store as Parquet or Arrow IPC (stream format)
+
+    Rows are read and converted EXPORT_BATCH_ROWS at a time, and each batch
+    is yielded as soon as it is encoded, so memory stays flat however large
+    the store is.
+
+    Args:
+        fmt: 'parquet' or 'arrow'
+        min_id, max_id: Inclusive Row_Id range
+        date_column: Date column the from/to filter applies to
+        date_from, date_to: datetime bounds (inclusive), or None
+
+    Yields:
+        Chunks of the encoded file
+
+    Raises:
+        ValueError: For an unknown format or date column
+        ImportError: If pyarrow is not installed
+    """
+    if fmt not in COLUMNAR_FORMATS:
+        raise ValueError(f"Unknown format '{fmt}' (use one of: {', '.join(COLUMNAR_FORMATS)})")
+    if date_column not in DATE_COLUMNS:
+        raise ValueError(f"Unknown date column '{date_column}' (use one of: {', '.join(DATE_COLUMNS)})")
+    pa = load_pyarrow()
+    schema = arrow_schema()
+    # Collection_Date ranges are filtered in SQL on its indexed ISO column;
+    # the other date columns are only stored as report text and are parsed here
+    sql_dates = {}
+    date_filter = None
+    if date_from or date_to:
+        if date_column == 'Collection_Date':
+            sql_dates = {'date_from': date_from, 'date_to': date_to}
+        else:
+            date_filter = (date_column, date_from, date_to)
+
+    initialize_excel()
+    # Rows appended while the download is running are left for the next one
+    if max_id is None:
+        max_id = get_last_row_id()
+
+    def generate():
+        sink = _ChunkSink()
+        if fmt == 'parquet':
+            import pyarrow.parquet as pq
+            writer = pq.ParquetWriter(sink, schema, compression='zstd')
+        else:
+            writer = pa.ipc.new_stream(sink, schema, options=pa.ipc.IpcWriteOptions(compression='zstd'))
+
+        rows_written = 0
+        with timed("export_columnar"):
+            for rows in iter_row_batches(min_id, max_id, batch_size=EXPORT_BATCH_ROWS, **sql_dates):
+                batch = _record_batch(pa, schema, rows, date_filter)
+                if batch is None:
+                    continue
+                writer.write_batch(batch)
+                rows_written += batch.num_rows
+                chunk = sink.drain()
+                if chunk:
+                    yield chunk
+            writer.close()
+        metrics.inc("rows_exported_total", rows_written)
+        print(f"✓ Exported {rows_written} lab test records as {fmt}")
+        yield sink.drain()
+
+    return generate()
+
+
+def export_columnar(file_path, fmt=None, **filters):
+    """
+    Write the results store to a Parquet or Arrow file
+
+    Args:
+        file_path: Destination path
+        fmt: 'parquet' or 'arrow' (defaults to the file extension)
+        **filters: Passed to stream_results
+
+    Returns:
+        file_path
+    """
+    if fmt is None:
+        fmt = 'arrow' if os.path.splitext(file_path)[1].lower() in ('.arrow', '.arrows') else 'parquet'
+    chunks = stream_results(fmt, **filters)
+    with open(file_path, 'wb') as f:
+        for chunk in chunks:
+            f.write(chunk)
+    return file_path
@@ -1,92 +1,229 @@
-import pandas as pd
 import os
 from datetime import datetime
-from openpyxl import load_workbook
-from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
+from model.file_lock import file_lock
+from model.metrics import metrics, timed
+from model.results_store import (
+    RESULT_COLUMNS, RESULTS_DB_PATH, store_exists, initialize_store,
+    append_rows, iter_rows, get_last_row_id, get_meta, set_meta,
+    get_stats, rebuild_stats, get_column_widths, normalize_rows
+)
 
 EXCEL_FILE_PATH = "lab_results.xlsx"
+# Serializes store creation and workbook exports across threads and worker processes
+EXCEL_LOCK_PATH = "lab_results.lock"
+EXCEL_COLUMNS = RESULT_COLUMNS
+
 
 def initialize_excel():
-    """Create Excel file with headers if it doesn't exist"""
-    if not os.path.exists(EXCEL_FILE_PATH):
-        df = pd.DataFrame(columns=[
-            'Patient_Name',
-            'Age',
-            'Sex',
-            'UHID',
-            'Episode',
-            'Ref_Doctor',
-            'Test_Name',
-            'Test_Value',
-            'Unit',
-            'Reference_Range',
-            'Status',
-            'Bill_No',
-            'Facility',
-            'Sample_No',
-            'Collection_Date',
-            'Report_Date',
-            'Extraction_Date'
-        ])
-        df.to_excel(EXCEL_FILE_PATH, index=False, sheet_name='Lab Results')
-        format_excel_file()
-        print(f"✓ Created new Excel file: {EXCEL_FILE_PATH}")
+    """Create the results store, importing an existing Excel file once"""
+    if store_exists():
+        initialize_store()
+        return EXCEL_FILE_PATH
+
+    with file_lock(EXCEL_LOCK_PATH):
+        # Another worker may have created the store while we waited
+        created = not store_exists()
+        initialize_store()
+        if created:
+            if os.path.exists(EXCEL_FILE_PATH):
+                imported = append_rows(read_excel_rows(EXCEL_FILE_PATH))
+                print(f"✓ Imported {imported} existing records from {EXCEL_FILE_PATH}")
+            print(f"✓ Created new results store: {RESULTS_DB_PATH}")
     return EXCEL_FILE_PATH
 
 
-def format_excel_file():
-    """Apply formatting to Excel file"""
+def has_results():
+    """True once a results store or a legacy Excel file exists"""
+    return store_exists() or os.path.exists(EXCEL_FILE_PATH)
+
+
+def read_excel_rows(file_path):
+    """Read rows from a previously written lab results workbook"""
+    from openpyxl import load_workbook
+
+    wb = load_workbook(file_path, read_only=True)
     try:
-        wb = load_workbook(EXCEL_FILE_PATH)
-        ws = wb.active
-        
+        rows = wb.active.iter_rows(values_only=True)
+        header = next(rows, None)
+        if not header:
+            return []
+        return [
+            dict(zip(header, values)) for values in rows
+            if any(value is not None for value in values)
+        ]
+    finally:
+        wb.close()
+
+
+def export_excel(formatted=True):
+    """
+    Build the Excel file from the results store
+
+    The workbook is only rewritten when rows were appended since the last
+    export or it was written with different formatting.
+    Rows are streamed into a write-only workbook and formatting is applied in
+    the same pass, using column widths the store keeps as running maxima.
+
+    Args:
+        formatted: Apply header styling and column widths (skip for a faster plain export)
+
+    Returns:
+        Path of the Excel file
+    """
+    initialize_excel()
+
+    # One exporter at a time; the workbook is written to a temp file and
+    # renamed over the old one, so readers never see a half-written file
+    with file_lock(EXCEL_LOCK_PATH):
+        last_row_id = get_last_row_id()
+        # A plain export is not reused for a formatted one, or the other way round
+        if (os.path.exists(EXCEL_FILE_PATH) and get_meta('excel_export_row_id') == last_row_id
+                and get_meta('excel_export_formatted') == int(formatted)):
+            return EXCEL_FILE_PATH
+
+        widths = None
+        if formatted:
+            widths = get_column_widths()
+            if widths is None and last_row_id:
+                rebuild_stats()
+                widths = get_column_widths()
+
+        tmp_path = f"{EXCEL_FILE_PATH}.{os.getpid()}.tmp"
+        try:
+            rows_written = write_excel_file(tmp_path, iter_rows(max_id=last_row_id), widths, formatted)
+            os.replace(tmp_path, EXCEL_FILE_PATH)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        set_meta('excel_export_row_id', last_row_id)
+        set_meta('excel_export_formatted', int(formatted))
+
+    print(f"✓ Exported {rows_written} lab test records to {EXCEL_FILE_PATH}")
+    return EXCEL_FILE_PATH
+
+
+def write_excel_file(file_path, rows, widths=None, formatted=True):
+    """
+    Write rows to a formatted workbook in a single streaming pass
+
+    Args:
+        file_path: Destination .xlsx path
+        rows: Iterable of tuples in EXCEL_COLUMNS order
+        widths: Dict of column name -> longest value length (defaults to header lengths)
+        formatted: Apply header styling and column widths
+
+    Returns:
+        Number of data rows written
+    """
+    # openpyxl is only needed for exports, so it is not loaded at startup
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.utils import get_column_letter
+    from openpyxl.styles import Font, PatternFill, Alignment
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet('Lab Results')
+
+    if formatted:
+        # Auto-adjust column widths (must be set before any rows are written)
+        widths = widths or {column: len(column) for column in EXCEL_COLUMNS}
+        for index, column in enumerate(EXCEL_COLUMNS, start=1):
+            adjusted_width = min(widths.get(column, len(column)) + 2, 50)
+            ws.column_dimensions[get_column_letter(index)].width = adjusted_width
+
         # Header formatting
         header_fill = PatternFill(start_color="4472C4", end_color="4472C4", fill_type="solid")
         header_font = Font(bold=True, color="FFFFFF", size=11)
-        
-        for cell in ws[1]:
+
+        header = []
+        for column in EXCEL_COLUMNS:
+            cell = WriteOnlyCell(ws, value=column)
             cell.fill = header_fill
             cell.font = header_font
             cell.alignment = Alignment(horizontal='center', vertical='center')
-        
-        # Auto-adjust column widths
-        for column in ws.columns:
-            max_length = 0
-            column_letter = column[0].column_letter
-            for cell in column:
-                try:
-                    if len(str(cell.value)) > max_length:
-                        max_length = len(str(cell.value))
-                except:
-                    pass
-            adjusted_width = min(max_length + 2, 50)
-            ws.column_dimensions[column_letter].width = adjusted_width
-        
-        wb.save(EXCEL_FILE_PATH)
-    except Exception as e:
-        print(f"Warning: Could not format Excel file: {str(e)}")
+            header.append(cell)
+        ws.append(header)
+    else:
+        ws.append(EXCEL_COLUMNS)
+
+    rows_written = 0
+    for row in rows:
+        ws.append(list(row))
+        rows_written += 1
+
+    wb.save(file_path)
+    return rows_written
 
 
 def append_lab_results_to_excel(extracted_data):
     """
-    Append lab test results from extracted data to Excel file
+    Append lab test results from extracted data to the results store
+
+    Rows are written to the append-only store; the Excel file is rebuilt
+    from it on demand by export_excel().
     
     Args:
         extracted_data: Dictionary containing patient info and lab tests
     
     Returns:
         Number of rows added
+
+    Raises:
+        Exception: Store errors (locked or unwritable database) are re-raised,
+            so callers do not record the upload as stored
     """
     initialize_excel()
     
+    new_rows = build_excel_rows(extracted_data)
+    if not new_rows:
+        print("⚠ No lab tests found to add to Excel")
+        return 0
+    
+    try:
+        with timed("append_results"):
+            rows_added = append_rows(new_rows)
+        metrics.inc("rows_appended_total", rows_added)
+        print(f"✓ Added {rows_added} lab test records to Excel")
+        return rows_added
+        
+    except Exception as e:
+        print(f"✗ Error appending to Excel: {str(e)}")
+        raise
+
+
+def append_lab_results_batch(extracted_reports):
+    """
+    Append the lab results of several reports in one store transaction
+
+    Args:
+        extracted_reports: List of extract_all results
+
+    Returns:
+        List with the number of rows added for each report
+    """
+    initialize_excel()
+
+    rows_per_report = []
+    new_rows = []
+    for extracted_data in extracted_reports:
+        rows = build_excel_rows(extracted_data)
+        rows_per_report.append(len(rows))
+        new_rows.extend(rows)
+
+    if new_rows:
+        with timed("append_results"):
+            append_rows(new_rows)
+        metrics.inc("rows_appended_total", len(new_rows))
+        print(f"✓ Added {len(new_rows)} lab test records from {len(extracted_reports)} reports to Excel")
+    return rows_per_report
+
+
+def build_excel_rows(extracted_data):
+    """Flatten extracted data into one row per lab test"""
     patient_info = extracted_data.get('patient_information', {})
     order_info = extracted_data.get('order_information', {})
     lab_tests = extracted_data.get('lab_tests', [])
     
-    if not lab_tests:
-        print("⚠ No lab tests found to add to Excel")
-        return 0
-    
     # Prepare rows for Excel
     new_rows = []
     extraction_date = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
@@ -103,7 +240,8 @@ def append_lab_results_to_excel(extracted_data):
             'Test_Value': test.get('value', 'N/A'),
             'Unit': test.get('unit', 'N/A'),
             'Reference_Range': test.get('reference_range', 'N/A'),
-            'Status': test.get('status', 'N/A'),
+            # The store re-flags from the marker status (see flag_lab_tests)
+            'Status': test.get('marker_status', test.get('status', 'N/A')),
             'Bill_No': order_info.get('bill_no', 'N/A'),
             'Facility': order_info.get('facility', 'N/A'),
             'Sample_No': order_info.get('sample_no', 'N/A'),
@@ -113,27 +251,38 @@ def append_lab_results_to_excel(extracted_data):
         }
         new_rows.append(row)
     
-    # Read existing data and append new rows
-    try:
-        existing_df = pd.read_excel(EXCEL_FILE_PATH)
-        new_df = pd.DataFrame(new_rows)
-        combined_df = pd.concat([existing_df, new_df], ignore_index=True)
-        combined_df.to_excel(EXCEL_FILE_PATH, index=False, sheet_name='Lab Results')
-        
-        # Apply formatting
-        format_excel_file()
-        
-        print(f"✓ Added {len(new_rows)} lab test records to Excel")
-        return len(new_rows)
-        
-    except Exception as e:
-        print(f"✗ Error appending to Excel: {str(e)}")
-        return 0
+    return new_rows
+
+
+def flag_lab_tests(extracted_data):
+    """
+    Give the extracted lab tests the status the results store records
+
+    Each test's status is replaced by the range-based one from the value
+    normalizer; the status read from the report's markers is kept as
+    marker_status. Safe to call more than once.
+
+    Args:
+        extracted_data: Dictionary containing patient info and lab tests
+
+    Returns:
+        The same dictionary, updated in place
+    """
+    rows = build_excel_rows(extracted_data)
+    if not rows:
+        return extracted_data
+
+    flagged, _ = normalize_rows([tuple(row.get(column) for column in RESULT_COLUMNS) for row in rows])
+    status_index = RESULT_COLUMNS.index('Status')
+    for test, row, values in zip(extracted_data['lab_tests'], rows, flagged):
+        test['marker_status'] = row['Status']
+        test['status'] = values[status_index]
+    return extracted_data
 
 
 def get_excel_stats():
-    """Get statistics about the Excel file"""
-    if not os.path.exists(EXCEL_FILE_PATH):
+    """Get statistics about the stored lab results (O(1) running counters)"""
+    if not has_results():
         return {
             'exists': False,
             'total_records': 0,
@@ -141,11 +290,10 @@ def get_excel_stats():
         }
     
     try:
-        df = pd.read_excel(EXCEL_FILE_PATH)
+        initialize_excel()
         return {
             'exists': True,
-            'total_records': len(df),
-            'unique_patients': df['Patient_Name'].nunique() if 'Patient_Name' in df.columns else 0,
+            **get_stats(),
             'file_path': EXCEL_FILE_PATH
         }
     except Exception as e:
@@ -153,3 +301,15 @@ def get_excel_stats():
             'exists': True,
             'error': str(e)
         }
+
+
+def rebuild_excel_stats():
+    """Recompute the running statistics from the stored rows"""
+    initialize_excel()
+    stats = rebuild_stats()
+    print(f"✓ Rebuilt statistics: {stats['total_records']} records, {stats['unique_patients']} patients")
+    return {
+        'exists': True,
+        **stats,
+        'file_path': EXCEL_FILE_PATH
+    }
@@ -1,52 +1,416 @@
+import io
+import multiprocessing
 import os
-from PIL import Image
-import pytesseract
-from pdf2image import convert_from_path
-from docx import Document
-import PyPDF2
-
-def extract_from_txt(file_path):
-    with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
+import tempfile
+import time
+import zipfile
+from collections import deque
+from xml.parsers import expat
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack, contextmanager
+from model.metrics import call_collecting_metrics, metrics, timed
+
+# The extraction backends (PIL, pytesseract, pdf2image, PyPDF2)
+# and the OCR helpers that need numpy are imported inside the functions that
+# use them, so importing this module (and app.py) stays cheap
+
+# Worker processes used to OCR scanned PDF pages (1 = OCR pages sequentially)
+OCR_WORKERS = int(os.environ.get("OCR_WORKERS", min(4, os.cpu_count() or 1)))
+
+# Image extensions that go through OCR
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg")
+
+# Set OCR_LAYOUT=1 to read image tables from tesseract word boxes instead of line text
+OCR_LAYOUT = os.environ.get("OCR_LAYOUT", "0").lower() in ("1", "true", "yes", "on")
+
+# PDF pages whose text layer has fewer non-whitespace characters than this are OCR'd
+MIN_PAGE_TEXT_CHARS = int(os.environ.get("MIN_PAGE_TEXT_CHARS", 20))
+
+# Resolution scanned PDF pages are rasterized at before OCR preprocessing
+PDF_OCR_DPI = int(os.environ.get("PDF_OCR_DPI", 200))
+
+# Directory for the temporary files pdf2image needs (system default if unset)
+TEMP_DIR = os.environ.get("UPLOAD_TMP_DIR") or None
+
+# Path of the tesseract binary, if it is not on PATH (e.g. on Windows:
+# C:\Program Files\Tesseract-OCR\tesseract.exe)
+TESSERACT_CMD = os.environ.get("TESSERACT_CMD")
+
+# WordprocessingML namespace, as expat prefixes tag names with it
+WORD_NAMESPACE = "http://schemas.openxmlformats.org/wordprocessingml/2006/main "
+
+# Legacy copy of mc:AlternateContent, skipped so its text is not read twice
+MARKUP_FALLBACK = "http://schemas.openxmlformats.org/markup-compatibility/2006 Fallback"
+
+# Placed between table cells when a DOCX table row becomes one line
+DOCX_CELL_SEPARATOR = "  "
+
+# Extension -> extractor, filled in by register_extractor
+EXTRACTORS = {}
+
+_ocr_pool = None
+
+def register_extractor(*extensions):
+    """Decorator registering an extractor function for the given file extensions"""
+    def register(extractor):
+        for ext in extensions:
+            EXTRACTORS[ext.lower()] = extractor
+        return extractor
+    return register
+
+def load_pytesseract():
+    """Import pytesseract on first OCR use, pointing it at TESSERACT_CMD if set"""
+    import pytesseract
+    if TESSERACT_CMD:
+        pytesseract.pytesseract.tesseract_cmd = TESSERACT_CMD
+    return pytesseract
+
+# Every extract_from_* accepts a file path or a binary file object (e.g. BytesIO)
+
+@register_extractor(".txt")
+def extract_from_txt(source):
+    if hasattr(source, "read"):
+        return source.read().decode('utf-8', errors='ignore')
+    with open(source, 'r', encoding='utf-8', errors='ignore') as f:
         return f.read()
 
-def extract_from_docx(file_path):
-    doc = Document(file_path)
-    return "\n".join([p.text for p in doc.paragraphs])
+@register_extractor(".docx")
+def extract_from_docx(source):
+    """
+    Extract DOCX text, including tables, in document order
+
+    word/document.xml is streamed out of the zip through expat: no element
+    tree is built, only the text of the paragraph and table row being read
+    is held, so memory stays flat however long the document is. Each table
+    row becomes one line with its cells joined by DOCX_CELL_SEPARATOR, which
+    the line-based lab test patterns match like a text report row.
+    """
+    w = WORD_NAMESPACE
+    TEXT, PARAGRAPH, RUN, TAB = w + "t", w + "p", w + "r", w + "tab"
+    # Paragraph properties hold tab stop definitions (w:tabs/w:tab), not text
+    PARAGRAPH_PROPERTIES = w + "pPr"
+    BREAKS = (w + "br", w + "cr")
+    TABLE, ROW, CELL = w + "tbl", w + "tr", w + "tc"
+
+    lines = []
+    # Runs of the open paragraphs (text boxes nest a paragraph inside another)
+    paragraphs = []
+    cell_paragraphs = []
+    row_cells = []
+    table_depth = 0
+    fallback_depth = 0
+    run_depth = 0
+    properties_depth = 0
+    in_text = False
+
+    def start(tag, attrs):
+        nonlocal table_depth, fallback_depth, run_depth, properties_depth, in_text
+        if tag == MARKUP_FALLBACK:
+            # Legacy duplicate of the preceding mc:Choice content
+            fallback_depth += 1
+        elif fallback_depth:
+            return
+        elif tag == TEXT:
+            in_text = True
+        elif tag == PARAGRAPH:
+            paragraphs.append([])
+        elif tag == RUN:
+            run_depth += 1
+        elif tag == PARAGRAPH_PROPERTIES:
+            properties_depth += 1
+        elif not paragraphs and tag in (TABLE, ROW, CELL):
+            if tag == TABLE:
+                table_depth += 1
+            elif table_depth == 1:
+                (row_cells if tag == ROW else cell_paragraphs).clear()
+        elif tag == TAB and paragraphs and run_depth and not properties_depth:
+            paragraphs[-1].append("\t")
+        elif tag in BREAKS and paragraphs:
+            paragraphs[-1].append("\n")
+
+    def end(tag):
+        nonlocal table_depth, fallback_depth, run_depth, properties_depth, in_text
+        if tag == MARKUP_FALLBACK:
+            fallback_depth -= 1
+        elif fallback_depth:
+            return
+        elif tag == TEXT:
+            in_text = False
+        elif tag == RUN:
+            run_depth -= 1
+        elif tag == PARAGRAPH_PROPERTIES:
+            properties_depth -= 1
+        elif tag == PARAGRAPH:
+            text = "".join(paragraphs.pop())
+            # Nested tables are flattened into the outer cell
+            if table_depth:
+                cell_paragraphs.append(text)
+            else:
+                lines.append(text)
+        elif paragraphs:
+            return
+        elif tag == CELL and table_depth == 1:
+            row_cells.append(" ".join(" ".join(cell_paragraphs).split()))
+        elif tag == ROW and table_depth == 1:
+            lines.append(DOCX_CELL_SEPARATOR.join(cell for cell in row_cells if cell))
+        elif tag == TABLE:
+            table_depth -= 1
+
+    def data(text):
+        if in_text and paragraphs and not fallback_depth:
+            paragraphs[-1].append(text)
+
+    parser = expat.ParserCreate(namespace_separator=" ")
+    parser.buffer_text = True
+    parser.StartElementHandler = start
+    parser.EndElementHandler = end
+    parser.CharacterDataHandler = data
+    with zipfile.ZipFile(source) as archive, archive.open("word/document.xml") as document:
+        parser.ParseFile(document)
+
+    return "\n".join(lines)
 
-def extract_from_pdf(file_path):
-    text = ""
+@contextmanager
+def as_file_path(source, suffix=""):
+    """
+    Yield a filesystem path for source
+
+    Paths are passed through; file objects are copied to a uniquely named
+    temporary file that is deleted when the block exits.
+    """
+    if not hasattr(source, "read"):
+        yield source
+        return
+
+    source.seek(0)
+    fd, tmp_path = tempfile.mkstemp(suffix=suffix, dir=TEMP_DIR)
     try:
-        reader = PyPDF2.PdfReader(file_path)
-        for page in reader.pages:
-            page_text = page.extract_text()
-            if page_text:
-                text += page_text + "\n"
-    except:
-        pass
-
-    if text.strip():
-        return text
-
-    # OCR fallback
-    images = convert_from_path(file_path)
-    ocr_text = ""
-    for img in images:
-        ocr_text += pytesseract.image_to_string(img) + "\n"
-    return ocr_text
-
-def extract_from_image(file_path):
-    img = Image.open(file_path)
-    return pytesseract.image_to_string(img)
-
-def extract_text(file_path):
-    ext = os.path.splitext(file_path)[1].lower()
-    if ext == ".txt":
-        return extract_from_txt(file_path)
-    elif ext == ".docx":
-        return extract_from_docx(file_path)
-    elif ext == ".pdf":
-        return extract_from_pdf(file_path)
-    elif ext in [".png", ".jpg", ".jpeg"]:
-        return extract_from_image(file_path)
-    else:
+        with os.fdopen(fd, "wb") as tmp:
+            while True:
+                chunk = source.read(1024 * 1024)
+                if not chunk:
+                    break
+                tmp.write(chunk)
+        yield tmp_path
+    finally:
+        os.remove(tmp_path)
+
+def has_usable_text(page_text):
+    """True if a PDF page's text layer is worth keeping instead of OCR"""
+    return bool(page_text) and len("".join(page_text.split())) >= MIN_PAGE_TEXT_CHARS
+
+def iter_pdf_pages(source, workers=None):
+    """
+    Yield the text of each PDF page, in page order
+
+    Pages with a usable embedded text layer are read directly; only the
+    remaining (scanned) pages are rasterized and OCR'd. OCR runs a few pages
+    ahead in the pool while earlier pages are consumed, so only that window
+    of pages is held in memory and the caller can work on the first pages
+    of a long file before the last ones are read.
+
+    Args:
+        source: Path or binary file object
+        workers: Override for OCR_WORKERS (1 OCRs pages in turn)
+    """
+    import PyPDF2
+
+    workers = OCR_WORKERS if workers is None else workers
+    # Page texts and OCR futures not yet yielded, in page order
+    window = max(workers, 1) * 2
+    pending = deque()
+    text_seconds = ocr_seconds = 0.0
+
+    def resolve(item):
+        nonlocal ocr_seconds
+        if isinstance(item, str):
+            return item
+        start = time.perf_counter()
+        try:
+            page_text, recorded = item.result()
+        finally:
+            ocr_seconds += time.perf_counter() - start
+        # Timings of the OCR stages, recorded in the pool process
+        metrics.merge(recorded)
+        return page_text
+
+    with ExitStack() as stack:
+        file_path = None
+
+        def ocr_file_path():
+            # OCR fallback for the missing pages (pdf2image/poppler needs a real file)
+            nonlocal file_path
+            if file_path is None:
+                metrics.inc("ocr_fallbacks_total")
+                file_path = stack.enter_context(as_file_path(source, suffix=".pdf"))
+            return file_path
+
+        try:
+            start = time.perf_counter()
+            try:
+                pages = PyPDF2.PdfReader(source).pages
+                page_count = len(pages)
+            except:
+                from pdf2image import pdfinfo_from_path
+                # Unreadable by PyPDF2: OCR every page
+                pages = None
+                page_count = pdfinfo_from_path(ocr_file_path())["Pages"]
+            text_seconds += time.perf_counter() - start
+
+            for number in range(1, page_count + 1):
+                page_text = None
+                if pages is not None:
+                    start = time.perf_counter()
+                    try:
+                        page_text = pages[number - 1].extract_text() or ""
+                    except:
+                        page_text = None
+                    text_seconds += time.perf_counter() - start
+
+                if has_usable_text(page_text):
+                    metrics.inc("pdf_text_pages_total")
+                    pending.append(page_text)
+                else:
+                    metrics.inc("pages_ocr_total")
+                    if workers <= 1:
+                        start = time.perf_counter()
+                        pending.append(ocr_pdf_page(ocr_file_path(), number))
+                        ocr_seconds += time.perf_counter() - start
+                    else:
+                        pending.append(get_ocr_pool().submit(
+                            call_collecting_metrics, ocr_pdf_page, ocr_file_path(), number
+                        ))
+
+                # Hand out finished pages; wait on OCR only once the window is full
+                while pending and (isinstance(pending[0], str) or len(pending) >= window):
+                    yield resolve(pending.popleft())
+
+            while pending:
+                yield resolve(pending.popleft())
+        finally:
+            # The caller stopped early: drop OCR that has not started
+            for item in pending:
+                if not isinstance(item, str):
+                    item.cancel()
+            metrics.observe("pdf_text_layer", text_seconds)
+            if file_path is not None:
+                metrics.observe("pdf_ocr", ocr_seconds)
+
+@register_extractor(".pdf")
+def extract_from_pdf(source):
+    """Extract PDF text page by page (see iter_pdf_pages)"""
+    return "".join(page_text + "\n" for page_text in iter_pdf_pages(source))
+
+def ocr_pdf_page(file_path, page_number):
+    """Rasterize and OCR a single PDF page (1-based)"""
+    from pdf2image import convert_from_path
+
+    images = convert_from_path(
+        file_path, dpi=PDF_OCR_DPI, first_page=page_number, last_page=page_number, grayscale=True
+    )
+    return "".join(ocr_image(img) for img in images)
+
+def ocr_image(img, preprocess=None, config=None):
+    """
+    Run tesseract on a PIL image
+
+    Args:
+        img: PIL image
+        preprocess: Clean up the image first (defaults to OCR_PREPROCESS)
+        config: Tesseract options (defaults to OCR_CONFIG)
+    """
+    from model import ocr_preprocess
+
+    if preprocess is None:
+        preprocess = ocr_preprocess.OCR_PREPROCESS
+    if preprocess:
+        with timed("ocr_preprocess"):
+            img = ocr_preprocess.preprocess_for_ocr(img)
+    if config is None:
+        config = ocr_preprocess.OCR_CONFIG
+    return load_pytesseract().image_to_string(img, config=config)
+
+def get_ocr_pool():
+    """
+    Process pool shared by OCR requests, created on first use
+
+    Workers are spawned rather than forked: the server process runs request
+    threads, and a fork could copy a lock another thread holds.
+    """
+    global _ocr_pool
+    if _ocr_pool is None:
+        _ocr_pool = ProcessPoolExecutor(max_workers=OCR_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _ocr_pool
+
+@register_extractor(*IMAGE_EXTENSIONS)
+def extract_from_image(source):
+    from PIL import Image
+
+    img = Image.open(source)
+    metrics.inc("pages_ocr_total")
+    with timed("image_ocr"):
+        return ocr_image(img)
+
+def extract_layout_from_image(source):
+    """OCR an image into an OcrLayout (text plus lab tests read from word boxes)"""
+    from PIL import Image
+    from model import ocr_preprocess
+    from model.ocr_layout import layout_from_words, words_from_data
+
+    img = Image.open(source)
+    metrics.inc("pages_ocr_total")
+    with timed("image_ocr_layout"):
+        if ocr_preprocess.OCR_PREPROCESS:
+            with timed("ocr_preprocess"):
+                img = ocr_preprocess.preprocess_for_ocr(img)
+        pytesseract = load_pytesseract()
+        data = pytesseract.image_to_data(
+            img, config=ocr_preprocess.OCR_CONFIG, output_type=pytesseract.Output.DICT
+        )
+        return layout_from_words(words_from_data(data))
+
+# File extensions extract_text can handle
+SUPPORTED_EXTENSIONS = tuple(EXTRACTORS)
+
+def extract_text(file_path, filename=None):
+    """
+    Extract text from a file path or a binary file object
+
+    Args:
+        file_path: Path, or a binary file object such as BytesIO
+        filename: Name used to pick the extractor (defaults to file_path)
+    """
+    ext = os.path.splitext(filename or file_path)[1].lower()
+    extractor = EXTRACTORS.get(ext)
+    if extractor is None:
         return ""
+    return extractor(file_path)
+
+def iter_text_pages(file_path, filename=None):
+    """
+    Yield the text of a document page by page
+
+    PDFs are read one page at a time (iter_pdf_pages); other formats are
+    extracted whole and yielded as a single page.
+    """
+    ext = os.path.splitext(filename or file_path)[1].lower()
+    if EXTRACTORS.get(ext) is extract_from_pdf:
+        yield from iter_pdf_pages(file_path)
+    else:
+        yield extract_text(file_path, filename)
+
+def extract_text_from_bytes(data, filename):
+    """Extract text from uploaded bytes without writing them to disk"""
+    return extract_text(io.BytesIO(data), filename=filename)
+
+def extract_text_with_layout(data, filename):
+    """
+    Extract text from uploaded bytes, with an OcrLayout for images when OCR_LAYOUT is on
+
+    Returns:
+        Tuple of (text, OcrLayout or None)
+    """
+    if OCR_LAYOUT and os.path.splitext(filename)[1].lower() in IMAGE_EXTENSIONS:
+        layout = extract_layout_from_image(io.BytesIO(data))
+        return layout.text, layout
+    return extract_text_from_bytes(data, filename), None
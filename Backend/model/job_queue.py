@@ -0,0 +1,135 @@
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+from contextlib import closing
+from model.results_store import get_connection, initialize_store, write_transaction
+
+# Worker threads running queued analyses (per server process)
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", 2))
+# Jobs allowed to wait for a worker before submissions are rejected (all processes)
+JOB_QUEUE_SIZE = int(os.environ.get("JOB_QUEUE_SIZE", 32))
+# Finished jobs kept for polling (oldest are dropped first)
+JOB_HISTORY_SIZE = int(os.environ.get("JOB_HISTORY_SIZE", 1000))
+# Seconds after which an unfinished job is failed (its server process has likely exited)
+JOB_TIMEOUT = int(os.environ.get("JOB_TIMEOUT", 3600))
+
+JOB_FIELDS = ('id', 'status', 'submitted_at', 'started_at', 'finished_at', 'result', 'error')
+
+
+class QueueFullError(Exception):
+    """Raised when the job queue has no room for another job"""
+
+
+class JobQueue:
+    """
+    Job queue run by a pool of worker threads, with job state in the results store
+
+    Jobs run on the threads of the process that accepted them, but their
+    status and results live in the store's jobs table, so with several
+    server processes (gunicorn -w N) any of them can answer a poll and the
+    max_pending limit applies to all of them together. OCR runs in
+    subprocesses, so threads are enough to overlap jobs without a broker.
+    """
+
+    def __init__(self, workers=JOB_WORKERS, max_pending=JOB_QUEUE_SIZE, history_size=JOB_HISTORY_SIZE,
+                 timeout=JOB_TIMEOUT):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.history_size = history_size
+        self.timeout = timeout
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._threads = []
+
+    def submit(self, func, *args, **kwargs):
+        """
+        Queue func(*args, **kwargs) for a worker
+
+        func must return something JSON-serializable; it is stored as the
+        job's result.
+
+        Returns:
+            Job id to poll with get()
+
+        Raises:
+            QueueFullError: If max_pending jobs are already waiting
+        """
+        self._start_workers()
+        initialize_store()
+        job_id = uuid.uuid4().hex
+        with write_transaction() as conn:
+            self._expire(conn)
+            pending = conn.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()[0]
+            if pending >= self.max_pending:
+                raise QueueFullError("Job queue is full, retry later")
+            conn.execute(
+                "INSERT INTO jobs (id, status, submitted_at) VALUES (?, 'queued', ?)",
+                (job_id, time.time())
+            )
+            self._prune(conn)
+        self._queue.put((job_id, func, args, kwargs))
+        return job_id
+
+    def get(self, job_id):
+        """Return a snapshot of the job, or None if it is unknown"""
+        initialize_store()
+        with closing(get_connection()) as conn:
+            row = conn.execute(f"SELECT {', '.join(JOB_FIELDS)} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(zip(JOB_FIELDS, row))
+        if job['result'] is not None:
+            job['result'] = json.loads(job['result'])
+        return job
+
+    def pending(self):
+        """Number of jobs waiting for a worker in any process"""
+        initialize_store()
+        with closing(get_connection()) as conn:
+            return conn.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()[0]
+
+    def _start_workers(self):
+        with self._lock:
+            while len(self._threads) < self.workers:
+                thread = threading.Thread(target=self._worker, daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def _worker(self):
+        while True:
+            job_id, func, args, kwargs = self._queue.get()
+            try:
+                self._set(job_id, status='running', started_at=time.time())
+                result = json.dumps(func(*args, **kwargs), default=str)
+                self._set(job_id, status='done', result=result, finished_at=time.time())
+            except Exception as e:
+                self._set(job_id, status='failed', error=str(e), finished_at=time.time())
+            finally:
+                self._queue.task_done()
+
+    def _set(self, job_id, **fields):
+        with write_transaction() as conn:
+            conn.execute(
+                f"UPDATE jobs SET {', '.join(f'{field} = ?' for field in fields)} WHERE id = ?",
+                (*fields.values(), job_id)
+            )
+
+    def _expire(self, conn):
+        """Fail jobs left unfinished by a process that exited, so they free their slot"""
+        now = time.time()
+        conn.execute(
+            "UPDATE jobs SET status = 'failed', error = 'Job timed out', finished_at = ? "
+            "WHERE status IN ('queued', 'running') AND submitted_at < ?",
+            (now, now - self.timeout)
+        )
+
+    def _prune(self, conn):
+        """Drop the oldest finished jobs beyond history_size"""
+        conn.execute(
+            "DELETE FROM jobs WHERE id IN (SELECT id FROM jobs WHERE status IN ('done', 'failed') "
+            "ORDER BY finished_at DESC LIMIT -1 OFFSET ?)",
+            (self.history_size,)
+        )
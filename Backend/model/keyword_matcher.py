@@ -0,0 +1,161 @@
+import re
+from collections import deque, namedtuple
+
+# A keyword found in text: character offsets, the vocabulary term and its value
+KeywordMatch = namedtuple('KeywordMatch', ['start', 'end', 'term', 'value'])
+
+WORD_PATTERN = re.compile(r'\w+')
+
+# Vocabularies with at most this many distinct words are searched with one
+# precompiled pattern; larger ones first look up which words occur at all
+PRECOMPILED_WORD_LIMIT = 200
+
+
+def tokenize(term):
+    """Lowercase word tokens of a term ("Vitamin K" -> ["vitamin", "k"])"""
+    return WORD_PATTERN.findall(term.lower())
+
+
+class KeywordMatcher:
+    """
+    Aho-Corasick automaton over word tokens
+
+    Terms are split into lowercase words, so every match starts and ends on
+    a word boundary and punctuation or extra spaces between the words of a
+    multi-word term are ignored; the words must be on one line. The cost of a scan depends on the text, not
+    on the number of terms: the vocabulary words in the text are located in
+    C (one precompiled pattern for small vocabularies, a tokenize-and-
+    intersect pass for large ones) and the automaton only steps through
+    those occurrences.
+    """
+
+    def __init__(self, terms):
+        """
+        Args:
+            terms: Iterable of terms, or of (term, value) pairs; value
+                defaults to the term and is returned with every match
+        """
+        self._goto = [{}]
+        self._fail = [0]
+        self._outputs = [[]]
+        self._words = set()
+        self.terms = []
+
+        for entry in terms:
+            term, value = entry if isinstance(entry, tuple) else (entry, entry)
+            tokens = tokenize(term)
+            if not tokens:
+                continue
+            state = 0
+            for token in tokens:
+                next_state = self._goto[state].get(token)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._outputs.append([])
+                    self._goto[state][token] = next_state
+                state = next_state
+            self._outputs[state].append((len(tokens), term, value))
+            self._words.update(tokens)
+            self.terms.append(term)
+
+        self._build_fail_links()
+        self._patterns = None
+        if len(self._words) <= PRECOMPILED_WORD_LIMIT:
+            self._patterns = self._word_patterns(self._words)
+
+    @staticmethod
+    def _word_patterns(words):
+        """Pattern matching any of words as a whole word, plus its case-insensitive twin"""
+        words = sorted(words, key=len, reverse=True)
+        # The leading character class lets the engine skip most positions
+        guard = '[' + ''.join(sorted({re.escape(word[0]) for word in words})) + ']'
+        source = r'(?<!\w)(?=' + guard + r')(?:' + '|'.join(re.escape(word) for word in words) + r')(?!\w)'
+        return re.compile(source), re.compile(source, re.IGNORECASE)
+
+    def _build_fail_links(self):
+        pending = deque(self._goto[0].values())
+        while pending:
+            state = pending.popleft()
+            for token, child in self._goto[state].items():
+                pending.append(child)
+                fallback = self._fail[state]
+                while fallback and token not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[child] = self._goto[fallback].get(token, 0)
+                # A node also reports every term that ends at its failure node
+                self._outputs[child] = self._outputs[child] + self._outputs[self._fail[child]]
+
+    def find_all(self, text):
+        """
+        Every term occurrence in text, in order of where it ends
+
+        Returns:
+            List of KeywordMatch (overlapping terms are all reported)
+        """
+        if not self._words:
+            return []
+        lowered = text.lower()
+        patterns = self._patterns
+        if patterns is None:
+            present = self._words.intersection(WORD_PATTERN.findall(lowered))
+            if not present:
+                return []
+            patterns = self._word_patterns(present)
+
+        # Offsets must line up with text, so scan it case-insensitively when
+        # lowercasing changes its length
+        if len(lowered) == len(text):
+            source, occurrences, ignore_case = lowered, patterns[0], False
+        else:
+            source, occurrences, ignore_case = text, patterns[1], True
+
+        goto, fail, outputs = self._goto, self._fail, self._outputs
+        matches = []
+        state = 0
+        run_starts = []
+        previous_end = None
+        for occurrence in occurrences.finditer(source):
+            start, end = occurrence.span()
+            # Another word or a line break in between ends any multi-word term in progress
+            if previous_end is not None and (source.find('\n', previous_end, start) != -1
+                                             or WORD_PATTERN.search(source, previous_end, start)):
+                state = 0
+                run_starts = []
+            run_starts.append(start)
+            previous_end = end
+
+            word = occurrence.group(0).lower() if ignore_case else occurrence.group(0)
+            while state and word not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(word, 0)
+            for length, term, value in outputs[state]:
+                matches.append(KeywordMatch(run_starts[-length], end, term, value))
+        return matches
+
+    def find_values(self, text):
+        """Distinct values of the terms found in text"""
+        return {match.value for match in self.find_all(text)}
+
+
+def load_vocabulary(path):
+    """
+    Read terms from a text file
+
+    One term per line, optionally followed by a tab and the value to report
+    for it (e.g. "anaemia<TAB>Anemia"); blank lines and lines starting with
+    # are skipped.
+
+    Returns:
+        List of (term, value) pairs
+    """
+    terms = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            term, _, value = line.partition('\t')
+            terms.append((term.strip(), value.strip() or term.strip()))
+    return terms
@@ -0,0 +1,167 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# Samples kept per stage for quantile estimates (most recent wins)
+SAMPLE_WINDOW = 2048
+QUANTILES = (0.5, 0.95, 0.99)
+METRIC_PREFIX = "medextract"
+
+# Counter name -> help text
+COUNTERS = {
+    'requests_total': "Reports processed by /analyze",
+    'ocr_fallbacks_total': "PDFs with pages lacking a usable text layer that fell back to OCR",
+    'pages_ocr_total': "Pages (or images) run through tesseract",
+    'pdf_text_pages_total': "PDF pages read from the embedded text layer",
+    'rows_appended_total': "Lab result rows appended to the results store",
+    'rows_exported_total': "Lab result rows streamed by the Parquet/Arrow export",
+    'extractions_degraded_total': "Reports whose extraction ran out of EXTRACT_TIME_BUDGET",
+    'reports_split_total': "Per-patient reports extracted from batched multi-report files",
+}
+
+
+class Metrics:
+    """Thread-safe stage timers and counters with Prometheus text output"""
+
+    def __init__(self, sample_window=SAMPLE_WINDOW):
+        self.sample_window = sample_window
+        self._lock = threading.Lock()
+        self._samples = {}
+        self._sums = {}
+        self._counts = {}
+        self._counters = {}
+
+    def observe(self, stage, seconds, **labels):
+        key = (stage, tuple(sorted(labels.items())))
+        with self._lock:
+            if key not in self._samples:
+                self._samples[key] = deque(maxlen=self.sample_window)
+                self._sums[key] = 0.0
+                self._counts[key] = 0
+            self._samples[key].append(seconds)
+            self._sums[key] += seconds
+            self._counts[key] += 1
+
+    @contextmanager
+    def timed(self, stage, **labels):
+        """Time the wrapped block as one observation of stage"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start, **labels)
+
+    def inc(self, counter, value=1, **labels):
+        key = (counter, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def snapshot(self):
+        """Per-stage quantiles plus counters, as plain dicts"""
+        with self._lock:
+            stages = {
+                key: (sorted(samples), self._sums[key], self._counts[key])
+                for key, samples in self._samples.items()
+            }
+            counters = dict(self._counters)
+
+        stage_stats = []
+        for (stage, labels), (samples, total, count) in sorted(stages.items()):
+            stage_stats.append({
+                'stage': stage,
+                'labels': dict(labels),
+                'quantiles': {q: _quantile(samples, q) for q in QUANTILES},
+                'sum': total,
+                'count': count
+            })
+        return {'stages': stage_stats, 'counters': counters}
+
+    def render_prometheus(self):
+        """Render all metrics in the Prometheus text exposition format"""
+        snapshot = self.snapshot()
+        name = f"{METRIC_PREFIX}_stage_seconds"
+        lines = [
+            f"# HELP {name} Time spent in each pipeline stage",
+            f"# TYPE {name} summary",
+        ]
+        for stat in snapshot['stages']:
+            labels = {'stage': stat['stage'], **stat['labels']}
+            for q, value in stat['quantiles'].items():
+                lines.append(f"{name}{_format_labels({**labels, 'quantile': q})} {value:.6f}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {stat['sum']:.6f}")
+            lines.append(f"{name}_count{_format_labels(labels)} {stat['count']}")
+
+        for counter, help_text in COUNTERS.items():
+            name = f"{METRIC_PREFIX}_{counter}"
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} counter")
+            values = [(labels, value) for (key, labels), value in snapshot['counters'].items() if key == counter]
+            for labels, value in sorted(values) or [((), 0)]:
+                lines.append(f"{name}{_format_labels(dict(labels))} {value}")
+        return "\n".join(lines) + "\n"
+
+    def drain(self):
+        """
+        Remove and return the samples and counters recorded so far
+
+        Used in worker processes, whose registry the /metrics route never
+        sees; the parent hands the result to merge().
+        """
+        with self._lock:
+            drained = {
+                'samples': {key: list(samples) for key, samples in self._samples.items()},
+                'counters': dict(self._counters),
+            }
+        self.reset()
+        return drained
+
+    def merge(self, drained):
+        """Record what drain() returned in another process"""
+        for (stage, labels), samples in drained['samples'].items():
+            for seconds in samples:
+                self.observe(stage, seconds, **dict(labels))
+        for (counter, labels), value in drained['counters'].items():
+            self.inc(counter, value, **dict(labels))
+
+    def reset(self):
+        with self._lock:
+            self._samples.clear()
+            self._sums.clear()
+            self._counts.clear()
+            self._counters.clear()
+
+
+def _quantile(sorted_samples, q):
+    if not sorted_samples:
+        return 0.0
+    index = min(len(sorted_samples) - 1, int(round(q * (len(sorted_samples) - 1))))
+    return sorted_samples[index]
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    parts = []
+    for key, value in labels.items():
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        parts.append(f'{key}="{value}"')
+    return "{" + ",".join(parts) + "}"
+
+
+# Process-wide registry used by the pipeline and the /metrics route
+metrics = Metrics()
+timed = metrics.timed
+
+
+def call_collecting_metrics(func, *args, **kwargs):
+    """
+    Run func in a pool worker process and return (result, drained metrics)
+
+    Submit this instead of func, then pass the metrics to metrics.merge()
+    in the parent. A worker runs one task at a time, so everything drained
+    was recorded by func.
+    """
+    metrics.drain()
+    result = func(*args, **kwargs)
+    return result, metrics.drain()
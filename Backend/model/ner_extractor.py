@@ -1,5 +1,260 @@
+import importlib
+import os
 import re
+import threading
+import time
+from bisect import bisect_right
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from functools import lru_cache
+from itertools import accumulate
+from model.keyword_matcher import KeywordMatcher, load_vocabulary
+from model.metrics import metrics, timed
+
+# ---------------------------------------------------------------------------
+# Pattern registry - every regex is compiled once at import time
+#
+# OCR output is often garbage (long runs of spaces, repeated labels, no
+# digits), so every pattern must run in linear time on any input:
+#   - a quantifier that can hand characters to the next one (\s* before \s*,
+#     a lazy name before \s+) is possessive (*+, ++), or steps over a whole
+#     whitespace run at once
+#   - a lazy gap or name is bounded, so a failed attempt costs at most
+#     MAX_GAP_CHARS / MAX_NAME_UNITS steps however often its label repeats
+# benchmarks/run_benchmarks.py --sections redos checks this on adversarial text.
+# ---------------------------------------------------------------------------
+
+# Longest stretch a pattern skips between a label and its value
+MAX_GAP_CHARS = 60
+# Longest name (letters, punctuation and whitespace runs) a pattern captures
+MAX_NAME_UNITS = 80
+
+# Lazy gap to the rest of the pattern, within the line
+NEAR = rf'[^\n]{{0,{MAX_GAP_CHARS}}}?'
+
+
+def _name(letters, stop):
+    """
+    Lazy name made of letters and whole whitespace runs, ending before stop
+
+    Matches like a lazy group of letters and whitespace followed by
+    whitespace + stop, but a whitespace run is one step, so trying the stop
+    at every space of a long run cannot go quadratic.
+    """
+    return rf'((?:[{letters}]|\s++(?!{stop})){{1,{MAX_NAME_UNITS}}}?)'
+
+
+NAME_PATTERNS = [
+    re.compile(rf'PATIENT\s+NAME\s*+[:=]?\s*+{_name("A-Z", "Age")}(?:\s+Age|UHID|IPID|Referred|$)', re.IGNORECASE),
+    re.compile(rf'Patient\s+Name\s*+[:=]\s*+{_name("A-Za-z.", "Age")}(?:\s+Age|UHID|$)', re.IGNORECASE),
+    re.compile(rf'Patient\s*+[:=]?\s*+{_name("A-Za-z.", "SIREESHA")}(?:\s+SIREESHA|$)', re.IGNORECASE),
+]
+
+AGE_SEX_PATTERNS = [
+    re.compile(rf'Age[/\\]Sex\s*+[:=]?\s*+(\d++)\s*+Year{NEAR}\(?(Male|Female)\)?', re.IGNORECASE),
+    re.compile(rf'Age\s*+[:=]?\s*+(\d++){NEAR}([MaleFemale]+)', re.IGNORECASE),
+    re.compile(rf'(\d{{2,3}})\s*+[Yy](?:ear)?{NEAR}([MaleFemale]+)', re.IGNORECASE),
+]
+
+UHID_PATTERNS = [
+    re.compile(r'(?:UHID|IPID|Patient\s*ID|MRN|Admn\s*No)\s*[:=]\s*([A-Z0-9\.\-]+)', re.IGNORECASE),
+]
+
+EPISODE_PATTERN = re.compile(r'Episode\s*[:=]\s*([A-Z0-9\-]+)', re.IGNORECASE)
+
+DOCTOR_PATTERNS = [
+    re.compile(rf'(?:Referred\s+By|Ref\.?\s*Doctor|By)\s*[:=]\s*+{_name("A-Za-z./", "Ward")}(?:\s+Ward|Date|Report|$)',
+               re.IGNORECASE),
+]
+
+PATIENT_FACILITY_PATTERNS = [
+    re.compile(r'(?:UDHRAN|Hospital)\s+HOSPITAL', re.IGNORECASE),
+    re.compile(r'PARIDHI\s+PATHOLOGY', re.IGNORECASE),
+    re.compile(r'DEPARTMENT\s+OF\s+PATHOLOGY', re.IGNORECASE),
+]
+
+# Date patterns
+DATE_PATTERN = r'(\d{1,2}[-/]\w{3}[-/]\d{2,4}(?:\s+\d{1,2}:\d{2}(?:\s*[ap]m)?)?)'
+BILL_DATE_PATTERN = re.compile(rf'Bill\s+Date\s*+[:=]?\s*+{DATE_PATTERN}', re.IGNORECASE)
+REPORT_DATE_PATTERN = re.compile(rf'(?:Report|REP)\s*+\.?\s*+(?:Date|DATE)\s*+[:=]?\s*+{DATE_PATTERN}', re.IGNORECASE)
+COLLECTION_DATE_PATTERN = re.compile(rf'(?:Collec\.?|Collection)\s*Date\s*+[:=]?\s*+{DATE_PATTERN}', re.IGNORECASE)
+SERVICE_NO_PATTERN = re.compile(r'Service\s*No\s*+[:=]?\s*+([A-Z0-9]+)', re.IGNORECASE)
+
+ORDER_FACILITY_PATTERNS = [
+    re.compile(r'(UDHRAN\s+HOSPITAL)', re.IGNORECASE),
+    re.compile(r'(PARIDHI\s+PATHOLOGY)', re.IGNORECASE),
+    re.compile(r'(DEPARTMENT\s+OF\s+PATHOLOGY)', re.IGNORECASE),
+]
+
+SECTION_HEADERS = [
+    'BIOCHEMISTRY', 'LFT', 'LIVER FUNCTION TEST', 'LIVER FUNCTION TESTS', 'DIFFERENTIAL COUNT', 'INVESTIGATIONS'
+]
+COLUMN_HEADERS = {'VALUE', 'UNIT', 'REF.RANGE', 'REFERENCE', 'RESULT', 'SPECIMEN', 'METHOD'}
+NON_TEST_NAMES = {'METHOD', 'NOTE', 'REMARKS', 'SAMPLE TYPE'}
+
+# Example: "TOTAL BILIRUBIN 1.8 mg/dl 0.4-1.0"
+# Whitespace runs in the name are single steps (a one-letter name may still
+# end inside one, as the name needs two characters). The unit is the whole
+# unit-character run when the rest of the line is a range; otherwise it
+# ends at a "/" and takes a suffix with digits ("mg/24hr")
+RANGE_CHARS = r'[\d\.\-<>\s:]'
+LAB_LINE_PATTERN = re.compile(
+    r'^([A-Z](?:\s(?=\s)|(?:[A-Za-z/\(\)\-\.,]|\s++)+?))\s+([\d\.]++)\s*+([↑↓\*]?[HL]?)?\s*+'
+    rf'([A-Za-z/%\^:]++(?={RANGE_CHARS}*+$)|[A-Za-z/%\^:]+/[A-Za-z0-9\^]++)\s*+({RANGE_CHARS}++)?$'
+)
+
+# Example: "Neutrophils. 58 20 - 45 %"
+DIFFERENTIAL_LINE_PATTERN = re.compile(
+    r'^((?:[A-Za-z\.]|\s++)+?)\s+([\d\.]+)\s+([↑↓]?)\s*([\d\.\-\s]+)\s*(%|IU/L|mg/dl|gm/dl|g/L|RATIO)?'
+)
+
+METHOD_INDICATOR_PATTERN = re.compile(rf'\(DPD\)|\(IFCC[^\)]{{0,{MAX_GAP_CHARS}}}\)|Amp Buffer\)')
+WHITESPACE_PATTERN = re.compile(r'\s+')
+
+# Region segmentation: lines that start a results table, a remarks block,
+# or a new report header (see segment_regions)
+
+def _lowercase_scanner(alternatives, prefix='', suffix=''):
+    """
+    Compile lowercase alternatives for scanning lowercased text
+
+    A leading character class (built from each alternative's first letter)
+    lets the engine skip most positions, which a case-insensitive
+    alternation cannot. Returns (pattern, case-insensitive twin); the twin
+    is for texts whose length changes when lowercased.
+    """
+    guard = '[' + ''.join(sorted({alternative[0] for alternative in alternatives})) + ']'
+    source = prefix + '(?=' + guard + ')(?:' + '|'.join(alternatives) + ')' + suffix
+    return re.compile(source), re.compile(source, re.IGNORECASE)
+
+
+RESULTS_COLUMN_WORDS = ['test', 'tests', 'investigation', 'result', 'results', 'value', 'unit', 'units',
+                        'ref', 'ref.range', 'reference', 'range', 'interval']
+COLUMN_WORD_SCANNER = _lowercase_scanner(
+    [re.escape(word) for word in RESULTS_COLUMN_WORDS], prefix=r'(?<!\S)', suffix=r'(?!\S)'
+)
+HEADER_LINE_SCANNER = _lowercase_scanner([
+    r'patient\s*name', 'uhid', 'ipid', r'episode\s*[:=]', r'age\s*[/\\:]', r'referred\s+by',
+    r'ref\.?\s*doctor', r'bill\s*(?:no|date)', r'collec\.?\s*date', r'collection\s*date',
+    r'report\s*date', r'service\s*no', 'hospital', 'pathology',
+])
+REMARKS_START_PATTERN = re.compile(
+    r'^[ \t\r\f\v]*(?:Remarks|Interpretation|Comments?|Note|Impression|Advice)\b', re.IGNORECASE | re.MULTILINE
+)
+
+# Keyword vocabularies, matched on word boundaries in one pass (see find_keywords).
+# Point DIAGNOSIS_VOCABULARY / MEDICATION_VOCABULARY at a vocabulary file
+# (one term per line, optionally "term<TAB>reported name") to replace the defaults.
+DEFAULT_DIAGNOSIS_TERMS = [
+    'diabetes', 'hypertension', 'anemia', 'liver disease',
+    'kidney disease', 'heart disease', 'hepatitis', 'cirrhosis',
+    'infection', 'inflammation'
+]
+DEFAULT_MEDICATION_TERMS = [
+    'aspirin', 'metformin', 'warfarin', 'heparin', 'vitamin k',
+    'paracetamol', 'antibiotic'
+]
+REPORT_TYPE_TERMS = [
+    'differential count', 'neutrophils', 'liver function', 'lft', 'sgot', 'sgpt',
+    'coagulation', 'pt', 'inr', 'cbc', 'complete blood count'
+]
+
+
+def _vocabulary(env_name, default_terms):
+    """(term, reported name) pairs from the file named by env_name, else the defaults"""
+    path = os.environ.get(env_name)
+    if path:
+        return load_vocabulary(path)
+    return [(term, term.title()) for term in default_terms]
+
+
+DIAGNOSIS_TERMS = _vocabulary("DIAGNOSIS_VOCABULARY", DEFAULT_DIAGNOSIS_TERMS)
+MEDICATION_TERMS = _vocabulary("MEDICATION_VOCABULARY", DEFAULT_MEDICATION_TERMS)
+
+# Reported names in vocabulary order, so output order does not depend on the text
+DIAGNOSIS_ORDER = {name: index for index, (_, name) in reversed(list(enumerate(DIAGNOSIS_TERMS)))}
+MEDICATION_ORDER = {name: index for index, (_, name) in reversed(list(enumerate(MEDICATION_TERMS)))}
+
+# One automaton for every vocabulary; match values are (category, name)
+KEYWORD_MATCHER = KeywordMatcher(
+    [(term, ('diagnosis', name)) for term, name in DIAGNOSIS_TERMS]
+    + [(term, ('medication', name)) for term, name in MEDICATION_TERMS]
+    + [(term, ('report_type', term)) for term in REPORT_TYPE_TERMS]
+    + [(header, ('section', header)) for header in SECTION_HEADERS]
+)
+
+CLINICAL_NOTE_PATTERNS = [
+    re.compile(r'Remarks[:=]?\s*(.*?)(?:Liver|Magnesium|COAGULATION|Method|DIFFERENTIAL|$)', re.IGNORECASE | re.DOTALL),
+    re.compile(r'Interpretation[:=]?\s*(.*?)(?:Note|Method|$)', re.IGNORECASE | re.DOTALL),
+    re.compile(r'Comments[:=]?\s*(.*?)(?:Method|$)', re.IGNORECASE | re.DOTALL),
+]
+
+# Fallback tests: keyword that starts the match, then the value pattern.
+# Keywords are also lowercased for the scanner, so avoid uppercase escapes (\S, \D, \W).
+FallbackTest = namedtuple('FallbackTest', ['name', 'keyword', 'pattern', 'unit', 'reference_range'])
+
+# First number after the keyword, however far (same as .*?([\d\.]+) without
+# the backtracking); see extract_specific_tests_comprehensive for the bound
+NEAREST_NUMBER = r'[^\d\.]*+([\d\.]+)'
+
+_FALLBACK_SPECS = [
+    # Liver Function Tests
+    ("Total Bilirubin", r'TOTAL\s+BILIRUBIN', NEAREST_NUMBER, "mg/dl", "0.4-1.0"),
+    ("Direct Bilirubin", r'DIRECT\s+BILIRUBIN', NEAREST_NUMBER, "mg/dl", "0.1-0.5"),
+    ("Indirect Bilirubin", r'INDIRECT\s+BILIRUBIN', NEAREST_NUMBER, "mg/dl", "0.2-0.8"),
+    ("SGOT(AST)", r'(?:SERUM\s+)?SGOT', NEAREST_NUMBER, "IU/L", "5-40"),
+    ("SGPT(ALT)", r'(?:SERUM\s+)?SGPT', NEAREST_NUMBER, "IU/L", "5-55"),
+    ("Total Protein", r'(?:SERUM\s+)?TOTAL\s+PROTEIN', NEAREST_NUMBER, "gm/dl", "6.0-8.0"),
+    ("Albumin", r'(?:SERUM\s+)?ALBUMIN', NEAREST_NUMBER, "gm/dl", "3.5-5.5"),
+    ("Globulin", r'(?:SERUM\s+)?GLOBULIN', NEAREST_NUMBER, "gm/dl", "2.0-4.0"),
+    ("A/G Ratio", r'A[/\\]G\s+RATIO', r'[^\d\.]*+([\d\.]+(?::\d)?)', "RATIO", "1.0-1.85"),
+    ("Alkaline Phosphatase", r'ALKALINE\s+PHOSPHAT[ES]+', NEAREST_NUMBER, "IU/L", "up to 280"),
+    # CBC / Differential Count Tests
+    ("Platelet Count", r'Platelet\s+count', NEAREST_NUMBER, "Lakhs/Cumm", "2.1 - 5.0"),
+    ("Mean Cell Volume", r'Mean\s+Cell\s+Volume', NEAREST_NUMBER, "fL", "92 - 118"),
+    ("Mean Cell Haemoglobin", r'Mean\s+Cell\s+Haemoglobin\s*\(MCH\)', NEAREST_NUMBER, "pg", "31 - 37"),
+    ("MCHC", r'Mean\s+Cell\s+Haemoglobin\s+Concentration', NEAREST_NUMBER, "g/L", "29 - 47"),
+    ("RDW", r'RDW', NEAREST_NUMBER, "%", "11.6 - 14.0"),
+    ("Neutrophils", r'Neutrophils', r'\.?\s+([\d\.]+)', "%", "20 - 45"),
+    ("Lymphocytes", r'Lymphocytes', r'\s+([\d\.]+)', "%", "28 - 35"),
+    ("Eosinophils", r'Eosinophils', r'\s+([\d\.]+)', "%", "1.4 - 4.3"),
+    ("Monocytes", r'Monocytes', r'\s+([\d\.]+)', "%", "4 - 7"),
+    ("Basophils", r'Basophils', r'\s+([\d\.]+)', "%", "0 - 1"),
+]
+
+FALLBACK_TESTS = [
+    FallbackTest(name, keyword, re.compile(keyword + value, re.IGNORECASE | re.DOTALL), unit, ref_range)
+    for name, keyword, value, unit, ref_range in _FALLBACK_SPECS
+]
+
+
+def _leading_letters(keyword):
+    """Lowercase letters a keyword match can start with"""
+    letters = set()
+    optional_prefix = re.match(r'\(\?:(\w)[^)]*\)\?', keyword)
+    if optional_prefix:
+        letters.add(optional_prefix.group(1).lower())
+        keyword = keyword[optional_prefix.end():]
+    letters.add(keyword[0].lower())
+    return letters
+
+
+# Fallback tests indexed by the letters their keyword can start with
+FALLBACK_TESTS_BY_LETTER = {}
+for _test in FALLBACK_TESTS:
+    for _letter in _leading_letters(_test.keyword):
+        FALLBACK_TESTS_BY_LETTER.setdefault(_letter, []).append(_test)
+
+# Zero-width scanner (run over the lowercased text) reporting every position
+# where any fallback keyword starts; the leading character class lets the
+# engine skip most positions before trying the alternation
+FALLBACK_SCANNER = re.compile(
+    '(?=[' + ''.join(sorted(FALLBACK_TESTS_BY_LETTER)) + '])'
+    '(?=' + '|'.join(f'(?:{test.keyword.lower()})' for test in FALLBACK_TESTS) + ')'
+)
+FALLBACK_SCANNER_IGNORECASE = re.compile(FALLBACK_SCANNER.pattern, re.IGNORECASE)
+
 
 def extract_patient_info(text):
     """Extract patient demographics - enhanced for multiple formats"""
@@ -16,25 +271,15 @@ def extract_patient_info(text):
     }
     
     # Patient Name - multiple patterns
-    name_patterns = [
-        r'PATIENT\s+NAME\s*[:=]?\s*([A-Z\s]+?)(?:\s+Age|UHID|IPID|Referred|$)',
-        r'Patient\s+Name\s*[:=]\s*([A-Za-z\s\.]+?)(?:\s+Age|UHID|$)',
-        r'Patient\s*[:=]?\s*([A-Za-z\s\.]+?)(?:\s+SIREESHA|$)',
-    ]
-    for pattern in name_patterns:
-        match = re.search(pattern, text, re.IGNORECASE)
+    for pattern in NAME_PATTERNS:
+        match = pattern.search(text)
         if match:
             patient_data["patient_name"] = match.group(1).strip()
             break
     
     # Age and Sex - multiple formats
-    age_sex_patterns = [
-        r'Age[/\\]Sex\s*[:=]?\s*(\d+)\s*Year.*?\(?(Male|Female)\)?',
-        r'Age\s*[:=]?\s*(\d+).*?([MaleFemale]+)',
-        r'(\d{2,3})\s*[Yy](?:ear)?.*?([MaleFemale]+)',
-    ]
-    for pattern in age_sex_patterns:
-        match = re.search(pattern, text, re.IGNORECASE)
+    for pattern in AGE_SEX_PATTERNS:
+        match = pattern.search(text)
         if match:
             try:
                 patient_data["age"] = int(match.group(1))
@@ -44,26 +289,20 @@ def extract_patient_info(text):
                 continue
     
     # UHID / Patient ID / Admission No
-    uhid_patterns = [
-        r'(?:UHID|IPID|Patient\s*ID|MRN|Admn\s*No)\s*[:=]\s*([A-Z0-9\.\-]+)',
-    ]
-    for pattern in uhid_patterns:
-        match = re.search(pattern, text, re.IGNORECASE)
+    for pattern in UHID_PATTERNS:
+        match = pattern.search(text)
         if match:
             patient_data["uhid"] = match.group(1).strip()
             break
     
     # Episode
-    episode_match = re.search(r'Episode\s*[:=]\s*([A-Z0-9\-]+)', text, re.IGNORECASE)
+    episode_match = EPISODE_PATTERN.search(text)
     if episode_match:
         patient_data["episode"] = episode_match.group(1).strip()
     
     # Referring Doctor / Consultant
-    doctor_patterns = [
-        r'(?:Referred\s+By|Ref\.?\s*Doctor|By)\s*[:=]\s*([A-Za-z\s\.\/]+?)(?:\s+Ward|Date|Report|$)',
-    ]
-    for pattern in doctor_patterns:
-        match = re.search(pattern, text, re.IGNORECASE)
+    for pattern in DOCTOR_PATTERNS:
+        match = pattern.search(text)
         if match:
             doctor_name = match.group(1).strip()
             # Clean up common false matches
@@ -72,13 +311,8 @@ def extract_patient_info(text):
                 break
     
     # Hospital/Facility
-    facility_patterns = [
-        r'(?:UDHRAN|Hospital)\s+HOSPITAL',
-        r'PARIDHI\s+PATHOLOGY',
-        r'DEPARTMENT\s+OF\s+PATHOLOGY',
-    ]
-    for pattern in facility_patterns:
-        match = re.search(pattern, text, re.IGNORECASE)
+    for pattern in PATIENT_FACILITY_PATTERNS:
+        match = pattern.search(text)
         if match:
             patient_data["facility"] = match.group(0).strip()
             break
@@ -99,39 +333,31 @@ def extract_order_info(text):
         "report_date": None,
     }
     
-    # Date patterns
-    date_pattern = r'(\d{1,2}[-/]\w{3}[-/]\d{2,4}(?:\s+\d{1,2}:\d{2}(?:\s*[ap]m)?)?)'
-    
     # Bill Date
-    bill_date_match = re.search(rf'Bill\s+Date\s*[:=]?\s*{date_pattern}', text, re.IGNORECASE)
+    bill_date_match = BILL_DATE_PATTERN.search(text)
     if bill_date_match:
         order_data["bill_date"] = bill_date_match.group(1)
     
     # Report Date
-    report_date_match = re.search(rf'(?:Report|REP)\s*\.?\s*(?:Date|DATE)\s*[:=]?\s*{date_pattern}', text, re.IGNORECASE)
+    report_date_match = REPORT_DATE_PATTERN.search(text)
     if report_date_match:
         order_data["report_date"] = report_date_match.group(1)
     
     # Collection Date
-    collection_match = re.search(rf'(?:Collec\.?|Collection)\s*Date\s*[:=]?\s*{date_pattern}', text, re.IGNORECASE)
+    collection_match = COLLECTION_DATE_PATTERN.search(text)
     if collection_match:
         order_data["collection_date"] = collection_match.group(1)
     
     # Service Number
-    service_match = re.search(r'Service\s*No\s*[:=]?\s*([A-Z0-9]+)', text, re.IGNORECASE)
+    service_match = SERVICE_NO_PATTERN.search(text)
     if service_match:
         order_data["service_no"] = service_match.group(1)
     
     # Bill Number - not present in these reports
     
     # Facility
-    facility_patterns = [
-        r'(UDHRAN\s+HOSPITAL)',
-        r'(PARIDHI\s+PATHOLOGY)',
-        r'(DEPARTMENT\s+OF\s+PATHOLOGY)',
-    ]
-    for pattern in facility_patterns:
-        match = re.search(pattern, text, re.IGNORECASE)
+    for pattern in ORDER_FACILITY_PATTERNS:
+        match = pattern.search(text)
         if match:
             order_data["facility"] = match.group(1)
             break
@@ -147,30 +373,25 @@ def extract_lab_tests_universal(text):
     
     # Split into lines
     lines = text.split('\n')
-    
-    # Track if in lab section
-    in_lab_section = False
-    current_section = None
+    section_lines = section_header_lines(text, lines)
     
     for i, line in enumerate(lines):
+        if i % 256 == 0 and out_of_time():
+            return lab_results
         line_stripped = line.strip()
         
-        # Detect section headers
-        if any(header in line_stripped.upper() for header in ['BIOCHEMISTRY', 'LFT', 'LIVER FUNCTION TEST', 'DIFFERENTIAL COUNT', 'INVESTIGATIONS']):
-            in_lab_section = True
-            current_section = line_stripped
+        # Skip section headers
+        if i in section_lines:
             continue
         
         # Skip empty lines and pure headers
         if len(line_stripped) < 3:
             continue
-        if line_stripped.upper() in ['VALUE', 'UNIT', 'REF.RANGE', 'REFERENCE', 'RESULT', 'SPECIMEN', 'METHOD']:
+        if line_stripped.upper() in COLUMN_HEADERS:
             continue
         
         # Pattern 1: Test name at start, value and unit in middle, reference at end
-        # Example: "TOTAL BILIRUBIN 1.8 mg/dl 0.4-1.0"
-        pattern1 = r'^([A-Z][A-Za-z\s/\(\)\-\.,]+?)\s+([\d\.]+)\s*([↑↓\*]?[HL]?)?\s*([A-Za-z/%\^:]+(?:/[A-Za-z0-9\^]+)?)\s*([\d\.\-<>\s:]+)?$'
-        match1 = re.match(pattern1, line_stripped)
+        match1 = LAB_LINE_PATTERN.match(line_stripped)
         
         if match1:
             test_name = match1.group(1).strip()
@@ -185,7 +406,7 @@ def extract_lab_tests_universal(text):
             # Determine status
             status = determine_status_from_markers(line, abnormal_flag)
             
-            if len(test_name) >= 3 and test_name.upper() not in ['METHOD', 'NOTE', 'REMARKS', 'SAMPLE TYPE']:
+            if len(test_name) >= 3 and test_name.upper() not in NON_TEST_NAMES:
                 lab_results.append({
                     "test_name": test_name,
                     "value": value,
@@ -196,9 +417,7 @@ def extract_lab_tests_universal(text):
                 continue
         
         # Pattern 2: For differential count style (test name followed by number and %)
-        # Example: "Neutrophils. 58 20 - 45 %"
-        pattern2 = r'^([A-Za-z\s\.]+?)\s+([\d\.]+)\s+([↑↓]?)\s*([\d\.\-\s]+)\s*(%|IU/L|mg/dl|gm/dl|g/L|RATIO)?'
-        match2 = re.search(pattern2, line_stripped)
+        match2 = DIFFERENTIAL_LINE_PATTERN.search(line_stripped)
         
         if match2 and not match1:
             test_name = match2.group(1).strip()
@@ -221,6 +440,8 @@ def extract_lab_tests_universal(text):
                 continue
     
     # Specific fallback extractions for tests that might be missed
+    if out_of_time():
+        return lab_results
     fallback_tests = extract_specific_tests_comprehensive(text)
     
     # Merge results, avoiding duplicates
@@ -232,43 +453,60 @@ def extract_lab_tests_universal(text):
     return lab_results
 
 
+def extract_lab_tests_from_layout(layout):
+    """
+    Lab tests read from OCR word boxes (see model.ocr_layout)
+
+    Table rows were already resolved geometrically; the line patterns and the
+    fallback scan only run over the rows that could not be resolved.
+    """
+    lab_results = list(layout.lab_tests)
+    if layout.unresolved_text:
+        existing_test_names_lower = {test['test_name'].lower() for test in lab_results}
+        for test in extract_lab_tests_universal(layout.unresolved_text):
+            if test['test_name'].lower() not in existing_test_names_lower:
+                lab_results.append(test)
+                existing_test_names_lower.add(test['test_name'].lower())
+    return lab_results
+
+
 def extract_specific_tests_comprehensive(text):
-    """Extract specific tests using targeted patterns"""
+    """
+    Extract specific tests using targeted patterns
+
+    A single scanner pass finds every position where one of the test keywords
+    starts; each test's full pattern is then only tried at those positions, so
+    every test still gets its leftmost match without its own whole-text search.
+    """
     results = []
+    matches = {}
+    pending = set(FALLBACK_TESTS)
+    
+    # Lowercasing can change the length of some non-ASCII text; positions
+    # must line up with the original, so fall back to a case-insensitive scan
+    scan_text = text.lower()
+    scanner = FALLBACK_SCANNER
+    if len(scan_text) != len(text):
+        scan_text, scanner = text, FALLBACK_SCANNER_IGNORECASE
+    
+    # Every fallback value is a number, so no test can match after the last
+    # digit or dot; stopping there also means a NEAREST_NUMBER gap never
+    # scans to the end of the text and fails, once per keyword occurrence
+    last_number = max(text.rfind(char) for char in '0123456789.')
+    
+    for hit in scanner.finditer(scan_text, 0, last_number):
+        position = hit.start()
+        for test in FALLBACK_TESTS_BY_LETTER.get(scan_text[position].lower(), ()):
+            if test in pending:
+                match = test.pattern.match(text, position)
+                if match:
+                    matches[test.name] = match
+                    pending.discard(test)
+        if not pending:
+            break
     
-    # Liver Function Tests
-    liver_tests = {
-        "Total Bilirubin": (r'TOTAL\s+BILIRUBIN.*?([\d\.]+)', "mg/dl", "0.4-1.0"),
-        "Direct Bilirubin": (r'DIRECT\s+BILIRUBIN.*?([\d\.]+)', "mg/dl", "0.1-0.5"),
-        "Indirect Bilirubin": (r'INDIRECT\s+BILIRUBIN.*?([\d\.]+)', "mg/dl", "0.2-0.8"),
-        "SGOT(AST)": (r'(?:SERUM\s+)?SGOT.*?([\d\.]+)', "IU/L", "5-40"),
-        "SGPT(ALT)": (r'(?:SERUM\s+)?SGPT.*?([\d\.]+)', "IU/L", "5-55"),
-        "Total Protein": (r'(?:SERUM\s+)?TOTAL\s+PROTEIN.*?([\d\.]+)', "gm/dl", "6.0-8.0"),
-        "Albumin": (r'(?:SERUM\s+)?ALBUMIN.*?([\d\.]+)', "gm/dl", "3.5-5.5"),
-        "Globulin": (r'(?:SERUM\s+)?GLOBULIN.*?([\d\.]+)', "gm/dl", "2.0-4.0"),
-        "A/G Ratio": (r'A[/\\]G\s+RATIO.*?([\d\.]+(?::\d)?)', "RATIO", "1.0-1.85"),
-        "Alkaline Phosphatase": (r'ALKALINE\s+PHOSPHAT[ES]+.*?([\d\.]+)', "IU/L", "up to 280"),
-    }
-    
-    # CBC / Differential Count Tests
-    cbc_tests = {
-        "Platelet Count": (r'Platelet\s+count.*?([\d\.]+)', "Lakhs/Cumm", "2.1 - 5.0"),
-        "Mean Cell Volume": (r'Mean\s+Cell\s+Volume.*?([\d\.]+)', "fL", "92 - 118"),
-        "Mean Cell Haemoglobin": (r'Mean\s+Cell\s+Haemoglobin\s*\(MCH\).*?([\d\.]+)', "pg", "31 - 37"),
-        "MCHC": (r'Mean\s+Cell\s+Haemoglobin\s+Concentration.*?([\d\.]+)', "g/L", "29 - 47"),
-        "RDW": (r'RDW.*?([\d\.]+)', "%", "11.6 - 14.0"),
-        "Neutrophils": (r'Neutrophils\.?\s+([\d\.]+)', "%", "20 - 45"),
-        "Lymphocytes": (r'Lymphocytes\s+([\d\.]+)', "%", "28 - 35"),
-        "Eosinophils": (r'Eosinophils\s+([\d\.]+)', "%", "1.4 - 4.3"),
-        "Monocytes": (r'Monocytes\s+([\d\.]+)', "%", "4 - 7"),
-        "Basophils": (r'Basophils\s+([\d\.]+)', "%", "0 - 1"),
-    }
-    
-    # Combine all tests
-    all_tests = {**liver_tests, **cbc_tests}
-    
-    for test_name, (pattern, unit, ref_range) in all_tests.items():
-        match = re.search(pattern, text, re.IGNORECASE | re.DOTALL)
+    for test in FALLBACK_TESTS:
+        match = matches.get(test.name)
         if match:
             value = match.group(1)
             
@@ -280,10 +518,10 @@ def extract_specific_tests_comprehensive(text):
             status = determine_status_from_markers(context, "")
             
             results.append({
-                "test_name": test_name,
+                "test_name": test.name,
                 "value": value,
-                "unit": unit,
-                "reference_range": ref_range,
+                "unit": test.unit,
+                "reference_range": test.reference_range,
                 "status": status
             })
     
@@ -293,9 +531,9 @@ def extract_specific_tests_comprehensive(text):
 def clean_test_name(test_name):
     """Clean up test name"""
     # Remove method indicators
-    test_name = re.sub(r'\(DPD\)|\(IFCC[^\)]*\)|Amp Buffer\)', '', test_name)
+    test_name = METHOD_INDICATOR_PATTERN.sub('', test_name)
     # Remove extra spaces
-    test_name = re.sub(r'\s+', ' ', test_name)
+    test_name = WHITESPACE_PATTERN.sub(' ', test_name)
     # Remove trailing punctuation
     test_name = test_name.rstrip(':=.')
     return test_name.strip()
@@ -326,77 +564,237 @@ def determine_status_from_markers(text, abnormal_flag):
 
 def extract_diagnoses(text):
     """Extract medical conditions"""
-    medical_keywords = [
-        'diabetes', 'hypertension', 'anemia', 'liver disease', 
-        'kidney disease', 'heart disease', 'hepatitis', 'cirrhosis',
-        'infection', 'inflammation'
+    names = {match.value[1] for match in find_keywords(text).get('diagnosis', ())}
+    
+    return [
+        {
+            "condition": name,
+            "type": "Disease/Condition",
+            "icd_code": None
+        }
+        for name in sorted(names, key=DIAGNOSIS_ORDER.get)
     ]
-    
-    diagnoses = []
-    text_lower = text.lower()
-    
-    for keyword in medical_keywords:
-        if keyword in text_lower:
-            diagnoses.append({
-                "condition": keyword.title(),
-                "type": "Disease/Condition",
-                "icd_code": None
-            })
-    
-    return diagnoses
 
 
 def extract_medications(text):
     """Extract medications"""
-    medication_keywords = [
-        'aspirin', 'metformin', 'warfarin', 'heparin', 'vitamin k',
-        'paracetamol', 'antibiotic'
+    names = {match.value[1] for match in find_keywords(text).get('medication', ())}
+    
+    return [
+        {
+            "medication_name": name,
+            "type": "Medication/Chemical"
+        }
+        for name in sorted(names, key=MEDICATION_ORDER.get)
     ]
-    
-    medications = []
-    text_lower = text.lower()
-    
-    for med in medication_keywords:
-        if med in text_lower:
-            medications.append({
-                "medication_name": med.title(),
-                "type": "Medication/Chemical"
-            })
-    
-    return medications
 
 
-def extract_all(text):
-    """Main extraction function"""
-    report_type = detect_report_type(text)
-    
+@lru_cache(maxsize=4)
+def find_keywords(text):
+    """
+    KEYWORD_MATCHER matches in text, grouped by category
+
+    Cached so the extractors that share a text scan it only once; callers
+    must not modify the result.
+    """
+    found = {}
+    for match in KEYWORD_MATCHER.find_all(text):
+        found.setdefault(match.value[0], []).append(match)
+    return found
+
+
+def line_start_offsets(lines):
+    """Character offset where each of lines (the text split on newlines) starts"""
+    return list(accumulate((len(line) + 1 for line in lines[:-1]), initial=0))
+
+
+def section_header_lines(text, lines):
+    """Numbers of the lines of text that contain a section header keyword"""
+    line_starts = line_start_offsets(lines)
     return {
+        bisect_right(line_starts, match.start) - 1
+        for match in find_keywords(text).get('section', ())
+    }
+
+
+def extract_all(text, layout=None, workers=None):
+    """
+    Main extraction function
+
+    The text is segmented once into header / results / remarks regions and
+    every registered field extractor runs on the region it declared.
+
+    Args:
+        text: Report text
+        layout: Optional OcrLayout from layout-aware OCR, used for the lab tests
+        workers: Threads for running extractors concurrently (defaults to
+            EXTRACT_WORKERS; only used for texts of PARALLEL_MIN_CHARS or more)
+    
+    Extraction stops at EXTRACT_TIME_BUDGET: extractors that have not
+    started get their default value, a running one returns what it has, and
+    report_metadata lists them under incomplete_fields with degraded True.
+    """
+    deadline = time.monotonic() + EXTRACT_TIME_BUDGET if EXTRACT_TIME_BUDGET > 0 else None
+    
+    with timed("detect_report_type"):
+        report_type = detect_report_type(text)
+    
+    with timed("segment_regions"):
+        regions = segment_regions(text)
+    
+    def run(extractor):
+        """(value, True if the budget ran out before the extractor finished)"""
+        _budget.deadline, _budget.exhausted = deadline, False
+        try:
+            if out_of_time():
+                return (extractor.default() if extractor.default else None), True
+            if layout is not None and extractor.layout_func is not None:
+                value = _timed_call(extractor.layout_func, layout)
+            else:
+                spans = regions[extractor.region]
+                value = _timed_call(extractor.func, spans[0]) if len(spans) == 1 else merge_span_values(
+                    [_timed_call(extractor.func, span) for span in spans]
+                )
+            return value, _budget.exhausted
+        finally:
+            _budget.deadline = None
+    
+    extractors = list(FIELD_EXTRACTORS.values())
+    workers = EXTRACT_WORKERS if workers is None else workers
+    if workers > 1 and len(text) >= PARALLEL_MIN_CHARS:
+        values = list(get_extract_pool(workers).map(run, extractors))
+    else:
+        values = [run(extractor) for extractor in extractors]
+    
+    result = {
         "report_metadata": {
             "report_type": report_type,
             "department": "Auto-detected",
             "extraction_timestamp": datetime.now().isoformat(),
-            "extraction_method": "Universal Pattern Matching"
-        },
-        "patient_information": extract_patient_info(text),
-        "order_information": extract_order_info(text),
-        "lab_tests": extract_lab_tests_universal(text),
-        "diagnoses": extract_diagnoses(text),
-        "medications": extract_medications(text),
-        "clinical_notes": extract_clinical_interpretation(text)
+            "extraction_method": "Universal Pattern Matching" if layout is None else "OCR Layout Analysis",
+            "degraded": False,
+            "incomplete_fields": []
+        }
     }
+    for extractor, (value, incomplete) in zip(extractors, values):
+        result[extractor.field] = value
+        if incomplete:
+            result["report_metadata"]["incomplete_fields"].append(extractor.field)
+    if result["report_metadata"]["incomplete_fields"]:
+        result["report_metadata"]["degraded"] = True
+        metrics.inc("extractions_degraded_total")
+        print(f"⚠ Extraction time budget ({EXTRACT_TIME_BUDGET}s) ran out, incomplete: "
+              f"{', '.join(result['report_metadata']['incomplete_fields'])}")
+    return result
+
+
+def segment_regions(text):
+    """
+    Split report text into header, results-table and remarks regions
+
+    Lines are assigned in one pass: a section header, a column header row
+    or a lab result line opens (or re-opens) the results region; Remarks /
+    Interpretation / Note lines open the remarks region; patient and order detail lines
+    (which also start the next report in a multi-report document) belong
+    to the header. A region is kept as its runs of adjacent lines, so that
+    no pattern can match across lines that were apart in the text.
+
+    Returns:
+        Dict of region name -> list of span texts (in document order), plus
+        "full" ([text]); an empty region falls back to the full text so
+        extractors never see less than before
+    """
+    lines = text.split('\n')
+    line_starts = line_start_offsets(lines)
+    
+    # Positions must line up with the original text (see extract_specific_tests_comprehensive)
+    scan_text = text.lower()
+    scanner = 0
+    if len(scan_text) != len(text):
+        scan_text, scanner = text, 1
+    
+    def matches_by_line(pattern, target):
+        """(line number, match) for every match of one scan over the whole text"""
+        return [(bisect_right(line_starts, match.start()) - 1, match) for match in pattern.finditer(target)]
+    
+    header_lines = {number for number, _ in matches_by_line(HEADER_LINE_SCANNER[scanner], scan_text)}
+    remarks_lines = {number for number, _ in matches_by_line(REMARKS_START_PATTERN, text)}
+    results_lines = section_header_lines(text, lines)
+    column_words = {}
+    for number, match in matches_by_line(COLUMN_WORD_SCANNER[scanner], scan_text):
+        column_words.setdefault(number, set()).add(match.group(0).lower())
+    results_lines.update(number for number, words in column_words.items() if len(words) >= 2)
+    
+    region_spans = {'header': [], 'results': [], 'remarks': []}
+    region = None
+    for number, line in enumerate(lines):
+        previous = region
+        if number in header_lines:
+            region = 'header'
+        elif number in remarks_lines:
+            region = 'remarks'
+        elif number in results_lines or is_result_row(line.strip()):
+            # A result row re-opens the table after a Note inside it or a
+            # header repeated on a continuation page
+            region = 'results'
+        elif region is None:
+            region = 'header'
+        if region == previous:
+            region_spans[region][-1].append(line)
+        else:
+            region_spans[region].append([line])
+    
+    regions = {'full': [text]}
+    for name, spans in region_spans.items():
+        spans = ['\n'.join(span) for span in spans]
+        regions[name] = [span for span in spans if span.strip()] or [text]
+    return regions
+
+
+def merge_span_values(values):
+    """
+    Combine an extractor's results for the spans of one region
+
+    Dicts keep the first non-None value of each key, lists are concatenated
+    and anything else is the first non-None value, so a field is taken from
+    the earliest span that has it.
+    """
+    values = [value for value in values if value is not None]
+    if not values:
+        return None
+    if all(isinstance(value, dict) for value in values):
+        merged = dict(values[0])
+        for value in values[1:]:
+            for key, item in value.items():
+                if merged.get(key) is None:
+                    merged[key] = item
+        return merged
+    if all(isinstance(value, list) for value in values):
+        return [item for value in values for item in value]
+    return values[0]
+
+
+def is_result_row(line):
+    """True if a stripped line reads as a lab result or differential count row"""
+    return bool(LAB_LINE_PATTERN.match(line) or DIFFERENTIAL_LINE_PATTERN.match(line))
+
+
+def _timed_call(extractor, text):
+    with timed(extractor.__name__):
+        return extractor(text)
 
 
 def detect_report_type(text):
     """Detect report type"""
-    text_lower = text.lower()
+    found = {match.value[1] for match in find_keywords(text).get('report_type', ())}
     
-    if 'differential count' in text_lower or 'neutrophils' in text_lower:
+    if 'differential count' in found or 'neutrophils' in found:
         return "Complete Blood Count (CBC) with Differential"
-    elif 'liver function' in text_lower or 'lft' in text_lower or ('sgot' in text_lower and 'sgpt' in text_lower):
+    elif 'liver function' in found or 'lft' in found or ('sgot' in found and 'sgpt' in found):
         return "Liver Function Test (LFT)"
-    elif 'coagulation' in text_lower or ('pt' in text_lower and 'inr' in text_lower):
+    elif 'coagulation' in found or ('pt' in found and 'inr' in found):
         return "Coagulation Panel"
-    elif 'cbc' in text_lower or 'complete blood count' in text_lower:
+    elif 'cbc' in found or 'complete blood count' in found:
         return "Complete Blood Count"
     else:
         return "General Laboratory Report"
@@ -404,17 +802,130 @@ def detect_report_type(text):
 
 def extract_clinical_interpretation(text):
     """Extract clinical notes"""
-    patterns = [
-        r'Remarks[:=]?\s*(.*?)(?:Liver|Magnesium|COAGULATION|Method|DIFFERENTIAL|$)',
-        r'Interpretation[:=]?\s*(.*?)(?:Note|Method|$)',
-        r'Comments[:=]?\s*(.*?)(?:Method|$)',
-    ]
-    
-    for pattern in patterns:
-        match = re.search(pattern, text, re.IGNORECASE | re.DOTALL)
+    for pattern in CLINICAL_NOTE_PATTERNS:
+        match = pattern.search(text)
         if match and match.group(1).strip():
             notes = match.group(1).strip()
             if len(notes) > 10 and notes != "PLEASE CORRELATE CLINICALLY.":
                 return notes[:500]
     
     return None
+
+
+# ---------------------------------------------------------------------------
+# Field extractor registry - extract_all fills one output field per entry
+# ---------------------------------------------------------------------------
+
+# Text regions an extractor can ask for (see segment_regions)
+REGIONS = ('full', 'header', 'results', 'remarks')
+
+# Threads used to run the extractors of one document concurrently (1 = in turn)
+EXTRACT_WORKERS = int(os.environ.get("EXTRACT_WORKERS", 1))
+# Shorter texts are always extracted in turn; threading only pays off on large documents
+PARALLEL_MIN_CHARS = int(os.environ.get("PARALLEL_MIN_CHARS", 50_000))
+
+# Comma separated modules that register site-specific extractors when imported
+EXTRACTOR_PLUGINS = os.environ.get("EXTRACTOR_PLUGINS", "")
+
+# Seconds extract_all may spend on one document before it returns a degraded
+# result (0 = no limit). Every pattern is linear-time, so checking the clock
+# between extractors and between lines is enough to keep to it.
+EXTRACT_TIME_BUDGET = float(os.environ.get("EXTRACT_TIME_BUDGET", 10))
+
+FieldExtractor = namedtuple('FieldExtractor', ['field', 'func', 'region', 'layout_func', 'default'])
+
+# Output field -> FieldExtractor, in output order
+FIELD_EXTRACTORS = {}
+
+# Thread pools shared by concurrent extract_all calls, one per worker count
+_extract_pools = {}
+_extract_pools_lock = threading.Lock()
+
+# Deadline of the extract_all call running on this thread
+_budget = threading.local()
+
+
+def out_of_time():
+    """
+    True once the extract_all call running on this thread is past its time budget
+
+    Long-running extractors call this between steps and return what they
+    have so far; extract_all then reports the field as incomplete.
+    """
+    deadline = getattr(_budget, 'deadline', None)
+    if deadline is None or time.monotonic() < deadline:
+        return False
+    _budget.exhausted = True
+    return True
+
+
+def register_field_extractor(field, func=None, region='full', layout_func=None, default=None):
+    """
+    Register the extractor that fills one field of the extract_all output
+
+    Registering an existing field replaces its extractor, so a site can
+    override a built-in one. Usable directly or as a decorator.
+
+    Args:
+        field: Output key, e.g. "lab_tests"
+        func: Callable taking region text and returning the field value; it
+            is called once per span of the region and the results are merged
+            (see merge_span_values)
+        region: One of REGIONS
+        layout_func: Optional callable taking an OcrLayout, used instead of
+            func when extract_all is given a layout
+        default: Optional callable returning the value used when the time
+            budget runs out before the extractor starts (None otherwise)
+    """
+    if region not in REGIONS:
+        raise ValueError(f"Unknown region {region!r}, expected one of {REGIONS}")
+    
+    def register(func):
+        FIELD_EXTRACTORS[field] = FieldExtractor(field, func, region, layout_func, default)
+        return func
+    
+    if func is None:
+        return register
+    return register(func)
+
+
+def unregister_field_extractor(field):
+    FIELD_EXTRACTORS.pop(field, None)
+
+
+def load_extractor_plugins(module_names):
+    """
+    Import plugin modules that call register_field_extractor at import time
+
+    Args:
+        module_names: Iterable of module names, or a comma separated string
+    """
+    if isinstance(module_names, str):
+        module_names = module_names.split(",")
+    for name in module_names:
+        name = name.strip()
+        if name:
+            importlib.import_module(name)
+            print(f"✓ Loaded extractor plugin {name}")
+
+
+def get_extract_pool(workers):
+    """Thread pool with `workers` threads shared by concurrent extract_all calls, created on first use"""
+    with _extract_pools_lock:
+        pool = _extract_pools.get(workers)
+        if pool is None:
+            pool = _extract_pools[workers] = ThreadPoolExecutor(max_workers=workers)
+        return pool
+
+
+register_field_extractor("patient_information", extract_patient_info, region='header', default=dict)
+register_field_extractor("order_information", extract_order_info, region='header', default=dict)
+# Lab tests scan the full text: result rows can sit anywhere a report's
+# layout puts them, and a missed row costs more than the larger scan
+register_field_extractor("lab_tests", extract_lab_tests_universal,
+                         layout_func=extract_lab_tests_from_layout, default=list)
+register_field_extractor("diagnoses", extract_diagnoses, default=list)
+register_field_extractor("medications", extract_medications, default=list)
+register_field_extractor("clinical_notes", extract_clinical_interpretation, region='remarks')
+
+load_extractor_plugins(EXTRACTOR_PLUGINS)
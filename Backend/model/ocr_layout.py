@@ -0,0 +1,206 @@
+import re
+from collections import namedtuple
+from statistics import median
+from model.ner_extractor import (
+    COLUMN_HEADERS, FALLBACK_SCANNER_IGNORECASE, NON_TEST_NAMES,
+    clean_test_name, determine_status_from_markers
+)
+
+# One OCR word with its bounding box (pixels)
+Word = namedtuple('Word', ['text', 'left', 'top', 'width', 'height'])
+
+# Result of layout-aware OCR: the page text (one line per row), the lab tests
+# read from table rows, and the rows that still need the text-based extractors
+OcrLayout = namedtuple('OcrLayout', ['text', 'lab_tests', 'unresolved_text'])
+
+# Header words naming each table column
+NAME_HEADER_WORDS = {'TEST', 'TESTS', 'INVESTIGATION', 'INVESTIGATIONS', 'PARAMETER'}
+VALUE_HEADER_WORDS = {'RESULT', 'RESULTS', 'VALUE', 'OBSERVED'}
+UNIT_HEADER_WORDS = {'UNIT', 'UNITS'}
+RANGE_HEADER_WORDS = {'REF', 'REF.RANGE', 'REFERENCE', 'BIOLOGICAL', 'RANGE', 'INTERVAL', 'NORMAL'}
+
+# Words in the same row whose vertical centers differ by less than this
+# fraction of the median word height
+ROW_TOLERANCE = 0.5
+
+VALUE_TOKEN = re.compile(r'^([<>]?\d+(?:\.\d+)?)([HL\*↑↓]*)$')
+FLAG_TOKEN = re.compile(r'^(?:\*?[HL]|[↑↓])$')
+DIGIT = re.compile(r'\d')
+
+
+def words_from_data(data):
+    """
+    Words from pytesseract.image_to_data(..., output_type=Output.DICT)
+
+    Entries for blocks, paragraphs and lines (conf -1) and empty words are dropped.
+    """
+    words = []
+    for index, text in enumerate(data['text']):
+        text = (text or '').strip()
+        if not text or float(data['conf'][index]) < 0:
+            continue
+        words.append(Word(text, data['left'][index], data['top'][index],
+                          data['width'][index], data['height'][index]))
+    return words
+
+
+def group_rows(words):
+    """
+    Cluster words into table rows by their vertical centers
+
+    Returns:
+        List of rows (top to bottom), each a list of words sorted left to right
+    """
+    if not words:
+        return []
+    tolerance = ROW_TOLERANCE * median(word.height for word in words)
+
+    rows = []
+    row, row_center = [], None
+    for word in sorted(words, key=lambda w: w.top + w.height / 2):
+        center = word.top + word.height / 2
+        if row and abs(center - row_center) > tolerance:
+            rows.append(sorted(row, key=lambda w: w.left))
+            row = []
+        row.append(word)
+        # Running mean keeps long rows from drifting across line boundaries
+        row_center = sum(w.top + w.height / 2 for w in row) / len(row)
+    rows.append(sorted(row, key=lambda w: w.left))
+    return rows
+
+
+def row_text(row):
+    return " ".join(word.text for word in row)
+
+
+def find_columns(row):
+    """
+    Column boundaries from a table header row
+
+    Returns:
+        List of (column, start x) sorted by x, or None if row is not a header
+    """
+    found = {}
+    for word in row:
+        key = word.text.upper().strip(':')
+        for column, header_words in (('value', VALUE_HEADER_WORDS), ('unit', UNIT_HEADER_WORDS),
+                                     ('range', RANGE_HEADER_WORDS), ('name', NAME_HEADER_WORDS)):
+            if key in header_words and column not in found:
+                found[column] = word
+                break
+
+    # Prose that happens to mention "test" and "result" is not a header
+    if 'value' not in found or len(found) < 2 or DIGIT.search(row_text(row)):
+        return None
+
+    height = median(word.height for word in row)
+    value_word = found['value']
+    # Test names run up to the value column; later columns split halfway
+    # between the previous header word's right edge and the next header's left
+    boundaries = [('name', 0), ('value', value_word.left - height)]
+    previous = value_word
+    for column in ('unit', 'range'):
+        word = found.get(column)
+        if word and word.left > previous.left:
+            boundaries.append((column, (previous.left + previous.width + word.left) / 2))
+            previous = word
+    return boundaries
+
+
+def split_columns(row, columns):
+    """Assign each word of a row to the column its center falls in"""
+    cells = {column: [] for column, _ in columns}
+    for word in row:
+        center = word.left + word.width / 2
+        column = columns[0][0]
+        for name, start in columns:
+            if center >= start:
+                column = name
+        cells[column].append(word.text)
+    return cells
+
+
+def parse_table_row(cells):
+    """
+    Lab test dict from a row split into columns
+
+    Returns:
+        The lab test, or None if the row has no test name and numeric value
+    """
+    name = clean_test_name(" ".join(cells.get('name', [])))
+    value = None
+    flags = []
+    extra = []
+    for token in cells.get('value', []):
+        match = VALUE_TOKEN.match(token)
+        if value is None and match:
+            value = match.group(1)
+            flags.append(match.group(2))
+        elif FLAG_TOKEN.match(token):
+            flags.append(token)
+        elif value is not None:
+            extra.append(token)
+
+    if (value is None or len(name) < 3 or not name[0].isalpha()
+            or name.upper() in NON_TEST_NAMES or name.upper() in COLUMN_HEADERS):
+        return None
+
+    # Without a unit column, text after the value is the unit
+    unit = " ".join(cells.get('unit', [])) or " ".join(extra) or "-"
+    ref_range = " ".join(cells.get('range', [])) or "N/A"
+    flag = "".join(flags)
+    return {
+        "test_name": name,
+        "value": value,
+        "unit": unit,
+        "reference_range": ref_range,
+        "status": determine_status_from_markers(flag, flag)
+    }
+
+
+def layout_from_words(words):
+    """
+    Read lab tests from word boxes in one pass over the rows
+
+    Rows below a table header are split into test name / value / unit /
+    range columns by x position. Rows holding only range text continue the
+    previous test's reference range. Any other row that has digits or a
+    fallback test keyword is left for the text-based extractors.
+    """
+    rows = group_rows(words)
+    lab_tests = []
+    unresolved = []
+    columns = None
+    previous_test = None
+
+    for row in rows:
+        text = row_text(row)
+        header = find_columns(row)
+        if header:
+            columns, previous_test = header, None
+            continue
+
+        if columns:
+            cells = split_columns(row, columns)
+            test = parse_table_row(cells)
+            if test:
+                lab_tests.append(test)
+                previous_test = test
+                continue
+            only_range = cells.get('range') and not any(
+                cells[column] for column in cells if column != 'range'
+            )
+            if only_range and previous_test:
+                previous_test['reference_range'] += " " + " ".join(cells['range'])
+                continue
+            previous_test = None
+
+        if DIGIT.search(text) or FALLBACK_SCANNER_IGNORECASE.search(text):
+            unresolved.append(text)
+
+    return OcrLayout(
+        text="\n".join(row_text(row) for row in rows) + "\n",
+        lab_tests=lab_tests,
+        unresolved_text="\n".join(unresolved)
+    )
+
@@ -0,0 +1,134 @@
+import os
+import shlex
+import numpy as np
+from PIL import Image, ImageOps
+
+# Set OCR_PREPROCESS=0 to hand tesseract the original image
+OCR_PREPROCESS = os.environ.get("OCR_PREPROCESS", "1").lower() not in ("0", "false", "no", "off")
+
+# Text line height range (ascender to descender, pixels) tesseract reads well;
+# taller text is downscaled to MAX_LINE_HEIGHT, smaller text upscaled to MIN_LINE_HEIGHT
+MAX_LINE_HEIGHT = int(os.environ.get("OCR_MAX_LINE_HEIGHT", 32))
+MIN_LINE_HEIGHT = int(os.environ.get("OCR_MIN_LINE_HEIGHT", 18))
+MIN_SCALE = 0.3
+MAX_SCALE = 2.0
+
+# Skew search range and step in degrees
+MAX_SKEW_ANGLE = 5.0
+SKEW_STEP = 0.5
+# Width the skew search runs at; the final rotation uses the full image
+SKEW_SEARCH_WIDTH = 800
+
+# Characters that appear in lab tables (spaces are always allowed), including
+# the High/Low arrows and the µ, ^ and ' of units such as µg/dL and 10^3/µL
+OCR_WHITELIST = (
+    "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789"
+    ".,:;-/()%<>=+*#&[]_↑↓µ^'"
+)
+# Set OCR_CHAR_WHITELIST=1 to restrict tesseract to OCR_WHITELIST; off by
+# default so characters missing from it are never dropped from reports
+OCR_CHAR_WHITELIST = os.environ.get("OCR_CHAR_WHITELIST", "0").lower() in ("1", "true", "yes", "on")
+# psm 6: one uniform block of text, which keeps table rows on one line
+# (pytesseract splits the config like a shell, hence the quoting)
+OCR_CONFIG = os.environ.get(
+    "OCR_CONFIG",
+    "--oem 1 --psm 6 --dpi 300 -c preserve_interword_spaces=1"
+    + (f" -c tessedit_char_whitelist={shlex.quote(OCR_WHITELIST)}" if OCR_CHAR_WHITELIST else "")
+)
+
+
+def otsu_threshold(gray):
+    """Otsu's global threshold for a uint8 grayscale array"""
+    hist = np.bincount(gray.ravel(), minlength=256).astype(np.float64)
+    total = hist.sum()
+    weight_bg = np.cumsum(hist)
+    weight_fg = total - weight_bg
+    cum_mean = np.cumsum(hist * np.arange(256))
+    mean_bg = cum_mean / np.maximum(weight_bg, 1)
+    mean_fg = (cum_mean[-1] - cum_mean) / np.maximum(weight_fg, 1)
+    between = weight_bg * weight_fg * (mean_bg - mean_fg) ** 2
+    return int(np.argmax(between))
+
+
+def estimate_skew(ink):
+    """
+    Skew angle (degrees) that makes text rows most horizontal
+
+    Args:
+        ink: Boolean array, True where a pixel is text
+
+    Returns:
+        Angle to rotate the image by (PIL convention, counter-clockwise)
+    """
+    ink_image = Image.fromarray(ink.astype(np.uint8) * 255)
+    best_angle, best_score = 0.0, -1.0
+    for angle in np.arange(-MAX_SKEW_ANGLE, MAX_SKEW_ANGLE + SKEW_STEP / 2, SKEW_STEP):
+        rotated = np.asarray(ink_image.rotate(float(angle), resample=Image.NEAREST))
+        # Aligned rows give a spiky row profile, i.e. a large variance
+        score = float(rotated.sum(axis=1, dtype=np.float64).var())
+        if score > best_score:
+            best_angle, best_score = float(angle), score
+    return best_angle
+
+
+def estimate_line_height(ink):
+    """Median height in pixels of the text lines in ink, or None if there are too few"""
+    row_ink = ink.sum(axis=1)
+    is_text_row = row_ink > max(2, ink.shape[1] * 0.005)
+
+    heights = []
+    run = 0
+    for text_row in is_text_row:
+        if text_row:
+            run += 1
+        elif run:
+            heights.append(run)
+            run = 0
+    if run:
+        heights.append(run)
+
+    heights = [h for h in heights if h >= 3]
+    if len(heights) < 3:
+        return None
+    return float(np.median(heights))
+
+
+def preprocess_for_ocr(img):
+    """
+    Grayscale, deskew, rescale and binarize an image for tesseract
+
+    The image is scaled so text lines are MIN_LINE_HEIGHT to MAX_LINE_HEIGHT
+    pixels high, which shrinks high-resolution photos and scans before OCR.
+
+    Args:
+        img: PIL image (any mode)
+
+    Returns:
+        Black-on-white PIL image in mode "L"
+    """
+    gray = ImageOps.exif_transpose(img).convert("L")
+    threshold = otsu_threshold(np.asarray(gray))
+
+    # Find the skew angle on a small copy
+    search_scale = min(1.0, SKEW_SEARCH_WIDTH / gray.width)
+    small = gray.resize(
+        (max(1, int(gray.width * search_scale)), max(1, int(gray.height * search_scale))),
+        Image.BILINEAR
+    ) if search_scale < 1.0 else gray
+    angle = estimate_skew(np.asarray(small) < threshold)
+    if angle:
+        gray = gray.rotate(angle, resample=Image.BILINEAR, expand=True, fillcolor=255)
+
+    line_height = estimate_line_height(np.asarray(gray) < threshold)
+    if line_height and not MIN_LINE_HEIGHT <= line_height <= MAX_LINE_HEIGHT:
+        target = MAX_LINE_HEIGHT if line_height > MAX_LINE_HEIGHT else MIN_LINE_HEIGHT
+        scale = min(MAX_SCALE, max(MIN_SCALE, target / line_height))
+        if abs(scale - 1.0) > 0.1:
+            gray = gray.resize(
+                (max(1, int(gray.width * scale)), max(1, int(gray.height * scale))),
+                Image.LANCZOS
+            )
+
+    pixels = np.asarray(gray)
+    binary = np.where(pixels < otsu_threshold(pixels), 0, 255).astype(np.uint8)
+    return Image.fromarray(binary, mode="L")
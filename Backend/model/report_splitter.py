@@ -0,0 +1,188 @@
+import re
+from collections import namedtuple
+from model.metrics import metrics, timed
+from model.ner_extractor import HEADER_LINE_SCANNER, NAME_PATTERNS, UHID_PATTERNS, extract_all
+
+# Splitting batched files (one PDF holding the reports of many patients) into
+# one report per patient. Lines are read as pages arrive: a run of header
+# lines that names a different patient than the report being collected
+# starts a new report, and the finished one is handed out right away, so
+# only the current report is ever held in memory.
+
+# One patient's report: its text and the (1-based) pages it spans
+Report = namedtuple('Report', ['text', 'first_page', 'last_page'])
+
+# Header lines a new report can start on: patient identity fields and
+# facility banners. Earlier lines of the same header block (report dates,
+# page footers) stay with the previous report.
+REPORT_START_PATTERN = re.compile(
+    r'patient\s*+(?:name|id)|uhid|ipid|\bmrn\b|hospital|pathology|laborator|diagnostic', re.IGNORECASE
+)
+
+# Report fragments shorter than this (stray footers, blank pages) are not extracted
+MIN_REPORT_CHARS = 50
+
+
+def _identity_key(value):
+    return " ".join(value.upper().split()) if value else None
+
+
+def patient_identity(text):
+    """
+    UHID and patient name found in a header block
+
+    Returns:
+        (uhid, name), normalized for comparison; None where not found
+    """
+    uhid = name = None
+    for pattern in UHID_PATTERNS:
+        match = pattern.search(text)
+        if match:
+            uhid = _identity_key(match.group(1))
+            break
+    # The bare "Patient ..." pattern is too loose to tell patients apart
+    for pattern in NAME_PATTERNS[:2]:
+        match = pattern.search(text)
+        if match:
+            name = _identity_key(match.group(1))
+            break
+    return uhid, name
+
+
+def is_other_patient(current, new):
+    """
+    True if identity new belongs to a different patient than current
+
+    UHIDs are compared when both have one, else names; identities with
+    nothing to compare are treated as the same patient.
+    """
+    for current_value, new_value in zip(current, new):
+        if current_value and new_value:
+            return current_value != new_value
+    return False
+
+
+class ReportSplitter:
+    """
+    Incremental splitter over the pages of a batched file
+
+    feed() takes one page at a time and returns the reports completed by
+    it; finish() returns the last one. A report is only split off once it
+    has lines outside its header and a later header block names another
+    patient, so continuation pages that repeat the header (or a header
+    without a name or UHID) stay with their report.
+    """
+
+    def __init__(self):
+        self._lines = []       # (page, line) of the report being collected
+        self._block = []       # header block not yet assigned to a report
+        self._identity = (None, None)
+        self._has_body = False
+
+    def feed(self, page_text, page_number):
+        """
+        Add one page of text
+
+        Returns:
+            List of Reports completed by this page
+        """
+        reports = []
+        for line in page_text.split("\n"):
+            if not line.strip():
+                (self._block if self._block else self._lines).append((page_number, line))
+            elif HEADER_LINE_SCANNER[1].search(line) or REPORT_START_PATTERN.search(line):
+                self._block.append((page_number, line))
+            else:
+                report = self._close_block()
+                if report:
+                    reports.append(report)
+                self._lines.append((page_number, line))
+                self._has_body = True
+        return reports
+
+    def finish(self):
+        """
+        The report still being collected (None if it is empty)
+
+        The splitter can be reused for another file afterwards.
+        """
+        report = self._close_block()
+        if report:
+            return report
+        report = self._report(self._lines)
+        self._lines, self._identity, self._has_body = [], (None, None), False
+        return report
+
+    def _close_block(self):
+        """Assign the pending header block, returning the previous report if it starts a new one"""
+        if not self._block:
+            return None
+        block, self._block = self._block, []
+        identity = patient_identity("\n".join(line for _, line in block))
+
+        if self._has_body and is_other_patient(self._identity, identity):
+            start = next((index for index, (_, line) in enumerate(block)
+                          if REPORT_START_PATTERN.search(line)), 0)
+            report = self._report(self._lines + block[:start])
+            self._lines, self._identity, self._has_body = block[start:], identity, False
+            return report
+
+        self._lines.extend(block)
+        self._identity = tuple(current or new for current, new in zip(self._identity, identity))
+        return None
+
+    @staticmethod
+    def _report(lines):
+        if not lines:
+            return None
+        return Report(
+            text="\n".join(line for _, line in lines) + "\n",
+            first_page=lines[0][0],
+            last_page=lines[-1][0],
+        )
+
+
+def split_reports(pages):
+    """
+    Split a stream of page texts into per-patient reports
+
+    Args:
+        pages: Iterable of page texts in page order (e.g. iter_pdf_pages)
+
+    Yields:
+        Report for each patient, as soon as the next patient's header is read
+    """
+    splitter = ReportSplitter()
+    for page_number, page_text in enumerate(pages, start=1):
+        with timed("split_reports"):
+            reports = splitter.feed(page_text, page_number)
+        yield from reports
+    report = splitter.finish()
+    if report:
+        yield report
+
+
+def extract_reports(pages, min_chars=MIN_REPORT_CHARS):
+    """
+    Run extract_all on every report of a batched file as soon as it is complete
+
+    report_metadata of each result gets report_index (0-based, counting
+    extracted reports) and pages ([first, last]).
+
+    Args:
+        pages: Iterable of page texts in page order
+        min_chars: Reports with less text than this are skipped
+
+    Yields:
+        (Report, extract_all result)
+    """
+    index = 0
+    for report in split_reports(pages):
+        if len(report.text.strip()) < min_chars:
+            continue
+        metrics.inc("reports_split_total")
+        result = extract_all(report.text)
+        result["report_metadata"]["report_index"] = index
+        result["report_metadata"]["pages"] = [report.first_page, report.last_page]
+        index += 1
+        yield report, result
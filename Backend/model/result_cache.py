@@ -0,0 +1,106 @@
+import copy
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+# Maximum number of uploads remembered (least recently used are evicted)
+RESULT_CACHE_SIZE = int(os.environ.get("RESULT_CACHE_SIZE", 256))
+# Directory for persisting cache entries across restarts (disabled if unset)
+RESULT_CACHE_DIR = os.environ.get("RESULT_CACHE_DIR") or None
+
+
+def hash_bytes(data):
+    """SHA-256 hex digest of uploaded file contents"""
+    return hashlib.sha256(data).hexdigest()
+
+
+class ResultCache:
+    """
+    LRU cache of extraction results keyed by the SHA-256 of the uploaded file
+
+    Each entry is a dict that may hold:
+        text: Raw text returned by extract_text
+        result: Output of extract_all
+        rows_added: Rows appended to the results store for this upload
+    """
+
+    def __init__(self, max_entries=RESULT_CACHE_SIZE, cache_dir=RESULT_CACHE_DIR):
+        self.max_entries = max_entries
+        self.cache_dir = cache_dir
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+        if self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            self._load_from_disk()
+
+    def get(self, key):
+        """Return a copy of the cached entry, or None on a miss"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return copy.deepcopy(entry)
+
+    def update(self, key, **fields):
+        """Merge fields into the entry for key, creating it if needed"""
+        with self._lock:
+            entry = self._entries.pop(key, {})
+            entry.update(copy.deepcopy(fields))
+            self._entries[key] = entry
+            self._persist(key, entry)
+
+            while len(self._entries) > self.max_entries:
+                evicted_key, _ = self._entries.popitem(last=False)
+                self._remove_file(evicted_key)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def _persist(self, key, entry):
+        if not self.cache_dir:
+            return
+        try:
+            tmp_path = self._entry_path(key) + ".tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(entry, f)
+            os.replace(tmp_path, self._entry_path(key))
+        except Exception as e:
+            print(f"Warning: Could not persist cache entry: {str(e)}")
+
+    def _remove_file(self, key):
+        if not self.cache_dir:
+            return
+        try:
+            os.remove(self._entry_path(key))
+        except OSError:
+            pass
+
+    def _load_from_disk(self):
+        """Reload persisted entries, oldest first, keeping the newest max_entries"""
+        paths = [
+            os.path.join(self.cache_dir, name) for name in os.listdir(self.cache_dir)
+            if name.endswith(".json")
+        ]
+        paths.sort(key=os.path.getmtime)
+        for path in paths[-self.max_entries:] if self.max_entries else []:
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    self._entries[os.path.basename(path)[:-len(".json")]] = json.load(f)
+            except Exception:
+                continue
+        for path in paths[:-self.max_entries] if self.max_entries else paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
@@ -0,0 +1,596 @@
+import os
+import re
+import sqlite3
+from contextlib import closing, contextmanager
+from datetime import datetime, time
+from functools import lru_cache
+
+RESULTS_DB_PATH = "lab_results.db"
+
+# Column set shared with the Excel export (order matters)
+RESULT_COLUMNS = [
+    'Patient_Name',
+    'Age',
+    'Sex',
+    'UHID',
+    'Episode',
+    'Ref_Doctor',
+    'Test_Name',
+    'Test_Value',
+    'Unit',
+    'Reference_Range',
+    'Status',
+    'Bill_No',
+    'Facility',
+    'Sample_No',
+    'Collection_Date',
+    'Report_Date',
+    'Extraction_Date'
+]
+
+# Date columns, stored as the text found in the report
+DATE_COLUMNS = ('Collection_Date', 'Report_Date', 'Extraction_Date')
+
+# Parsed Collection_Date ("YYYY-MM-DD HH:MM:SS", NULL if unparseable) stored
+# next to the extracted text so date ranges can use an index
+COLLECTION_DATE_ISO = 'Collection_Date_ISO'
+
+# Value, unit and reference range converted to the canonical unit by
+# model.value_normalizer when rows are appended or re-flagged, and the status
+# the extractor read from the report's markers (Status holds the range-based
+# one; re-flagging always starts again from Marker_Status)
+NORMALIZED_COLUMNS = {
+    'Value_Numeric': 'REAL',
+    'Canonical_Unit': 'TEXT',
+    'Range_Low': 'REAL',
+    'Range_High': 'REAL',
+    'Marker_Status': 'TEXT',
+}
+MARKER_STATUS = 'Marker_Status'
+
+# Bumped (PRAGMA user_version) whenever initialize_store migrates the schema
+SCHEMA_VERSION = 3
+
+# Indexes behind query_results; names and tests match case-insensitively
+QUERY_INDEXES = {
+    'idx_results_uhid_test_date': f'"UHID", "Test_Name" COLLATE NOCASE, {COLLECTION_DATE_ISO}',
+    'idx_results_uhid_date': f'"UHID", {COLLECTION_DATE_ISO}',
+    'idx_results_patient_date': f'"Patient_Name" COLLATE NOCASE, {COLLECTION_DATE_ISO}',
+    'idx_results_test_date': f'"Test_Name" COLLATE NOCASE, {COLLECTION_DATE_ISO}',
+    'idx_results_date': COLLECTION_DATE_ISO,
+}
+
+# Page size limits for query_results
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+# Running counters kept in store_meta
+STATS_KEYS = ('total_records', 'unique_patients', 'unique_uhids')
+
+# Report dates as extracted ("05-Jan-2024 09:30 am", "5/Jan/24") and the
+# ISO timestamps written for Extraction_Date
+REPORT_DATE_PATTERN = re.compile(
+    r'^(\d{1,2})[-/]([A-Za-z]{3})[-/](\d{2,4})(?:\s+(\d{1,2}):(\d{2})(?:\s*([ap]m))?)?$',
+    re.IGNORECASE
+)
+MONTHS = {name: number for number, name in enumerate(
+    ('jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec'), start=1
+)}
+
+_initialized_paths = set()
+
+_COLUMN_LIST = ", ".join(f'"{column}"' for column in RESULT_COLUMNS)
+_NORMALIZED_LIST = ", ".join(NORMALIZED_COLUMNS)
+_INSERT_SQL = (
+    f'INSERT INTO lab_results ({_COLUMN_LIST}, {COLLECTION_DATE_ISO}, {_NORMALIZED_LIST}) '
+    f'VALUES ({", ".join("?" for _ in RESULT_COLUMNS)}, ?, {", ".join("?" for _ in NORMALIZED_COLUMNS)})'
+)
+_COLLECTION_DATE_INDEX = RESULT_COLUMNS.index('Collection_Date')
+_STATUS_INDEX = RESULT_COLUMNS.index('Status')
+
+
+def get_connection():
+    """Open a connection to the results store"""
+    # isolation_level=None: transactions are opened explicitly by write_transaction()
+    return sqlite3.connect(RESULTS_DB_PATH, timeout=30, isolation_level=None)
+
+
+@contextmanager
+def write_transaction():
+    """
+    Connection holding SQLite's write lock for the whole block
+
+    BEGIN IMMEDIATE takes the lock up front, so concurrent writers from other
+    threads or worker processes queue behind it (for up to the connection
+    timeout) instead of failing when a read lock is upgraded mid-transaction.
+    """
+    with closing(get_connection()) as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+
+def store_exists():
+    return os.path.exists(RESULTS_DB_PATH)
+
+
+def initialize_store():
+    """Create the results tables if they don't exist (once per process)"""
+    if RESULTS_DB_PATH in _initialized_paths and store_exists():
+        return RESULTS_DB_PATH
+
+    column_defs = ",\n            ".join(
+        f'"{column}" INTEGER' if column == 'Age' else f'"{column}" TEXT'
+        for column in RESULT_COLUMNS
+    )
+    with closing(get_connection()) as conn:
+        # WAL lets /health and exports read while another worker is appending
+        conn.execute("PRAGMA journal_mode=WAL")
+    with write_transaction() as conn:
+        conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS lab_results (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            {column_defs},
+            {COLLECTION_DATE_ISO} TEXT,
+            {", ".join(f"{column} {kind}" for column, kind in NORMALIZED_COLUMNS.items())}
+            )
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS store_meta (
+                key TEXT PRIMARY KEY,
+                value
+            )
+        """)
+        _create_stats_tables(conn)
+        # State of async analysis jobs (model.job_queue), shared by all server processes
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                submitted_at REAL,
+                started_at REAL,
+                finished_at REAL,
+                result TEXT,
+                error TEXT
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status)")
+        _migrate(conn)
+        if conn.execute("SELECT 1 FROM lab_results LIMIT 1").fetchone() is None:
+            conn.executemany(
+                "INSERT OR IGNORE INTO store_meta (key, value) VALUES (?, 0)",
+                [(key,) for key in STATS_KEYS]
+            )
+    _initialized_paths.add(RESULTS_DB_PATH)
+    return RESULTS_DB_PATH
+
+
+def _create_stats_tables(conn):
+    # Distinct-value sets backing the running patient counters
+    conn.execute("CREATE TABLE IF NOT EXISTS patient_names (name TEXT PRIMARY KEY)")
+    conn.execute("CREATE TABLE IF NOT EXISTS patient_uhids (uhid TEXT PRIMARY KEY)")
+    # Running maximum display length per column, used for Excel column widths
+    conn.execute("CREATE TABLE IF NOT EXISTS column_widths (name TEXT PRIMARY KEY, width INTEGER)")
+
+
+def _migrate(conn):
+    """Bring a store created by an older version up to SCHEMA_VERSION (same transaction)"""
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    if version >= SCHEMA_VERSION:
+        return
+
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(lab_results)")}
+    if COLLECTION_DATE_ISO not in columns:
+        conn.execute(f"ALTER TABLE lab_results ADD COLUMN {COLLECTION_DATE_ISO} TEXT")
+        cursor = conn.execute('SELECT id, "Collection_Date" FROM lab_results')
+        updates = []
+        while True:
+            batch = cursor.fetchmany(5000)
+            if not batch:
+                break
+            updates.extend((iso_date(value), row_id) for row_id, value in batch)
+        conn.executemany(f"UPDATE lab_results SET {COLLECTION_DATE_ISO} = ? WHERE id = ?", updates)
+        print(f"✓ Added {COLLECTION_DATE_ISO} to {len(updates)} stored rows")
+
+    added = [column for column in NORMALIZED_COLUMNS if column not in columns]
+    for column in added:
+        conn.execute(f"ALTER TABLE lab_results ADD COLUMN {column} {NORMALIZED_COLUMNS[column]}")
+    if any(column != MARKER_STATUS for column in added):
+        # Filled in by reflag_results(), which may also change stored statuses
+        print("⚠ Stored rows predate value normalization; run POST /results/reflag to fill it in")
+    # Older rows lost their marker status to re-flagging; reflag_results
+    # falls back to Status for them (Marker_Status NULL)
+
+    for name, columns in QUERY_INDEXES.items():
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {name} ON lab_results ({columns})")
+    conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+
+def append_rows(rows):
+    """
+    Append result rows to the store in a single transaction
+
+    Args:
+        rows: Iterable of dicts keyed by RESULT_COLUMNS
+
+    Returns:
+        Number of rows added
+    """
+    values = [tuple(row.get(column) for column in RESULT_COLUMNS) for row in rows]
+    if not values:
+        return 0
+
+    values, normalized = normalize_rows(values)
+    with write_transaction() as conn:
+        conn.executemany(_INSERT_SQL, [
+            row + (iso_date(row[_COLLECTION_DATE_INDEX]),) + extra for row, extra in zip(values, normalized)
+        ])
+        _update_stats(conn, rows=values)
+    return len(values)
+
+
+def normalize_rows(values):
+    """
+    Run the value normalizer over row tuples (RESULT_COLUMNS order)
+
+    Args:
+        values: Row tuples whose Status is the marker status from the extractor
+
+    Returns:
+        (rows with the re-flagged Status, list of NORMALIZED_COLUMNS tuples)
+    """
+    # pandas is only loaded once rows are actually written
+    from model.value_normalizer import normalize_results, nullable
+
+    columns = list(zip(*values))
+    result = normalize_results(
+        *(columns[RESULT_COLUMNS.index(column)]
+          for column in ('Test_Name', 'Test_Value', 'Unit', 'Reference_Range', 'Status'))
+    )
+    rows = [row[:_STATUS_INDEX] + (status,) + row[_STATUS_INDEX + 1:]
+            for row, status in zip(values, result['status'].tolist())]
+    normalized = list(zip(
+        nullable(result['value']), result['unit'].tolist(),
+        nullable(result['range_low']), nullable(result['range_high']),
+        columns[_STATUS_INDEX]
+    ))
+    return rows, normalized
+
+
+def reflag_results(batch_size=50000):
+    """
+    Re-run value normalization and status flagging over every stored row
+
+    Rows are processed batch_size at a time, each batch in its own transaction.
+    Flagging starts from each row's Marker_Status, so running it again (or
+    after a change to the normalizer) never compounds earlier results.
+
+    Returns:
+        Dict with rows_checked and status_changes
+    """
+    last_id = 0
+    checked = changed = 0
+    while True:
+        with closing(get_connection()) as conn:
+            batch = conn.execute(
+                f"SELECT id, {_COLUMN_LIST}, {MARKER_STATUS} FROM lab_results WHERE id > ? ORDER BY id LIMIT ?",
+                (last_id, batch_size)
+            ).fetchall()
+        if not batch:
+            break
+        last_id = batch[-1][0]
+        ids = [row[0] for row in batch]
+        stored = [row[1:-1] for row in batch]
+        # Rows stored before Marker_Status existed keep flagging from Status
+        values = [
+            values if marker is None else values[:_STATUS_INDEX] + (marker,) + values[_STATUS_INDEX + 1:]
+            for values, marker in zip(stored, (row[-1] for row in batch))
+        ]
+        rows, normalized = normalize_rows(values)
+        changed += sum(1 for old, new in zip(stored, rows) if old[_STATUS_INDEX] != new[_STATUS_INDEX])
+        checked += len(rows)
+        with write_transaction() as conn:
+            conn.executemany(
+                f'UPDATE lab_results SET "Status" = ?, '
+                f'{", ".join(f"{column} = ?" for column in NORMALIZED_COLUMNS)} WHERE id = ?',
+                [(row[_STATUS_INDEX],) + extra + (row_id,) for row, extra, row_id in zip(rows, normalized, ids)]
+            )
+    if changed:
+        with write_transaction() as conn:
+            # Statuses can get shorter too, so the running maximum is recomputed
+            conn.execute(
+                'UPDATE column_widths SET width = (SELECT MAX(?, COALESCE(MAX(LENGTH("Status")), 0)) '
+                "FROM lab_results) WHERE name = 'Status'",
+                (len('Status'),)
+            )
+        # The workbook holds the old statuses
+        set_meta('excel_export_row_id', None)
+    return {'rows_checked': checked, 'status_changes': changed}
+
+
+def _is_known(value):
+    return value is not None and str(value).strip() not in ('', 'N/A')
+
+
+def _add_distinct(conn, table, column, values):
+    """Insert values into a distinct-value set, returning how many were new"""
+    before = conn.total_changes
+    conn.executemany(
+        f"INSERT OR IGNORE INTO {table} ({column}) VALUES (?)",
+        [(str(value).strip(),) for value in values if _is_known(value)]
+    )
+    return conn.total_changes - before
+
+
+def _update_stats(conn, rows):
+    """Bump the running counters for newly inserted rows (same transaction)"""
+    name_idx = RESULT_COLUMNS.index('Patient_Name')
+    uhid_idx = RESULT_COLUMNS.index('UHID')
+    new_names = _add_distinct(conn, 'patient_names', 'name', {row[name_idx] for row in rows})
+    new_uhids = _add_distinct(conn, 'patient_uhids', 'uhid', {row[uhid_idx] for row in rows})
+    conn.executemany(
+        "UPDATE store_meta SET value = value + ? WHERE key = ?",
+        [(len(rows), 'total_records'), (new_names, 'unique_patients'), (new_uhids, 'unique_uhids')]
+    )
+    _update_column_widths(conn, rows)
+
+
+def _update_column_widths(conn, rows):
+    widths = [len(column) for column in RESULT_COLUMNS]
+    for row in rows:
+        for index, value in enumerate(row):
+            if value is not None:
+                widths[index] = max(widths[index], len(str(value)))
+    conn.executemany("""
+        INSERT INTO column_widths (name, width) VALUES (?, ?)
+        ON CONFLICT(name) DO UPDATE SET width = MAX(width, excluded.width)
+    """, list(zip(RESULT_COLUMNS, widths)))
+
+
+def get_column_widths():
+    """
+    Longest value (or header) length seen so far for each column
+
+    Returns None when no widths are recorded yet (e.g. a store that predates them)
+    """
+    with closing(get_connection()) as conn:
+        widths = dict(conn.execute("SELECT name, width FROM column_widths").fetchall())
+    if not widths:
+        return None
+    return {column: widths.get(column, len(column)) for column in RESULT_COLUMNS}
+
+
+def iter_rows(batch_size=5000, max_id=None):
+    """Yield stored rows (as tuples in RESULT_COLUMNS order) in insertion order, up to max_id"""
+    with closing(get_connection()) as conn:
+        cursor = conn.execute(
+            f"SELECT {_COLUMN_LIST} FROM lab_results WHERE id <= ? ORDER BY id",
+            (max_id if max_id is not None else get_last_row_id(),)
+        )
+        while True:
+            batch = cursor.fetchmany(batch_size)
+            if not batch:
+                break
+            yield from batch
+
+
+def iter_row_batches(min_id=None, max_id=None, batch_size=5000, date_from=None, date_to=None):
+    """
+    Yield stored rows in insertion order, batch by batch
+
+    Args:
+        min_id, max_id: Inclusive row id range (defaults to every stored row)
+        batch_size: Rows per batch
+        date_from, date_to: Inclusive Collection_Date bounds (datetime or None),
+            applied in SQL on the indexed Collection_Date_ISO; rows without a
+            parseable date are left out when either is given
+
+    Yields:
+        Lists of tuples: the row id followed by the RESULT_COLUMNS values
+    """
+    # With a date range, +id keeps the planner from scanning the id range
+    # instead of using idx_results_date
+    conditions = ["+id BETWEEN ? AND ?" if date_from or date_to else "id BETWEEN ? AND ?"]
+    params = [min_id or 0, max_id if max_id is not None else get_last_row_id()]
+    if date_from:
+        conditions.append(f"{COLLECTION_DATE_ISO} >= ?")
+        params.append(date_from.isoformat(sep=' '))
+    if date_to:
+        conditions.append(f"{COLLECTION_DATE_ISO} <= ?")
+        params.append(date_to.isoformat(sep=' '))
+    with closing(get_connection()) as conn:
+        cursor = conn.execute(
+            f"SELECT id, {_COLUMN_LIST} FROM lab_results WHERE {' AND '.join(conditions)} ORDER BY id",
+            params
+        )
+        while True:
+            batch = cursor.fetchmany(batch_size)
+            if not batch:
+                break
+            yield batch
+
+
+@lru_cache(maxsize=4096)
+def parse_report_date(value):
+    """
+    Parse a stored date value into a datetime
+
+    Returns:
+        datetime, or None if the value is missing or not a recognised date
+    """
+    if not isinstance(value, str):
+        return None
+    value = value.strip()
+    match = REPORT_DATE_PATTERN.match(value)
+    if match:
+        day, month, year, hour, minute, meridiem = match.groups()
+        month = MONTHS.get(month.lower())
+        year = int(year) + 2000 if len(year) == 2 else int(year)
+        hour = int(hour or 0)
+        if meridiem:
+            hour = hour % 12 + (12 if meridiem.lower() == 'pm' else 0)
+        try:
+            return datetime(year, month, int(day), hour, int(minute or 0))
+        except (TypeError, ValueError):
+            return None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        return None
+
+
+def iso_date(value):
+    """Stored date value as "YYYY-MM-DD HH:MM:SS", or None if it cannot be parsed"""
+    parsed = parse_report_date(value)
+    return parsed.isoformat(sep=' ') if parsed else None
+
+
+def parse_date_bound(value, end=False):
+    """
+    Parse a from/to query value (YYYY-MM-DD or full ISO timestamp)
+
+    A bare date used as an upper bound covers that whole day.
+
+    Raises:
+        ValueError: If the value is not an ISO date
+    """
+    if value is None or value == '':
+        return None
+    parsed = datetime.fromisoformat(value)
+    if end and len(value) == 10:
+        parsed = datetime.combine(parsed.date(), time.max)
+    return parsed
+
+
+def query_results(uhid=None, patient_name=None, test_name=None,
+                  date_from=None, date_to=None, limit=DEFAULT_PAGE_SIZE, cursor=None):
+    """
+    Page through stored rows matching the given filters, oldest collection first
+
+    Every filter combination is served by one of QUERY_INDEXES and pages
+    continue from a cursor (collection date, row id) rather than an OFFSET,
+    so a page costs the same however many rows are stored or skipped.
+    Patient and test names match case-insensitively.
+
+    Args:
+        uhid, patient_name, test_name: Exact-match filters (None = any)
+        date_from, date_to: Inclusive Collection_Date bounds (datetime or None)
+        limit: Page size (capped at MAX_PAGE_SIZE)
+        cursor: next_cursor of the previous page
+
+    Returns:
+        Dict with 'results' (row dicts with Row_Id, the NORMALIZED_COLUMNS
+        and Collection_Date_ISO)
+        and 'next_cursor' (None on the last page)
+
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    limit = max(1, min(int(limit or DEFAULT_PAGE_SIZE), MAX_PAGE_SIZE))
+    conditions, params = [], []
+    for column, value, collate in (('UHID', uhid, ''), ('Patient_Name', patient_name, ' COLLATE NOCASE'),
+                                   ('Test_Name', test_name, ' COLLATE NOCASE')):
+        if value:
+            conditions.append(f'"{column}" = ?{collate}')
+            params.append(value.strip())
+    if date_from:
+        conditions.append(f"{COLLECTION_DATE_ISO} >= ?")
+        params.append(date_from.isoformat(sep=' '))
+    if date_to:
+        conditions.append(f"{COLLECTION_DATE_ISO} <= ?")
+        params.append(date_to.isoformat(sep=' '))
+
+    if cursor:
+        cursor_date, separator, cursor_id = cursor.rpartition('|')
+        if not separator or not cursor_id.isdigit():
+            raise ValueError(f"Invalid cursor '{cursor}'")
+        if cursor_date:
+            conditions.append(f"({COLLECTION_DATE_ISO}, id) > (?, ?)")
+            params.extend([cursor_date, int(cursor_id)])
+        else:
+            # Rows without a parseable date sort first
+            conditions.append(f"({COLLECTION_DATE_ISO} IS NOT NULL OR id > ?)")
+            params.append(int(cursor_id))
+
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    with closing(get_connection()) as conn:
+        rows = conn.execute(
+            f"SELECT id, {_COLUMN_LIST}, {_NORMALIZED_LIST}, {COLLECTION_DATE_ISO} FROM lab_results {where} "
+            f"ORDER BY {COLLECTION_DATE_ISO}, id LIMIT ?",
+            params + [limit + 1]
+        ).fetchall()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = f"{rows[-1][-1] or ''}|{rows[-1][0]}"
+    keys = ['Row_Id'] + RESULT_COLUMNS + list(NORMALIZED_COLUMNS) + [COLLECTION_DATE_ISO]
+    return {
+        'results': [dict(zip(keys, row)) for row in rows],
+        'next_cursor': next_cursor
+    }
+
+
+def get_last_row_id():
+    """Id of the most recently appended row (0 for an empty store)"""
+    with closing(get_connection()) as conn:
+        row = conn.execute("SELECT MAX(id) FROM lab_results").fetchone()
+    return row[0] or 0
+
+
+def get_meta(key, default=None):
+    with closing(get_connection()) as conn:
+        row = conn.execute("SELECT value FROM store_meta WHERE key = ?", (key,)).fetchone()
+    return row[0] if row else default
+
+
+def set_meta(key, value):
+    with write_transaction() as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO store_meta (key, value) VALUES (?, ?)",
+            (key, value)
+        )
+
+
+def get_stats():
+    """
+    Read the running counters kept up to date by append_rows
+
+    Returns:
+        Dict with total_records, unique_patients and unique_uhids
+    """
+    with closing(get_connection()) as conn:
+        placeholders = ", ".join("?" for _ in STATS_KEYS)
+        stats = dict(conn.execute(
+            f"SELECT key, value FROM store_meta WHERE key IN ({placeholders})", STATS_KEYS
+        ).fetchall())
+    if len(stats) < len(STATS_KEYS):
+        # Store created before the counters existed
+        return rebuild_stats()
+    return {key: stats[key] for key in STATS_KEYS}
+
+
+def rebuild_stats():
+    """Recompute the counters, distinct-value sets and column widths from the stored rows"""
+    with write_transaction() as conn:
+        conn.execute("DROP TABLE IF EXISTS patient_names")
+        conn.execute("DROP TABLE IF EXISTS patient_uhids")
+        conn.execute("DROP TABLE IF EXISTS column_widths")
+        placeholders = ", ".join("?" for _ in STATS_KEYS)
+        conn.execute(f"DELETE FROM store_meta WHERE key IN ({placeholders})", STATS_KEYS)
+        _create_stats_tables(conn)
+        conn.executemany(
+            "INSERT INTO store_meta (key, value) VALUES (?, 0)",
+            [(key,) for key in STATS_KEYS]
+        )
+        cursor = conn.execute(f"SELECT {_COLUMN_LIST} FROM lab_results")
+        while True:
+            batch = cursor.fetchmany(5000)
+            if not batch:
+                break
+            _update_stats(conn, rows=batch)
+    return get_stats()
@@ -0,0 +1,250 @@
+import re
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+
+# Post-extraction normalization of lab results. Everything works on whole
+# columns: each distinct value / range / unit string of a batch is parsed
+# once (pd.factorize), the results are spread back onto the rows with numpy
+# and the flagging is array arithmetic, so the Python-level work grows with
+# the number of distinct strings rather than the number of rows.
+
+# Unit spelling (lowercase, no spaces) -> (dimension, factor to the
+# dimension's base unit, default canonical unit)
+UNIT_TABLE = {
+    # Mass concentration, base g/L
+    'mg/dl': ('mass_conc', 0.01, 'mg/dL'),
+    'mg%': ('mass_conc', 0.01, 'mg/dL'),
+    'mg/l': ('mass_conc', 0.001, 'mg/dL'),
+    'g/dl': ('mass_conc', 10.0, 'g/dL'),
+    'gm/dl': ('mass_conc', 10.0, 'g/dL'),
+    'gms/dl': ('mass_conc', 10.0, 'g/dL'),
+    'g%': ('mass_conc', 10.0, 'g/dL'),
+    'gm%': ('mass_conc', 10.0, 'g/dL'),
+    'g/l': ('mass_conc', 1.0, 'g/dL'),
+    'gm/l': ('mass_conc', 1.0, 'g/dL'),
+    'µg/dl': ('mass_conc', 1e-5, 'µg/dL'),
+    'ug/dl': ('mass_conc', 1e-5, 'µg/dL'),
+    'mcg/dl': ('mass_conc', 1e-5, 'µg/dL'),
+    'ng/ml': ('mass_conc', 1e-6, 'ng/mL'),
+    'pg/ml': ('mass_conc', 1e-9, 'pg/mL'),
+    # Molar concentration, base mmol/L
+    'mmol/l': ('molar_conc', 1.0, 'mmol/L'),
+    'µmol/l': ('molar_conc', 0.001, 'µmol/L'),
+    'umol/l': ('molar_conc', 0.001, 'µmol/L'),
+    # Enzyme activity, base U/L
+    'iu/l': ('activity', 1.0, 'U/L'),
+    'u/l': ('activity', 1.0, 'U/L'),
+    'units/l': ('activity', 1.0, 'U/L'),
+    'miu/ml': ('activity', 1.0, 'mIU/mL'),
+    # Cell counts, base cells per µL (= per cumm)
+    '/cumm': ('count', 1.0, '/µL'),
+    'cells/cumm': ('count', 1.0, '/µL'),
+    '/µl': ('count', 1.0, '/µL'),
+    '/ul': ('count', 1.0, '/µL'),
+    '/mm3': ('count', 1.0, '/µL'),
+    'thousand/cumm': ('count', 1e3, '10^3/µL'),
+    '10^3/µl': ('count', 1e3, '10^3/µL'),
+    '10^3/ul': ('count', 1e3, '10^3/µL'),
+    'x10^3/ul': ('count', 1e3, '10^3/µL'),
+    'thou/ul': ('count', 1e3, '10^3/µL'),
+    'lakh/cumm': ('count', 1e5, '10^3/µL'),
+    'lakhs/cumm': ('count', 1e5, '10^3/µL'),
+    'lakhs/mm3': ('count', 1e5, '10^3/µL'),
+    'lakhs/µl': ('count', 1e5, '10^3/µL'),
+    'million/cumm': ('count', 1e6, '10^6/µL'),
+    'millions/cumm': ('count', 1e6, '10^6/µL'),
+    'mill/cumm': ('count', 1e6, '10^6/µL'),
+    '10^6/µl': ('count', 1e6, '10^6/µL'),
+    '10^6/ul': ('count', 1e6, '10^6/µL'),
+    'x10^6/ul': ('count', 1e6, '10^6/µL'),
+    # Dimensionless and everything else reported as-is
+    '%': ('percent', 1.0, '%'),
+    'fl': ('volume', 1.0, 'fL'),
+    'pg': ('mass', 1.0, 'pg'),
+    'ratio': ('ratio', 1.0, 'ratio'),
+    'mm/hr': ('rate', 1.0, 'mm/hr'),
+    'sec': ('time', 1.0, 'sec'),
+    'seconds': ('time', 1.0, 'sec'),
+}
+
+# Tests whose values should land in one unit whatever the report used
+# (test name lowercased, spaces collapsed); only applied within a dimension
+CANONICAL_TEST_UNITS = {
+    'total bilirubin': 'mg/dL',
+    'direct bilirubin': 'mg/dL',
+    'indirect bilirubin': 'mg/dL',
+    'total protein': 'g/dL',
+    'albumin': 'g/dL',
+    'globulin': 'g/dL',
+    'haemoglobin': 'g/dL',
+    'hemoglobin': 'g/dL',
+    'mchc': 'g/dL',
+    'mean cell haemoglobin concentration': 'g/dL',
+    'platelet count': '10^3/µL',
+    'total leucocyte count': '10^3/µL',
+    'total wbc count': '10^3/µL',
+    'rbc count': '10^6/µL',
+}
+
+
+def unit_key(unit):
+    """Lookup key of a unit spelling ("Lakhs / Cumm" -> "lakhs/cumm")"""
+    return re.sub(r'\s+', '', str(unit).lower())
+
+
+# Factor of each canonical unit relative to its dimension's base unit
+CANONICAL_FACTORS = {canonical: UNIT_TABLE[unit_key(canonical)][1] for _, _, canonical in UNIT_TABLE.values()}
+
+NUMBER = r'[-+]?(?:\d+(?:\.\d*)?|\.\d+)'
+# Whitespace and trailing text are matched possessively (*+) so garbage
+# ranges from OCR cannot make a match backtrack quadratically
+VALUE_PATTERN = re.compile(rf'^\s*+(?:[<>]=?|≤|≥)?\s*+({NUMBER})\s*+$')
+# Bounds, optionally followed by a unit or other text without digits
+BETWEEN_PATTERN = re.compile(rf'^\s*+({NUMBER})\s*+(?:-|–|to)\s*+({NUMBER})[^\d]*+$')
+UPPER_PATTERN = re.compile(rf'^\s*+(?:<=?|≤|up\s*to|less\s+than|below)\s*+({NUMBER})[^\d]*+$')
+LOWER_PATTERN = re.compile(rf'^\s*+(?:>=?|≥|more\s+than|greater\s+than|above)\s*+({NUMBER})[^\d]*+$')
+
+# Statuses the normalizer can assign
+HIGH, LOW, NORMAL = "High", "Low", "Normal"
+
+
+def _factorize(values):
+    """
+    Codes and distinct values of a column
+
+    Returns:
+        (codes, list of distinct values as strings) - codes is -1 where the value is missing
+    """
+    codes, uniques = pd.factorize(pd.Series(values, dtype=object))
+    return codes, [str(value) for value in uniques]
+
+
+def _spread(codes, unique_values, missing=np.nan):
+    """Map per-distinct-value results back onto the rows (missing where code is -1)"""
+    dtype = np.float64 if missing is np.nan else object
+    return np.append(np.asarray(unique_values, dtype=dtype), np.array([missing], dtype=dtype))[codes]
+
+
+def nullable(array):
+    """Float array as a list with NaN replaced by None (SQL NULL / JSON null)"""
+    return np.where(np.isnan(array), None, array).tolist()
+
+
+@lru_cache(maxsize=65536)
+def parse_value(text):
+    """Number in a result value ("12.5", "<5", "1,200"), NaN if it is not a plain number"""
+    match = VALUE_PATTERN.match(text.replace(',', ''))
+    return float(match.group(1)) if match else np.nan
+
+
+@lru_cache(maxsize=4096)
+def parse_range(text):
+    """
+    (low, high) bounds of a reference range text, NaN for a missing bound
+
+    "0.4-1.0", "2.1 - 5.0 Lakhs/Cumm", "up to 280", "< 40", "> 60"
+    """
+    text = text.replace(',', '').lower()
+    match = BETWEEN_PATTERN.match(text)
+    if match:
+        return float(match.group(1)), float(match.group(2))
+    match = UPPER_PATTERN.match(text)
+    if match:
+        return np.nan, float(match.group(1))
+    match = LOWER_PATTERN.match(text)
+    if match:
+        return float(match.group(1)), np.nan
+    return np.nan, np.nan
+
+
+def parse_values(values):
+    """Numeric value of each result (see parse_value) as a float array"""
+    codes, uniques = _factorize(values)
+    return _spread(codes, [parse_value(text) for text in uniques])
+
+
+def parse_ranges(ranges):
+    """
+    Low and high bounds of each reference range (see parse_range)
+
+    Returns:
+        (low, high) float arrays
+    """
+    codes, uniques = _factorize(ranges)
+    bounds = [parse_range(text) for text in uniques]
+    return (_spread(codes, [low for low, _ in bounds]),
+            _spread(codes, [high for _, high in bounds]))
+
+
+def unit_conversions(units, test_names):
+    """
+    Canonical unit and conversion factor of each result
+
+    Returns:
+        (object array of canonical units, None where the unit is unknown;
+        float array of factors, 1.0 where no conversion applies)
+    """
+    unit_codes, unit_uniques = _factorize(units)
+    entries = [UNIT_TABLE.get(unit_key(unit)) for unit in unit_uniques]
+    dimension = _spread(unit_codes, [entry and entry[0] for entry in entries], None)
+    factor = _spread(unit_codes, [entry[1] if entry else np.nan for entry in entries])
+    canonical = _spread(unit_codes, [entry and entry[2] for entry in entries], None)
+    canonical_factor = _spread(unit_codes, [CANONICAL_FACTORS[entry[2]] if entry else np.nan for entry in entries])
+
+    # A per-test canonical unit wins when it measures the same dimension
+    test_codes, test_uniques = _factorize(test_names)
+    preferred_units = [CANONICAL_TEST_UNITS.get(' '.join(name.lower().split())) for name in test_uniques]
+    preferred = _spread(test_codes, preferred_units, None)
+    preferred_dimension = _spread(
+        test_codes, [unit and UNIT_TABLE[unit_key(unit)][0] for unit in preferred_units], None
+    )
+    preferred_factor = _spread(
+        test_codes, [CANONICAL_FACTORS[unit] if unit else np.nan for unit in preferred_units]
+    )
+    use_preferred = np.not_equal(dimension, None) & (preferred_dimension == dimension)
+    canonical = np.where(use_preferred, preferred, canonical)
+    canonical_factor = np.where(use_preferred, preferred_factor, canonical_factor)
+
+    conversion = np.where(np.isnan(factor), 1.0, factor / canonical_factor)
+    return canonical, conversion
+
+
+def normalize_results(test_names, values, units, ranges, statuses):
+    """
+    Normalize a batch of lab results and flag them against their ranges
+
+    Values and ranges are parsed into numbers and converted to the
+    canonical unit. Where a value and at least one bound are known the
+    status is High / Low / Normal by comparison; otherwise the status found
+    by the extractor (arrow and *H/*L markers) is kept.
+
+    Args:
+        test_names, values, units, ranges, statuses: Equal-length sequences
+            (one entry per result, None allowed)
+
+    Returns:
+        Dict of equal-length arrays: value, unit, range_low, range_high
+        (canonical units, NaN / None when unknown) and status
+    """
+    numeric = parse_values(values)
+    low, high = parse_ranges(ranges)
+    canonical, conversion = unit_conversions(units, test_names)
+    # Rounding drops float noise from the conversion (0.1 * 29 = 2.9000000000000004)
+    numeric = np.round(numeric * conversion, 10)
+    low = np.round(low * conversion, 10)
+    high = np.round(high * conversion, 10)
+
+    status = np.asarray(statuses, dtype=object)
+    status = np.where(np.isnan(numeric), status, np.where(
+        numeric > high, HIGH, np.where(numeric < low, LOW, np.where(
+            np.isnan(low) & np.isnan(high), status, NORMAL
+        ))
+    ))
+    return {
+        'value': numeric,
+        'unit': canonical,
+        'range_low': low,
+        'range_high': high,
+        'status': status,
+    }
@@ -0,0 +1,80 @@
+import io
+import sqlite3
+import time
+import pytest
+import app as app_module
+from model import excel_manager
+from model.job_queue import JobQueue
+from model.result_cache import ResultCache
+from model.results_store import get_last_row_id
+from tests.test_ner_extractor import LFT_WITH_NOTE
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    """Test client with a fresh store and an in-memory result cache"""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(app_module, "result_cache", ResultCache(cache_dir=None))
+    return app_module.app.test_client()
+
+
+def upload(client, data=LFT_WITH_NOTE.encode(), filename="report.txt", query=""):
+    return client.post("/analyze" + query, data={"file": (io.BytesIO(data), filename)},
+                       content_type="multipart/form-data")
+
+
+def test_failed_append_is_not_cached_as_stored(client, monkeypatch):
+    def locked(rows):
+        raise sqlite3.OperationalError("database is locked")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(excel_manager, "append_rows", locked)
+        response = upload(client)
+    assert response.status_code == 500
+    assert get_last_row_id() == 0
+
+    response = upload(client)
+    assert response.status_code == 200
+    export = response.get_json()["excel_export"]
+    assert not export["duplicate"]
+    assert export["rows_added"] > 0
+    assert get_last_row_id() == export["rows_added"]
+
+
+def test_response_status_matches_store(client):
+    response = upload(client)
+    assert response.status_code == 200
+    statuses = [(test["status"], test["marker_status"]) for test in response.get_json()["lab_tests"]]
+    stored = client.get("/results?page_size=500").get_json()["results"]
+    assert statuses == [(row["Status"], row["Marker_Status"]) for row in stored]
+
+
+def test_async_job_can_be_polled_from_any_process(client, monkeypatch):
+    monkeypatch.setattr(app_module, "job_queue", JobQueue(workers=1))
+    response = upload(client, query="?async=true")
+    assert response.status_code == 202
+    job_id = response.get_json()["job_id"]
+
+    deadline = time.time() + 30
+    while (job := client.get(f"/jobs/{job_id}").get_json())["status"] in ("queued", "running"):
+        assert time.time() < deadline
+        time.sleep(0.05)
+    assert job["status"] == "done"
+    assert job["http_status"] == 200
+    assert job["result"]["excel_export"]["rows_added"] > 0
+
+    # Another server process sees the same job through the store
+    monkeypatch.setattr(app_module, "job_queue", JobQueue(workers=0))
+    assert client.get(f"/jobs/{job_id}").get_json()["status"] == "done"
+    assert client.get("/jobs/unknown").status_code == 404
+
+
+def test_queue_limit_is_shared_by_all_processes(client, monkeypatch):
+    # No workers: submitted jobs stay queued
+    monkeypatch.setattr(app_module, "job_queue", JobQueue(workers=0, max_pending=1))
+    assert upload(client, query="?async=true").status_code == 202
+
+    monkeypatch.setattr(app_module, "job_queue", JobQueue(workers=0, max_pending=1))
+    response = upload(client, query="?async=true")
+    assert response.status_code == 429
+    assert "retry" in response.get_json()["error"]
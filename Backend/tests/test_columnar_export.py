@@ -0,0 +1,43 @@
+from datetime import datetime
+import pytest
+from benchmarks import synthetic
+from model.columnar_export import stream_results
+from model.excel_manager import append_lab_results_batch, initialize_excel
+from model.ner_extractor import extract_all
+from model.results_store import iter_row_batches, parse_report_date, RESULT_COLUMNS
+
+pa = pytest.importorskip("pyarrow")
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    initialize_excel()
+    append_lab_results_batch([extract_all(synthetic.lft_report(seed)) for seed in range(30)])
+    return tmp_path
+
+
+def exported_ids(**filters):
+    data = b"".join(stream_results('arrow', **filters))
+    return pa.ipc.open_stream(data).read_all().column('Row_Id').to_pylist()
+
+
+def test_collection_date_range_matches_parsed_dates(store):
+    date_from, date_to = datetime(2024, 3, 1), datetime(2024, 8, 31, 23, 59, 59)
+    index = RESULT_COLUMNS.index('Collection_Date') + 1
+    expected = [
+        row[0] for rows in iter_row_batches() for row in rows
+        if (date := parse_report_date(row[index])) and date_from <= date <= date_to
+    ]
+    assert expected
+    assert exported_ids(date_from=date_from, date_to=date_to) == expected
+
+
+def test_open_ended_collection_date_range(store):
+    date_from = datetime(2024, 6, 1)
+    index = RESULT_COLUMNS.index('Collection_Date') + 1
+    expected = [
+        row[0] for rows in iter_row_batches() for row in rows
+        if (date := parse_report_date(row[index])) and date >= date_from
+    ]
+    assert exported_ids(date_from=date_from) == expected
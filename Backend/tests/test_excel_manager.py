@@ -0,0 +1,38 @@
+import pytest
+from model.excel_manager import append_lab_results_to_excel, export_excel, initialize_excel
+from model.ner_extractor import extract_all
+from tests.test_ner_extractor import LFT_WITH_NOTE
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    """Results store and workbook in a fresh working directory"""
+    monkeypatch.chdir(tmp_path)
+    initialize_excel()
+    append_lab_results_to_excel(extract_all(LFT_WITH_NOTE))
+    return tmp_path
+
+
+def header_style(path):
+    from openpyxl import load_workbook
+
+    cell = load_workbook(path).active.cell(row=1, column=1)
+    assert cell.border.left.style is None
+    return cell.font.bold, cell.fill.fgColor.rgb
+
+
+def test_formatted_export_after_plain_export_is_rewritten(store):
+    plain_bold, plain_fill = header_style(export_excel(formatted=False))
+    assert not plain_bold
+    assert plain_fill == '00000000'
+
+    formatted_bold, formatted_fill = header_style(export_excel())
+    assert formatted_bold
+    assert formatted_fill != '00000000'
+
+
+def test_export_is_reused_when_nothing_changed(store):
+    path = export_excel()
+    modified = (store / path).stat().st_mtime_ns
+    assert export_excel() == path
+    assert (store / path).stat().st_mtime_ns == modified
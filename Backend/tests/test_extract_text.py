@@ -0,0 +1,62 @@
+import io
+import time
+import zipfile
+from benchmarks import synthetic
+from model import extract_text
+from model.extract_text import extract_from_docx, get_ocr_pool, iter_pdf_pages
+from model.metrics import metrics
+
+
+def docx_with_body(body):
+    document = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+        '<w:body>' + body + '</w:body></w:document>'
+    )
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        archive.writestr("[Content_Types].xml", synthetic._DOCX_CONTENT_TYPES)
+        archive.writestr("_rels/.rels", synthetic._DOCX_RELS)
+        archive.writestr("word/document.xml", document)
+    buffer.seek(0)
+    return buffer
+
+
+def test_docx_tab_stops_are_not_text():
+    source = docx_with_body(
+        '<w:p><w:pPr><w:tabs><w:tab w:val="left" w:pos="720"/><w:tab w:val="left" w:pos="1440"/>'
+        '</w:tabs></w:pPr><w:r><w:t>PATIENT NAME : RAVI KUMAR</w:t></w:r></w:p>'
+        '<w:p><w:r><w:t>Age</w:t><w:tab/><w:t>45</w:t></w:r></w:p>'
+    )
+    assert extract_from_docx(source) == "PATIENT NAME : RAVI KUMAR\nAge\t45"
+
+
+def blank_pdf(pages):
+    from PyPDF2 import PdfWriter
+
+    writer = PdfWriter()
+    for _ in range(pages):
+        writer.add_blank_page(width=200, height=200)
+    buffer = io.BytesIO()
+    writer.write(buffer)
+    buffer.seek(0)
+    return buffer
+
+
+def fake_ocr_pdf_page(file_path, page_number):
+    """Stands in for ocr_pdf_page in the spawned OCR workers"""
+    with metrics.timed("ocr_preprocess"):
+        time.sleep(0.01)
+    return f"page {page_number}"
+
+
+def stage_count(stage):
+    return sum(stat['count'] for stat in metrics.snapshot()['stages'] if stat['stage'] == stage)
+
+
+def test_ocr_pool_timings_are_recorded_in_parent(monkeypatch):
+    monkeypatch.setattr(extract_text, "ocr_pdf_page", fake_ocr_pdf_page)
+    assert get_ocr_pool()._mp_context.get_start_method() == "spawn"
+    before = stage_count("ocr_preprocess")
+    assert list(iter_pdf_pages(blank_pdf(3), workers=2)) == ["page 1", "page 2", "page 3"]
+    assert stage_count("ocr_preprocess") == before + 3
@@ -0,0 +1,19 @@
+from ingest import ingest, load_checkpoint
+from tests.test_ner_extractor import LFT_WITH_NOTE
+
+
+def test_rerun_retries_failed_files(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    reports = tmp_path / "reports"
+    reports.mkdir()
+    (reports / "good.txt").write_text(LFT_WITH_NOTE, encoding="utf-8")
+    # Too little text: fails with "Insufficient text extracted from document"
+    (reports / "bad.txt").write_text("blank scan", encoding="utf-8")
+    checkpoint = str(tmp_path / "checkpoint.txt")
+
+    first = ingest([str(reports)], workers=1, checkpoint_path=checkpoint)
+    assert (first.files, first.failed, first.skipped) == (2, 1, 0)
+    assert len(load_checkpoint(checkpoint)) == 1
+
+    rerun = ingest([str(reports)], workers=1, checkpoint_path=checkpoint)
+    assert (rerun.files, rerun.failed, rerun.skipped) == (1, 1, 1)
@@ -0,0 +1,59 @@
+import pytest
+from model.keyword_matcher import KeywordMatcher
+from model.ner_extractor import detect_report_type, extract_medications, section_header_lines
+
+
+def found(terms, text):
+    return [(text[match.start:match.end], match.term) for match in KeywordMatcher(terms).find_all(text)]
+
+
+def test_multi_word_terms_ignore_punctuation_and_spacing():
+    assert found(['vitamin k', 'liver disease'], "Vitamin-K given; LIVER   disease") == [
+        ('Vitamin-K', 'vitamin k'), ('LIVER   disease', 'liver disease')
+    ]
+
+
+def test_multi_word_terms_do_not_span_lines():
+    assert found(['liver disease'], "Fatty liver\ndisease") == []
+    assert found(['liver disease'], "Fatty liver \n disease") == []
+
+
+def test_terms_match_whole_words_only():
+    assert found(['pt', 'inr'], "Interpretation: sample type optional, inrange") == []
+    assert found(['pt', 'inr'], "PT 13.2 sec, INR 1.1") == [('PT', 'pt'), ('INR', 'inr')]
+
+
+def test_overlapping_terms_are_all_reported():
+    assert found(['liver function', 'liver function test', 'function'], "LIVER FUNCTION TEST") == [
+        ('LIVER FUNCTION', 'liver function'), ('FUNCTION', 'function'),
+        ('LIVER FUNCTION TEST', 'liver function test'),
+    ]
+
+
+def test_offsets_follow_text_when_lowercasing_changes_its_length():
+    # "İ" lowercases to two characters
+    text = "İ aspirin"
+    assert found(['aspirin'], text) == [('aspirin', 'aspirin')]
+
+
+def test_large_vocabulary_matches_like_small_one():
+    terms = [f"term{number}" for number in range(500)] + ['warfarin', 'heparin sodium']
+    assert found(terms, "warfarin, heparin  sodium and term42") == [
+        ('warfarin', 'warfarin'), ('heparin  sodium', 'heparin sodium'), ('term42', 'term42')
+    ]
+
+
+@pytest.mark.parametrize('line', ['LIVER FUNCTION TEST', 'LIVER FUNCTION TESTS', 'Biochemistry', 'LFT'])
+def test_section_header_lines(line):
+    text = f"PATIENT NAME : RAVI KUMAR\n{line}\nTOTAL BILIRUBIN 0.8 mg/dl 0.4-1.0"
+    assert section_header_lines(text, text.split('\n')) == {1}
+
+
+def test_report_type_needs_whole_word_pt_and_inr():
+    assert detect_report_type("Optional sample type; printed\nWBC 7.2") != detect_report_type("COAGULATION PROFILE")
+    assert detect_report_type("PT 13.2 sec\nINR 1.1") == detect_report_type("COAGULATION PROFILE")
+
+
+def test_medication_split_across_lines_is_not_found():
+    assert extract_medications("Vitamin\nK deficiency") == []
+    assert extract_medications("On vitamin K") == [{"medication_name": "Vitamin K", "type": "Medication/Chemical"}]
@@ -0,0 +1,75 @@
+from model.ner_extractor import extract_all, get_extract_pool, segment_regions
+
+LFT_WITH_NOTE = """UDHRAN HOSPITAL
+DEPARTMENT OF PATHOLOGY
+PATIENT NAME : RAVI KUMAR Age : 45 Years Male
+UHID : UH123456
+Referred By : Dr. Mohan Rao
+Collection Date : 12-Mar-2024 09:30 am
+BIOCHEMISTRY
+LIVER FUNCTION TEST
+TEST VALUE UNIT REF.RANGE
+TOTAL BILIRUBIN 0.8 mg/dl 0.4-1.0
+DIRECT BILIRUBIN 0.3 mg/dl 0.1-0.5
+Note: Sample slightly haemolysed
+SERUM SGOT 35 IU/L 5-40
+SERUM SGPT 62 H IU/L 5-55
+SERUM TOTAL PROTEIN 7.1 gm/dl 6.0-8.0
+SERUM ALBUMIN 4.2 gm/dl 3.5-5.5
+SERUM GLOBULIN 2.9 gm/dl 2.0-4.0
+ALKALINE PHOSPHATASE 120 IU/L 40-280
+"""
+
+CBC_CONTINUATION_PAGE = """UDHRAN HOSPITAL
+PATIENT NAME : ANITA NAIR Age : 32 Years Female
+UHID : UH654321
+HAEMATOLOGY
+DIFFERENTIAL COUNT
+Neutrophils. 60 20 - 45 %
+Lymphocytes 30 28 - 35 %
+UDHRAN HOSPITAL
+PATIENT NAME : ANITA NAIR Age : 32 Years Female
+Eosinophils 3 1.4 - 4.3 %
+Monocytes 6 2 - 10 %
+Basophils 1 0 - 1 %
+"""
+
+
+def test_note_inside_results_table_keeps_later_rows():
+    names = [test['test_name'] for test in extract_all(LFT_WITH_NOTE)['lab_tests']]
+    assert names[:8] == [
+        'TOTAL BILIRUBIN', 'DIRECT BILIRUBIN', 'SERUM SGOT', 'SERUM SGPT',
+        'SERUM TOTAL PROTEIN', 'SERUM ALBUMIN', 'SERUM GLOBULIN', 'ALKALINE PHOSPHATASE',
+    ]
+    assert {'SGOT(AST)', 'SGPT(ALT)'} <= set(names)
+
+
+def test_note_inside_results_table_is_its_own_remark():
+    regions = segment_regions(LFT_WITH_NOTE)
+    assert [span.strip() for span in regions['remarks']] == ["Note: Sample slightly haemolysed"]
+    assert any("SERUM ALBUMIN 4.2" in span for span in regions['results'])
+
+
+def test_rows_after_repeated_header_on_continuation_page():
+    names = [test['test_name'] for test in extract_all(CBC_CONTINUATION_PAGE)['lab_tests']]
+    assert names == ['Neutrophils', 'Lymphocytes', 'Eosinophils', 'Monocytes', 'Basophils']
+    assert any("Basophils" in span for span in segment_regions(CBC_CONTINUATION_PAGE)['results'])
+
+
+def test_header_patterns_do_not_join_separate_lines():
+    text = (
+        "PATIENT NAME : RAVI KUMAR DEPARTMENT\n"
+        "TOTAL BILIRUBIN 0.8 mg/dl 0.4-1.0\n"
+        "OF PATHOLOGY\n"
+    )
+    assert len(segment_regions(text)['header']) == 2
+    result = extract_all(text)
+    assert 'facility' not in result['patient_information']
+    assert result['order_information']['facility'] is None
+    assert result['patient_information']['patient_name'] == 'RAVI KUMAR DEPARTMENT'
+
+
+def test_extract_pool_follows_worker_count():
+    assert get_extract_pool(2) is get_extract_pool(2)
+    assert get_extract_pool(3) is not get_extract_pool(2)
+    assert get_extract_pool(3)._max_workers == 3
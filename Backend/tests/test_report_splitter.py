@@ -0,0 +1,106 @@
+from model.report_splitter import ReportSplitter, extract_reports, split_reports
+
+
+def header(name, uhid):
+    return (
+        "UDHRAN HOSPITAL\n"
+        "DEPARTMENT OF PATHOLOGY\n"
+        f"PATIENT NAME : {name} Age : 45 Years Male\n"
+        f"UHID : {uhid}\n"
+        "Collection Date : 12-Mar-2024 09:30 am\n"
+    )
+
+
+LFT_ROWS = (
+    "BIOCHEMISTRY\n"
+    "TOTAL BILIRUBIN 0.8 mg/dl 0.4-1.0\n"
+    "DIRECT BILIRUBIN 0.3 mg/dl 0.1-0.5\n"
+)
+LFT_MORE_ROWS = (
+    "SERUM SGOT 35 IU/L 5-40\n"
+    "SERUM SGPT 62 H IU/L 5-55\n"
+)
+CBC_ROWS = (
+    "DIFFERENTIAL COUNT\n"
+    "Neutrophils. 60 20 - 45 %\n"
+    "Lymphocytes 30 28 - 35 %\n"
+)
+CBC_MORE_ROWS = (
+    "Eosinophils 3 1.4 - 4.3 %\n"
+    "Monocytes 6 2 - 10 %\n"
+)
+
+
+def two_patient_pages():
+    return [
+        header("RAVI KUMAR", "UH123456") + LFT_ROWS,
+        # Continuation page without a header
+        LFT_MORE_ROWS,
+        # The report date closes the first report's last page; the next
+        # patient's report starts at the banner
+        "Report Date : 12-Mar-2024 04:30 pm\n" + header("ANITA NAIR", "UH654321") + CBC_ROWS,
+        # Continuation page repeating the header
+        header("ANITA NAIR", "UH654321") + CBC_MORE_ROWS,
+    ]
+
+
+def test_two_patients_over_several_pages():
+    reports = list(split_reports(two_patient_pages()))
+    assert [(report.first_page, report.last_page) for report in reports] == [(1, 3), (3, 4)]
+
+    first, second = reports
+    assert "RAVI KUMAR" in first.text and "ANITA NAIR" not in first.text
+    assert "SERUM SGPT" in first.text
+    assert first.text.rstrip().endswith("Report Date : 12-Mar-2024 04:30 pm")
+    assert second.text.startswith("UDHRAN HOSPITAL\n")
+    assert "RAVI KUMAR" not in second.text
+    assert "Monocytes" in second.text
+
+
+def test_reports_are_handed_out_as_soon_as_the_next_patient_starts():
+    splitter = ReportSplitter()
+    pages = two_patient_pages()
+    assert splitter.feed(pages[0], 1) == []
+    assert splitter.feed(pages[1], 2) == []
+    completed = splitter.feed(pages[2], 3)
+    assert [(report.first_page, report.last_page) for report in completed] == [(1, 3)]
+    assert splitter.feed(pages[3], 4) == []
+    assert splitter.finish().first_page == 3
+    assert splitter.finish() is None
+
+
+def test_repeated_header_continuation_page_stays_with_its_report():
+    pages = [
+        header("ANITA NAIR", "UH654321") + CBC_ROWS,
+        header("ANITA NAIR", "UH654321") + CBC_MORE_ROWS,
+        # Banner alone, with nothing to identify a patient
+        "UDHRAN HOSPITAL\nBasophils 1 0 - 1 %\n",
+    ]
+    reports = list(split_reports(pages))
+    assert len(reports) == 1
+    assert (reports[0].first_page, reports[0].last_page) == (1, 3)
+    assert "Basophils" in reports[0].text
+
+
+def test_uhid_decides_over_name_spelling():
+    pages = [
+        header("ANITA NAIR", "UH654321") + CBC_ROWS,
+        header("ANITHA NAIR", "UH654321") + CBC_MORE_ROWS,
+        header("ANITA NAIR", "UH999999") + CBC_ROWS,
+    ]
+    assert [(report.first_page, report.last_page) for report in split_reports(pages)] == [(1, 2), (3, 3)]
+
+
+def test_other_patient_header_before_any_results_does_not_split():
+    pages = [header("RAVI KUMAR", "UH123456"), header("ANITA NAIR", "UH654321") + CBC_ROWS]
+    assert len(list(split_reports(pages))) == 1
+
+
+def test_extract_reports_numbers_reports_and_pages():
+    results = [result for _, result in extract_reports(two_patient_pages())]
+    assert [result["patient_information"]["uhid"] for result in results] == ["UH123456", "UH654321"]
+    assert [result["report_metadata"]["report_index"] for result in results] == [0, 1]
+    assert [result["report_metadata"]["pages"] for result in results] == [[1, 3], [3, 4]]
+    assert [test["test_name"] for test in results[1]["lab_tests"]] == [
+        "Neutrophils", "Lymphocytes", "Eosinophils", "Monocytes"
+    ]
@@ -0,0 +1,127 @@
+from datetime import datetime
+import pytest
+from benchmarks import synthetic
+from model.excel_manager import append_lab_results_batch
+from model.ner_extractor import extract_all
+from model.results_store import (
+    append_rows, get_column_widths, get_stats, initialize_store, iso_date, query_results, rebuild_stats,
+    reflag_results, write_transaction
+)
+
+# Few distinct dates so pages break inside runs of equal sort keys; None and
+# 'N/A' have no parseable date and sort first
+DATES = ['05-Mar-2024 09:30 am', None, '01-Jan-2024', 'N/A', '05-Mar-2024 09:30 am', '20-Feb-2024']
+
+
+def seeded_rows(count=40):
+    return [{
+        'Patient_Name': 'RAVI KUMAR' if number % 2 else 'ANITA NAIR',
+        'UHID': f'UH{number % 3}',
+        'Test_Name': 'TOTAL BILIRUBIN' if number % 4 else 'SERUM ALBUMIN',
+        'Test_Value': str(number),
+        'Collection_Date': DATES[number % len(DATES)],
+    } for number in range(count)]
+
+
+@pytest.fixture
+def rows(tmp_path, monkeypatch):
+    """Seeded store; returns the rows with their ids (1-based insertion order)"""
+    monkeypatch.chdir(tmp_path)
+    initialize_store()
+    rows = seeded_rows()
+    append_rows(rows)
+    return [dict(row, Row_Id=number) for number, row in enumerate(rows, start=1)]
+
+
+def expected_ids(rows, **filters):
+    date_from, date_to = filters.pop('date_from', None), filters.pop('date_to', None)
+    matching = []
+    for row in rows:
+        date = iso_date(row['Collection_Date'])
+        if any(row[column] != value for column, value in filters.items()):
+            continue
+        if (date_from or date_to) and date is None:
+            continue
+        if (date_from and date < date_from.isoformat(sep=' ')) or (date_to and date > date_to.isoformat(sep=' ')):
+            continue
+        matching.append((date is not None, date or '', row['Row_Id']))
+    return [row_id for *_, row_id in sorted(matching)]
+
+
+def paged_ids(limit, **filters):
+    keys = {'UHID': 'uhid', 'Test_Name': 'test_name', 'Patient_Name': 'patient_name'}
+    filters = {keys.get(key, key): value for key, value in filters.items()}
+    ids, cursor = [], None
+    while True:
+        page = query_results(limit=limit, cursor=cursor, **filters)
+        assert len(page['results']) <= limit
+        ids.extend(row['Row_Id'] for row in page['results'])
+        cursor = page['next_cursor']
+        if cursor is None:
+            return ids
+
+
+@pytest.mark.parametrize('limit', [1, 3, 7, 40, 100])
+def test_pages_have_no_duplicates_or_gaps(rows, limit):
+    ids = paged_ids(limit)
+    assert ids == expected_ids(rows)
+    # Rows without a collection date come first
+    undated = {row['Row_Id'] for row in rows if iso_date(row['Collection_Date']) is None}
+    assert undated and set(ids[:len(undated)]) == undated
+
+
+@pytest.mark.parametrize('filters', [
+    {'UHID': 'UH1'},
+    {'UHID': 'UH2', 'Test_Name': 'TOTAL BILIRUBIN'},
+    {'Patient_Name': 'ANITA NAIR'},
+    {'date_from': datetime(2024, 2, 1)},
+    {'UHID': 'UH2', 'date_from': datetime(2024, 1, 15), 'date_to': datetime(2024, 2, 29)},
+])
+@pytest.mark.parametrize('limit', [1, 4])
+def test_filters_combined_with_cursor(rows, filters, limit):
+    ids = paged_ids(limit, **filters)
+    assert ids
+    assert ids == expected_ids(rows, **filters)
+
+
+def test_last_page_has_no_cursor(rows):
+    page = query_results(limit=len(rows))
+    assert len(page['results']) == len(rows)
+    assert page['next_cursor'] is None
+
+
+@pytest.mark.parametrize('cursor', ['12', 'abc|x', '2024-01-01 00:00:00|'])
+def test_malformed_cursor_is_rejected(rows, cursor):
+    with pytest.raises(ValueError):
+        query_results(cursor=cursor)
+
+
+def running_and_rebuilt():
+    running = get_stats(), get_column_widths()
+    return running, (rebuild_stats(), get_column_widths())
+
+
+def test_running_stats_match_rebuild_after_appends_and_reflag(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    initialize_store()
+    # Overlapping batches: the same patients come back in later appends
+    appended = 0
+    for start in (0, 5, 10):
+        appended += sum(append_lab_results_batch([extract_all(synthetic.lft_report(seed))
+                                                  for seed in range(start, start + 10)]))
+    # A status from an imported workbook that re-flagging will replace
+    append_rows([{'Patient_Name': 'RAVI KUMAR', 'UHID': 'UH1', 'Test_Name': 'TOTAL BILIRUBIN',
+                  'Test_Value': '0.8', 'Unit': 'mg/dl', 'Reference_Range': 'See note',
+                  'Status': 'Borderline High (repeat)'}])
+
+    running, rebuilt = running_and_rebuilt()
+    assert running == rebuilt
+    assert running[0]['total_records'] == appended + 1
+    assert running[0]['unique_uhids'] == 21  # seeds 0-19 and UH1
+
+    with write_transaction() as conn:
+        conn.execute('UPDATE lab_results SET "Reference_Range" = \'0.4-1.0\' WHERE "UHID" = \'UH1\'')
+    assert reflag_results()['status_changes'] == 1
+    running, rebuilt = running_and_rebuilt()
+    assert running == rebuilt
+    assert running[1]['Status'] == len('Status')
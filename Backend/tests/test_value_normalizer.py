@@ -0,0 +1,80 @@
+import math
+from contextlib import closing
+import pytest
+from model.excel_manager import append_lab_results_to_excel, flag_lab_tests, initialize_excel
+from model.results_store import get_connection, reflag_results, write_transaction
+from model.value_normalizer import normalize_results
+
+
+def normalize_one(test_name, value, unit, reference_range, status):
+    result = normalize_results([test_name], [value], [unit], [reference_range], [status])
+    return {key: array[0] for key, array in result.items()}
+
+
+def test_lakhs_per_cumm_converts_to_thousands_per_microlitre():
+    result = normalize_one('Platelet Count', '2.5', 'Lakhs/Cumm', '1.5 - 4.5', 'Normal')
+    assert result['unit'] == '10^3/µL'
+    assert (result['value'], result['range_low'], result['range_high']) == (250, 150, 450)
+
+
+def test_grams_per_litre_converts_to_grams_per_decilitre():
+    result = normalize_one('MCHC', '330', 'g/L', '320 - 360', 'Normal')
+    assert result['unit'] == 'g/dL'
+    assert (result['value'], result['range_low'], result['range_high']) == (33, 32, 36)
+
+
+def test_unknown_unit_is_left_unconverted():
+    result = normalize_one('Widal', '80', 'titre', '< 80', 'N/A')
+    assert result['unit'] is None
+    assert result['value'] == 80
+    assert math.isnan(result['range_low'])
+
+
+@pytest.mark.parametrize('value, marker, expected', [
+    ('1.0', 'High', 'Normal'),
+    ('1.0', 'Low', 'Normal'),
+    ('2.4', 'Normal', 'High'),
+    ('0.1', 'N/A', 'Low'),
+])
+def test_range_status_overrides_marker(value, marker, expected):
+    assert normalize_one('Total Bilirubin', value, 'mg/dL', '0.2 - 1.2', marker)['status'] == expected
+
+
+@pytest.mark.parametrize('value, reference_range', [('Positive', '0.2 - 1.2'), ('1.0', 'See note')])
+def test_marker_kept_without_value_or_range(value, reference_range):
+    assert normalize_one('Total Bilirubin', value, 'mg/dL', reference_range, 'High')['status'] == 'High'
+
+
+def report(value, status):
+    return {
+        'patient_information': {'patient_name': 'RAVI KUMAR', 'uhid': 'MH001'},
+        'order_information': {'collection_date': '01/03/2024'},
+        'lab_tests': [{'test_name': 'Total Bilirubin', 'value': value, 'unit': 'mg/dL',
+                       'reference_range': '0.2 - 1.2', 'status': status}]
+    }
+
+
+def test_flag_lab_tests_matches_store_and_is_repeatable():
+    flagged = flag_lab_tests(report('1.0', 'High'))
+    test = flagged['lab_tests'][0]
+    assert (test['status'], test['marker_status']) == ('Normal', 'High')
+    flag_lab_tests(flagged)
+    assert (test['status'], test['marker_status']) == ('Normal', 'High')
+
+
+def test_reflag_starts_from_marker_status(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    initialize_excel()
+    append_lab_results_to_excel(flag_lab_tests(report('1.0', 'High')))
+
+    def stored():
+        with closing(get_connection()) as conn:
+            return conn.execute('SELECT "Status", Marker_Status FROM lab_results').fetchone()
+
+    assert stored() == ('Normal', 'High')
+    # A range the flagging can no longer use falls back to the marker
+    with write_transaction() as conn:
+        conn.execute('UPDATE lab_results SET "Reference_Range" = \'See note\'')
+    assert reflag_results() == {'rows_checked': 1, 'status_changes': 1}
+    assert stored() == ('High', 'High')
+    assert reflag_results() == {'rows_checked': 1, 'status_changes': 0}